@@ -105,6 +105,7 @@ Requires:			python3-dataclasses
 Recommends:			python3-pillow
 Recommends:			python3-cryptography
 Recommends:			python3-rencode
+Recommends:			python3-zstandard
 Recommends:			python3-inotify
 Recommends:			python3-netifaces
 Recommends:			python3-dbus
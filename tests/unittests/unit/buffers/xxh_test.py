@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+try:
+    from xpra.buffers.xxh import hash_buffer, hash_rows, hash_tiles       #@UnresolvedImport
+except ImportError:
+    hash_buffer = hash_rows = hash_tiles = None
+
+
+class TestXXH(unittest.TestCase):
+
+    def test_hash_buffer(self):
+        a = hash_buffer(b"hello")
+        assert a==hash_buffer(memoryview(b"hello"))
+        assert a!=hash_buffer(b"hellO")
+        assert isinstance(hash_buffer(b""), int)
+        assert hash_buffer(bytearray(1024*1024))==hash_buffer(b"\0"*1024*1024)
+
+    def test_hash_rows(self):
+        width, height, bpp = 10, 5, 4
+        rowstride = width*bpp+8
+        pixels = bytearray(rowstride*height)
+        for y in range(height):
+            for x in range(width*bpp):
+                pixels[y*rowstride+x] = (x*y) & 0xff
+            #the padding must be ignored:
+            pixels[y*rowstride+width*bpp] = y
+        rows = hash_rows(pixels, width, height, rowstride, bpp)
+        assert len(rows)==height
+        for y, h in enumerate(rows):
+            row = bytes(pixels[y*rowstride:y*rowstride+width*bpp])
+            assert h==hash_buffer(row)
+        #first row is all zeroes, just like this one:
+        assert rows[0]==hash_buffer(bytes(width*bpp))
+        assert hash_rows(pixels, width, 0, rowstride, bpp)==[]
+        with self.assertRaises(AssertionError):
+            hash_rows(pixels, width, height+1, rowstride, bpp)
+        with self.assertRaises(AssertionError):
+            hash_rows(pixels, width, height, width, bpp)
+
+    def test_hash_tiles(self):
+        width, height = 100, 50
+        pixels = bytes(i & 0xff for i in range(width*height*4))
+        tiles = hash_tiles(pixels, width, height, width*4, 4, 64)
+        assert len(tiles)==2
+        #the second tile is different because its rows are narrower:
+        assert tiles[0]!=tiles[1]
+
+
+def main():
+    if hash_rows:
+        unittest.main()
+    else:
+        print("no xxh module found, test skipped")
+
+if __name__ == '__main__':
+    main()
@@ -39,6 +39,65 @@ class WindowManagerTest(ClientMixinTest):
 			opts.tray_icon = "yes"
 			self._test_mixin_class(_WindowClient, opts)
 
+	def test_superseded(self):
+		from xpra.client.mixins.window_manager import get_superseded
+		def draw(wid, x, y, w, h, coding="png", seq=0, options=None):
+			return ["draw", wid, x, y, w, h, coding, b"", seq, 0, options or {}]
+		assert not get_superseded([draw(1, 0, 0, 10, 10)])
+		#fully covered by a later update:
+		assert get_superseded([draw(1, 0, 0, 10, 10), draw(1, 0, 0, 20, 20)])=={0}
+		assert get_superseded([draw(1, 5, 5, 10, 10), draw(1, 0, 0, 10, 10), draw(1, 0, 0, 20, 20)])=={0, 1}
+		#partially covered, or for a different window:
+		assert not get_superseded([draw(1, 5, 5, 10, 10), draw(1, 0, 0, 10, 10)])
+		assert not get_superseded([draw(1, 0, 0, 10, 10), draw(2, 0, 0, 20, 20)])
+		#the later update has an alpha channel:
+		assert not get_superseded([draw(1, 0, 0, 10, 10), draw(1, 0, 0, 20, 20, options={"has_alpha" : True})])
+		#video and scroll packets use the previous screen contents:
+		assert not get_superseded([draw(1, 0, 0, 10, 10), draw(1, 0, 0, 20, 20, "h264")])
+		assert not get_superseded([draw(1, 0, 0, 10, 10), draw(1, 0, 0, 20, 20, "scroll"), draw(1, 0, 0, 20, 20)])
+		#only picture updates are skipped:
+		assert not get_superseded([draw(1, 0, 0, 10, 10, "h264"), draw(1, 0, 0, 20, 20)])
+		#and the video frames that no other frame references, when a newer frame of the same stream follows:
+		def frame(n, frame_type="P", wid=1, coding="h264", w=20):
+			return draw(wid, 0, 0, w, 20, coding, options={"frame" : n, "type" : frame_type})
+		assert get_superseded([frame(1, "B"), frame(2)])=={0}
+		assert get_superseded([frame(1, "B"), draw(1, 0, 0, 5, 5), frame(2, "B"), frame(3)])=={0, 2}
+		assert not get_superseded([frame(1), frame(2)])
+		assert not get_superseded([frame(1, "BREF"), frame(2)])
+		assert not get_superseded([frame(2), frame(3, "B")])
+		#a different window, encoding or area, or a new stream:
+		assert not get_superseded([frame(1, "B"), frame(2, wid=2)])
+		assert not get_superseded([frame(1, "B"), frame(2, coding="vp8")])
+		assert not get_superseded([frame(1, "B"), frame(2, w=10)])
+		assert not get_superseded([frame(1, "B"), frame(0, "IDR")])
+		assert not get_superseded([frame(1, "B"), draw(1, 0, 0, 20, 20, "scroll"), frame(2)])
+
+	def test_cursor_cache(self):
+		from io import BytesIO
+		from PIL import Image
+		from xpra.client.mixins.window_manager import WindowClient
+		from xpra.net.image_cache import image_key
+		buf = BytesIO()
+		Image.new("RGBA", (4, 4), (255, 0, 0, 255)).save(buf, "png")
+		png = buf.getvalue()
+		wc = WindowClient()
+		cursors = []
+		def set_windows_cursor(_windows, cursor):
+			cursors.append(cursor)
+		wc.set_windows_cursor = set_windows_cursor
+		def cursor_packet(encoding, data):
+			return ["cursor", encoding, 0, 0, 4, 4, 0, 0, 1, data, "test"]
+		#sent while cursors are disabled, so it is not shown:
+		wc.cursors_enabled = False
+		wc._process_cursor(cursor_packet("png", png))
+		assert not cursors
+		#but the server can still reference it once they are enabled again:
+		wc.cursors_enabled = True
+		wc._process_cursor(cursor_packet("cache", image_key(png)))
+		assert len(cursors)==1 and cursors[0][0]=="raw"
+		assert cursors[0][8]==Image.open(BytesIO(png)).tobytes("raw", "BGRA")
+
+
 def main():
 	unittest.main()
 
@@ -57,7 +57,7 @@ class TestCompression(unittest.TestCase):
         r = compression.compressed_wrapper("test", b"a"*(compression.MIN_COMPRESS_SIZE+1))
         if not r.datatype.startswith("raw"):
             raise Exception(f"should not be able to use the wrapper without enabling a compressor, but got {r!r}")
-        for x in ("lz4", "brotli", "zlib", "none"):
+        for x in ("lz4", "brotli", "zlib", "zstd", "none"):
             if not compression.use(x):
                 continue
             kwargs = {x : True}
@@ -110,6 +110,31 @@ class TestCompression(unittest.TestCase):
                 d2 = block.decompress(c2)
                 assert d1==d2==t
 
+    def test_zstd_dictionary(self):
+        compression.init_compressors("zstd")
+        if not compression.use("zstd"):
+            print("zstd test skipped: not available")
+            return
+        from xpra.util import typedict
+        caps = compression.get_compression_caps()
+        assert "zstd" in caps
+        dict_id = caps["zstd"].get("dictionary")
+        plain = compression.get_compressor("zstd")
+        remote_caps = typedict({"zstd" : {"" : True, "dictionary" : dict_id}})
+        zdict = compression.get_compressor("zstd", remote_caps)
+        if dict_id:
+            assert zdict!=plain
+        #a different dictionary on the other end means no dictionary:
+        other_caps = typedict({"zstd" : {"" : True, "dictionary" : "foo"}})
+        assert compression.get_compressor("zstd", other_caps)==plain
+        packet = b"l15:window-metadatai1d5:title5:xtermee"
+        for compress in (plain, zdict):
+            level, cdata = compress(packet, 1)
+            assert compression.get_compression_type(level)=="zstd"
+            assert compression.decompress(cdata, level)==packet
+        if dict_id:
+            assert len(zdict(packet, 1)[1])<len(plain(packet, 1)[1])
+
 
 def main():
     unittest.main()
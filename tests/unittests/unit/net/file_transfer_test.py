@@ -5,13 +5,42 @@
 # later version. See the file COPYING for details.
 
 import os
+import hashlib
+import tempfile
 import unittest
 
 from xpra.util import typedict
 from xpra.net.file_transfer import (
     basename, safe_open_download_file,
-    FileTransferAttributes, FileTransferHandler,
+    FileTransferAttributes, FileTransferHandler, FileChunkReader,
     )
+from xpra.net import file_transfer
+
+
+class LoopbackFileTransferHandler(FileTransferHandler):
+
+    def __init__(self, packets):
+        self.packets = packets
+        self.downloaded = []
+        super().__init__()
+        self.file_transfer = self.remote_file_transfer = True
+        self.file_size_limit = self.remote_file_size_limit = 1024*1024*1024
+        self.file_chunks = self.remote_file_chunks = 1024
+
+    def timeout_add(self, *_args):
+        return 1
+
+    def source_remove(self, *_args):
+        pass
+
+    def send(self, *parts):
+        self.packets.append((self, parts))
+
+    def compressed_wrapper(self, datatype, data, level=5):
+        return data
+
+    def process_downloaded_file(self, filename, mimetype, printit, openit, filesize, options):
+        self.downloaded.append((filename, filesize))
 
 
 class TestVersionUtilModule(unittest.TestCase):
@@ -53,6 +82,54 @@ class TestVersionUtilModule(unittest.TestCase):
         assert fth.get_info()
         fth.cleanup()
 
+    def test_chunk_reader(self):
+        data = os.urandom(100*1000)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            readers = [FileChunkReader(f.name, data), FileChunkReader(f.name)]
+            saved = file_transfer.FILE_CHUNKS_MMAP
+            file_transfer.FILE_CHUNKS_MMAP = False
+            try:
+                readers.append(FileChunkReader(f.name))
+            finally:
+                file_transfer.FILE_CHUNKS_MMAP = saved
+            for reader in readers:
+                assert reader.size==len(data)
+                assert bytes(reader.read(0, 10))==data[:10]
+                assert bytes(reader.read(99990, 100))==data[99990:]
+                assert reader.digest("sha256").hexdigest()==hashlib.sha256(data).hexdigest()
+                reader.close()
+                assert repr(reader)
+
+    def test_windowed_transfer(self):
+        data = os.urandom(64*1024+17)
+        packets = []
+        sender = LoopbackFileTransferHandler(packets)
+        receiver = LoopbackFileTransferHandler(packets)
+        peer = {sender : receiver, receiver : sender}
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            assert sender.send_file(f.name, "", None)
+            max_in_flight = 0
+            while packets:
+                source, packet = packets.pop(0)
+                for state in sender.send_chunks_in_progress.values():
+                    max_in_flight = max(max_in_flight, state.chunk-state.acked)
+                handler = getattr(peer[source], "_process_"+packet[0].replace("-", "_"))
+                handler(packet)
+        assert not sender.send_chunks_in_progress
+        assert 1<max_in_flight<=file_transfer.FILE_CHUNKS_WINDOW
+        assert len(receiver.downloaded)==1
+        filename, filesize = receiver.downloaded[0]
+        try:
+            assert filesize==len(data)
+            with open(filename, "rb") as f:
+                assert f.read()==data
+        finally:
+            os.unlink(filename)
+
 
 def main():
     unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import unittest
+
+from xpra.net.protocol.header import pack_header, FLAGS_CIPHER
+from xpra.net.protocol.framed_reader import FramedReader, BufferPool, LARGE_FRAME_SIZE
+
+
+def make_readinto(data, max_read=10000):
+    """ returns a readinto function which reads from data, at most max_read bytes at a time """
+    state = {"pos" : 0}
+    def readinto(buf):
+        pos = state["pos"]
+        n = min(len(buf), max_read, len(data)-pos)
+        buf[:n] = data[pos:pos+n]
+        state["pos"] = pos+n
+        return n
+    return readinto
+
+def packet(size, flags=0, index=0):
+    return pack_header(flags, 0, index, size) + os.urandom(size)
+
+def read_all(reader):
+    buffers = []
+    while True:
+        v = reader.read()
+        if v is None:
+            return buffers
+        buffers += v
+
+
+class TestFramedReader(unittest.TestCase):
+
+    def test_small_packets(self):
+        data = b"".join(packet(size) for size in (10, 100, 1000, 5000, 20))
+        for max_read in (1, 7, 8, 9, 100, 65536):
+            reader = FramedReader(make_readinto(data, max_read), 4096, lambda : 2**24)
+            assert b"".join(bytes(x) for x in read_all(reader))==data
+            assert reader.enabled and reader.large_frames==0
+
+    def test_large_packets(self):
+        sizes = (100, LARGE_FRAME_SIZE*4, 10, LARGE_FRAME_SIZE*2+1, 1)
+        data = b"".join(packet(size, index=1) for size in sizes)
+        for max_read in (3, 8, 1000, 65536):
+            reader = FramedReader(make_readinto(data, max_read), 8192, lambda : 2**24)
+            buffers = read_all(reader)
+            assert b"".join(bytes(x) for x in buffers)==data
+            assert reader.large_frames==2
+            #the large payloads are returned in a single buffer each:
+            large = [x for x in buffers if isinstance(x, memoryview)]
+            assert [len(x) for x in large]==[LARGE_FRAME_SIZE*4, LARGE_FRAME_SIZE*2+1]
+
+    def test_max_frame_size(self):
+        data = packet(LARGE_FRAME_SIZE*2)
+        reader = FramedReader(make_readinto(data), 8192, lambda : LARGE_FRAME_SIZE)
+        assert b"".join(bytes(x) for x in read_all(reader))==data
+        assert reader.large_frames==0
+
+    def test_disabled(self):
+        data = packet(100) + packet(LARGE_FRAME_SIZE*2, FLAGS_CIPHER) + packet(LARGE_FRAME_SIZE*2)
+        reader = FramedReader(make_readinto(data), 8192, lambda : 2**24)
+        assert b"".join(bytes(x) for x in read_all(reader))==data
+        assert not reader.enabled and reader.large_frames==0
+
+    def test_truncated(self):
+        data = packet(LARGE_FRAME_SIZE*2)[:-10]
+        reader = FramedReader(make_readinto(data), 8192, lambda : 2**24)
+        assert b"".join(bytes(x) for x in read_all(reader))==data
+
+    def test_buffer_pool(self):
+        pool = BufferPool(2)
+        a = pool.get(1000)
+        assert len(a)==1000
+        a_id = id(a.obj)
+        del a
+        #free, so it is re-used:
+        b = pool.get(800)
+        assert id(b.obj)==a_id and len(b)==800
+        #still in use, so we get a new one:
+        c = pool.get(800)
+        assert c.obj is not b.obj
+        #the pool is full and all the buffers are in use:
+        d = pool.get(900)
+        assert all(d.obj is not buf for buf in pool.buffers)
+        old_ids = set(id(buf) for buf in pool.buffers)
+        del b, c, d
+        #too small to be re-used for this size, so it replaces a free buffer:
+        e = pool.get(10000)
+        assert len(e)==10000 and len(pool.buffers)==2
+        assert any(e.obj is buf for buf in pool.buffers)
+        assert len(old_ids.intersection(id(buf) for buf in pool.buffers))==1
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import gzip
+import unittest
+import tempfile
+
+from xpra.net.http import http_handler
+
+
+class TestLoadPath(unittest.TestCase):
+
+    def setUp(self):
+        http_handler.content_cache.clear()
+
+    def test_cache_and_etag(self):
+        with tempfile.NamedTemporaryFile(suffix=".js", delete=False) as f:
+            f.write(b"var foo = 'bar';\n"*100)
+        try:
+            headers = {"accept-encoding" : "gzip, deflate"}
+            code, h, content = http_handler.load_path(headers, f.name)
+            assert code==200
+            assert h.get("Content-Encoding")=="gzip"
+            assert gzip.decompress(content)==b"var foo = 'bar';\n"*100
+            etag = h["ETag"]
+            hits = http_handler.content_cache.hits
+            code, h2, content2 = http_handler.load_path(headers, f.name)
+            assert code==200 and content2==content and h2["ETag"]==etag
+            assert http_handler.content_cache.hits==hits+1
+            #the uncompressed version must use a different etag:
+            code, h3, content3 = http_handler.load_path({}, f.name)
+            assert code==200 and content3==b"var foo = 'bar';\n"*100
+            assert "Content-Encoding" not in h3
+            assert h3["ETag"]!=etag
+            #conditional request:
+            code, h, content = http_handler.load_path(dict(headers, **{"if-none-match" : etag}), f.name)
+            assert code==304 and not content
+            code, h, content = http_handler.load_path({"if-none-match" : etag}, f.name)
+            assert code==200
+            #modifying the file changes the etag:
+            with open(f.name, "ab") as fa:
+                fa.write(b"//more\n")
+            code, h, content = http_handler.load_path(dict(headers, **{"if-none-match" : etag}), f.name)
+            assert code==200 and h["ETag"]!=etag
+        finally:
+            os.unlink(f.name)
+
+    def test_sendfile(self):
+        size = http_handler.HTTP_SENDFILE_SIZE
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
+            f.write(os.urandom(size))
+        try:
+            code, h, content = http_handler.load_path({"accept-encoding" : "gzip"}, f.name, sendfile=True)
+            assert code==200
+            assert int(h["Content-Length"])==size
+            with content:
+                assert content.read()==open(f.name, "rb").read()
+            code, h, content = http_handler.load_path({}, f.name)
+            assert isinstance(content, bytes) and len(content)==size
+        finally:
+            os.unlink(f.name)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.net.image_cache import ImageCache, image_key
+
+
+class TestImageCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = ImageCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a")==1
+        #"b" is now the least recently used:
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a")==1 and cache.get("c")==3
+        info = cache.get_info()
+        assert info["entries"]==2 and info["hits"]==3 and info["misses"]==1
+        cache.clear()
+        assert cache.get("a") is None
+
+    def test_mirror(self):
+        #the server only keeps the references, the client keeps the data,
+        #both must evict the same entries:
+        server = ImageCache(3)
+        client = ImageCache(3)
+        images = [bytes([i])*10 for i in range(5)]
+        for i in (0, 1, 2, 0, 3, 4, 1, 0, 2, 2, 4):
+            data = images[i]
+            ref = image_key(data)
+            if server.get(ref):
+                #send the reference:
+                assert client.get(ref)==data
+            else:
+                server.set(ref, True)
+                #send the data:
+                client.set(image_key(data), data)
+            assert list(server.entries.keys())==list(client.entries.keys())
+
+    def test_image_key(self):
+        assert image_key(b"foo")==image_key(memoryview(b"foo"))
+        assert image_key(b"foo")!=image_key(b"bar")
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
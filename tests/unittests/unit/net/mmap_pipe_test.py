@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import mmap
+import unittest
+
+from xpra.net.mmap_pipe import mmap_allocate, mmap_write, mmap_read, restride_into
+
+
+class TestMmapPipe(unittest.TestCase):
+
+    def test_allocate(self):
+        size = 1024
+        area = mmap.mmap(-1, size)
+        offset, buf, free = mmap_allocate(area, size, 500)
+        assert offset==8 and buf.nbytes==500 and free==size-8-500
+        buf[:] = b"a"*500
+        buf.release()
+        assert bytes(mmap_read(area, (offset, 500)))==b"a"*500
+        offset, buf, free = mmap_allocate(area, size, 450)
+        assert offset==508, offset
+        buf.release()
+        mmap_read(area, (offset, 450))
+        #not enough room at the end, so we start again from the beginning:
+        offset, buf, free = mmap_allocate(area, size, 100)
+        assert offset==8, offset
+        buf.release()
+        #the client has not caught up with us:
+        offset, buf, free = mmap_allocate(area, size, 900)
+        assert offset is None and buf is None and free<0
+        chunks = mmap_write(area, size, b"b"*600)[0]
+        assert chunks==[(108, 600)], chunks
+        assert bytes(mmap_read(area, *chunks))==b"b"*600
+
+    def test_restride(self):
+        rowstride, newstride, height = 16, 12, 3
+        pixels = b"".join(bytes([y])*12+b"\xff"*4 for y in range(height))
+        buf = bytearray(newstride*height)
+        restride_into(memoryview(buf), pixels, rowstride, newstride, height)
+        assert bytes(buf)==b"".join(bytes([y])*12 for y in range(height))
+        buf = bytearray(rowstride*height)
+        restride_into(memoryview(buf), pixels, rowstride, rowstride, height)
+        assert bytes(buf)==pixels
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -32,6 +32,22 @@ class TestPacketEncoding(unittest.TestCase):
                 except Exception:
                     print("error calling decode(%s, %s) for encoder %s" % (v, flag, x))
                     raise
+        #peek at the packet type:
+        for x in ("rencode", "rencodeplus"):
+            if x not in packet_encoding.get_enabled_encoders():
+                continue
+            e = packet_encoding.get_encoder(x)
+            for packet_data, packet_type in (
+                (["hello", {"foo" : 1}], "hello"),
+                (["draw"]+list(range(100)), "draw"),
+                (["x"*100, 1], ""),
+                ([1, 2], ""),
+                ):
+                v, flag = e(packet_data)
+                assert packet_encoding.peek_packet_type(v, flag)==packet_type
+                assert packet_encoding.peek_packet_type(memoryview(v), flag)==packet_type
+        v, flag = packet_encoding.get_encoder("bencode")(["hello"])
+        assert packet_encoding.peek_packet_type(v, flag)==""
         #one-shot function:
         assert packet_encoding.pack_one_packet(["hello", {}])
 
@@ -56,6 +56,23 @@ class FastMemoryConnection(Connection):
         return "FastMemoryConnection"
 
 
+class VectoredMemoryConnection(FastMemoryConnection):
+    """ only accepts 'max_write' bytes per call """
+    def __init__(self, max_write=65536):
+        super().__init__(None)
+        self.max_write = max_write
+        self.writev_count = 0
+
+    def can_writev(self):
+        return True
+
+    def writev(self, buffers, packet_type=None):
+        self.writev_count += 1
+        buf = b"".join(bytes(b) for b in buffers)[:self.max_write]
+        self.write_data.append(buf)
+        return len(buf)
+
+
 def noop(*_args):
     pass
 
@@ -155,6 +172,111 @@ class ProtocolTest(unittest.TestCase):
                 items = p.encode(packet)
                 assert items
 
+    def test_writev(self):
+        data = os.urandom(256*1024)
+        packet = ("test", memoryview(data), Compressed("pixels", data[:100000]), 1, b"foo")
+        written = []
+        for conn in (FastMemoryConnection(None), VectoredMemoryConnection(32768)):
+            p = self.protocol_class(GLib, conn, noop)
+            p.enable_encoder("rencodeplus")
+            p.enable_compressor("none")
+            p.compression_level = 0
+            chunks = p.encode(packet)
+            #the memoryview is sent as a raw chunk:
+            assert len(chunks)==3 and chunks[0][3] is packet[1]
+            items = []
+            p.raw_write = lambda buf_data, *_args: items.append(buf_data)
+            p._add_chunks_to_queue("test", chunks)
+            for buf_data in items:
+                p.write_items(buf_data)
+            written.append(b"".join(bytes(x) for x in conn.write_data))
+        assert written[0]==written[1]
+        assert conn.writev_count>=len(written[1])//32768
+        p.close()
+
+    def test_raw_packet_passthrough(self):
+        def make_protocol(process_packet_cb=noop):
+            #we feed the data to the parse thread directly, so no websocket framing here:
+            p = socket_handler.SocketProtocol(GLib, FastMemoryConnection(None), process_packet_cb)
+            p.enable_encoder("rencodeplus")
+            p.enable_compressor("zlib")
+            p.compression_level = 1
+            return p
+        def wire_data(p, packet):
+            items = []
+            p.raw_write = lambda buf_data, *_args: items.append(buf_data)
+            p._add_packet_to_queue(packet)
+            return b"".join(bytes(x) for buf_data in items for x in buf_data)
+        def parse(p, data):
+            p._read_queue.put(data)
+            p._read_queue.put(None)
+            p.do_read_parse_thread_loop()
+        pixels = os.urandom(100000)
+        packet = ["draw", 1, Compressed("pixels", pixels, can_inline=False), b"foo"*200]
+        data = wire_data(make_protocol(), packet)
+        #the proxy forwards the chunks without decoding them:
+        forwarded = []
+        decoded = []
+        def raw_packet_cb(_proto, packet_type, chunks):
+            forwarded.append(socket_handler.EncodedPacket(packet_type, chunks))
+            return packet_type=="draw"
+        proxy = make_protocol(lambda _proto, packet : decoded.append(packet))
+        proxy.raw_packet_cb = raw_packet_cb
+        parse(proxy, data)
+        assert len(forwarded)==1 and not decoded
+        assert len(forwarded[0].chunks)==2
+        #the packet is then sent as-is to the other end:
+        received = []
+        parse(make_protocol(lambda _proto, packet : received.append(packet)), wire_data(make_protocol(), forwarded[0]))
+        assert len(received)==1
+        assert received[0][0]=="draw" and received[0][1]==1
+        assert bytes(received[0][2])==pixels and bytes(received[0][3])==b"foo"*200
+        #packets that the callback does not handle are decoded as usual:
+        forwarded = []
+        parse(proxy, wire_data(make_protocol(), ["other", 1, 2]))
+        assert len(forwarded)==1 and len(decoded)==1
+        assert decoded[0]==["other", 1, 2]
+
+    def test_fragments(self):
+        def make_protocol(process_packet_cb=noop):
+            p = socket_handler.SocketProtocol(GLib, FastMemoryConnection(None), process_packet_cb)
+            p.enable_encoder("rencodeplus")
+            p.enable_compressor("zlib")
+            p.compression_level = 1
+            return p
+        pixels = os.urandom(socket_handler.FRAGMENT_SIZE*3+100)
+        large = Compressed("large", os.urandom(100000), can_inline=False)
+        priority = [
+            ["cursor", 1, b"small"],
+            ["ping", 2],
+            #made of more than one chunk, so it cannot be interleaved:
+            ["large", large],
+            ["ping", 3],
+            ]
+        def next_priority_packet():
+            if not priority:
+                return None, None, None, None, True
+            return priority.pop(0), None, None, None, True
+        sender = make_protocol()
+        sender.send_fragments = True
+        sender.set_priority_packet_source(next_priority_packet)
+        items = []
+        sender.raw_write = lambda buf_data, *_args: items.append(buf_data)
+        sender._add_packet_to_queue(["draw", 1, Compressed("pixels", pixels, can_inline=False), b"foo"])
+        #the pixels are sent in 4 writes, with the first two priority packets in between,
+        #then the large priority packet which had to wait for the draw packet:
+        assert len(items)==7, f"expected 7 writes but got {len(items)}"
+        assert sender.output_fragmentcount==3 and sender.output_interleavedcount==2
+        assert priority==[["ping", 3]]
+        received = []
+        receiver = make_protocol(lambda _proto, packet : received.append(packet))
+        receiver._read_queue.put(b"".join(bytes(x) for buf_data in items for x in buf_data))
+        receiver._read_queue.put(None)
+        receiver.do_read_parse_thread_loop()
+        assert [packet[0] for packet in received]==["cursor", "ping", "draw", "large"]
+        assert bytes(received[2][2])==pixels and bytes(received[2][3])==b"foo"
+        assert bytes(received[3][1])==large.data
+
     def test_read_speed(self):
         if not SHOW_PERF:
             return
@@ -276,6 +398,65 @@ except ImportError as e:
     log.warn(" %s", e)
 
 
+class AsyncioProtocolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        unittest.TestCase.setUpClass()
+        from xpra.net import packet_encoding
+        packet_encoding.init_all()
+        from xpra.net import compression
+        compression.init_all()
+
+    def test_packets(self):
+        import socket
+        from queue import Queue
+        from xpra.net.bytestreams import SocketConnection
+        from xpra.net.quic.asyncio_thread import threaded_asyncio_loop
+        from xpra.net.protocol.asyncio_handler import AsyncioSocketProtocol
+        loop = threaded_asyncio_loop().loop
+        class Scheduler:
+            def idle_add(self, fn, *args):
+                loop.call_soon_threadsafe(fn, *args)
+            def timeout_add(self, timeout, fn, *args):
+                loop.call_soon_threadsafe(loop.call_later, timeout/1000, fn, *args)
+            def source_remove(self, _tid):
+                pass
+        s1, s2 = socket.socketpair()
+        received = Queue()
+        def make_protocol(sock, packets=()):
+            conn = SocketConnection(sock, "local", "remote", "test", "socket")
+            queue = list(packets)
+            def get_packet():
+                return queue.pop(0), None, None, None, True, bool(queue)
+            def process_packet(_proto, packet):
+                received.put(packet)
+            p = AsyncioSocketProtocol(loop, Scheduler(), conn, process_packet, get_packet)
+            p.enable_encoder("rencodeplus")
+            p.enable_compressor("zlib")
+            return p
+        large = os.urandom(1024*1024)
+        packets = [["test", i, b"foo"] for i in range(10)] + [["large", Compressed("data", large, can_inline=False)]]
+        sender = make_protocol(s1, packets)
+        receiver = make_protocol(s2)
+        receiver.start()
+        sender.start()
+        for _ in packets:
+            sender.source_has_more()
+        for i in range(10):
+            packet = received.get(timeout=TIMEOUT)
+            assert packet[0]=="test" and packet[1]==i, f"unexpected packet {packet}"
+        packet = received.get(timeout=TIMEOUT)
+        assert packet[0]=="large" and bytes(packet[1])==large
+        #the connection cannot be stolen, and remains usable:
+        assert receiver.steal_connection() is None
+        #closing one end closes the other:
+        sender.close()
+        packet = received.get(timeout=TIMEOUT)
+        assert packet[0]==CONNECTION_LOST
+        assert receiver.input_packetcount==11
+
+
 def main():
     unittest.main()
 
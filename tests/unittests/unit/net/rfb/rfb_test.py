@@ -5,6 +5,7 @@
 # later version. See the file COPYING for details.
 
 
+import struct
 import unittest
 
 from xpra.util import AdHocStruct
@@ -30,6 +31,7 @@ class TestRFB(unittest.TestCase):
             return ImageWrapper(x, y, w, h, pixels, "BGRX", 24, stride, 4)
         window.get_image = get_image
         window.acknowledge_changes = noop
+        window.get_dimensions = lambda : (1024, 768)
         for protocol in (p, None):
             s = RFBSource(protocol, True)
             assert s.get_info()
@@ -50,6 +52,117 @@ class TestRFB(unittest.TestCase):
             s.damage(1, window, 0, 0, 2, 2, {"polling" : protocol is None})
             assert s.is_closed()
 
+    def test_damage_tiles(self):
+        from xpra.net.rfb.rfb_const import RFBEncoding
+        sent = []
+        p = AdHocStruct()
+        p.send = sent.append
+        p.queue_size = lambda : 0
+        W, H = 256, 192
+        stride = W*4
+        pixels = bytearray(stride*H)
+        window = AdHocStruct()
+        def get_image(x, y, w, h):
+            sub = bytearray(w*4*h)
+            for i in range(h):
+                sub[i*w*4:(i+1)*w*4] = pixels[(y+i)*stride+x*4:(y+i)*stride+(x+w)*4]
+            return ImageWrapper(x, y, w, h, bytes(sub), "BGRX", 24, w*4, 4)
+        window.get_image = get_image
+        window.acknowledge_changes = noop
+        window.get_dimensions = lambda : (W, H)
+        s = RFBSource(p, True)
+        s.set_encodings((RFBEncoding.ZRLE, RFBEncoding.COPYRECT, RFBEncoding.RAW))
+        def damage(*area):
+            sent[:] = []
+            stats = dict(s.stats)
+            s.damage(1, window, *area)
+            return dict((k, v-stats[k]) for k, v in s.stats.items())
+        diff = damage(0, 0, W, H)
+        assert sent and diff["tiles-sent"]==12, diff
+        #nothing changed:
+        diff = damage(0, 0, W, H)
+        assert not sent and diff["tiles-skipped"]==12, diff
+        #modify a single pixel:
+        pixels[stride*100+4*100] = 255
+        diff = damage(90, 90, 20, 20)
+        assert sent and diff["tiles-sent"]==1 and diff["tiles-skipped"]==0, diff
+        #a non-incremental request forces a refresh:
+        s.update_request(False, 0, 0, W, H)
+        diff = damage(0, 0, W, H)
+        assert diff["tiles-sent"]==12, diff
+        #scroll the contents up:
+        for i in range(H):
+            for j in range(W*4):
+                pixels[i*stride+j] = (i*7+j//4) % 256
+        damage(0, 0, W, H)
+        pixels[:stride*(H-16)] = pixels[stride*16:]
+        diff = damage(0, 0, W, H)
+        assert diff["copyrect"]>0 and diff["tiles-copied"]>0, diff
+        assert diff["tiles-sent"]<12, diff
+        s.close()
+
+    def test_client_framebuffer(self):
+        #rebuild the client's framebuffer from the packets we send,
+        #and verify that it always matches the server's:
+        from xpra.net.rfb.rfb_const import RFBEncoding
+        W, H = 256, 192
+        stride = W*4
+        pixels = bytearray(stride*H)
+        framebuffer = bytearray(stride*H)
+        sent = []
+        def update_framebuffer():
+            data = b"".join(sent)
+            sent[:] = []
+            pos = 0
+            while pos<len(data):
+                x, y, w, h, encoding = struct.unpack(b"!HHHHi", data[pos+4:pos+16])
+                pos += 16
+                if encoding==RFBEncoding.COPYRECT:
+                    src_x, src_y = struct.unpack(b"!HH", data[pos:pos+4])
+                    pos += 4
+                    rows = [framebuffer[(src_y+i)*stride+src_x*4:(src_y+i)*stride+(src_x+w)*4] for i in range(h)]
+                    for i, row in enumerate(rows):
+                        framebuffer[(y+i)*stride+x*4:(y+i)*stride+(x+w)*4] = row
+                else:
+                    assert encoding==RFBEncoding.RAW
+                    for i in range(h):
+                        framebuffer[(y+i)*stride+x*4:(y+i)*stride+(x+w)*4] = data[pos:pos+w*4]
+                        pos += w*4
+        p = AdHocStruct()
+        p.send = sent.append
+        p.queue_size = lambda : 0
+        window = AdHocStruct()
+        def get_image(x, y, w, h):
+            sub = bytearray(w*4*h)
+            for i in range(h):
+                sub[i*w*4:(i+1)*w*4] = pixels[(y+i)*stride+x*4:(y+i)*stride+(x+w)*4]
+            return ImageWrapper(x, y, w, h, bytes(sub), "BGRX", 24, w*4, 4)
+        window.get_image = get_image
+        window.acknowledge_changes = noop
+        window.get_dimensions = lambda : (W, H)
+        s = RFBSource(p, True)
+        s.set_encodings((RFBEncoding.COPYRECT, RFBEncoding.RAW))
+        def damage(*area):
+            s.damage(1, window, *area)
+            update_framebuffer()
+            assert framebuffer==pixels, "client framebuffer does not match after damage%s" % (area, )
+        for i in range(H):
+            for j in range(W*4):
+                pixels[i*stride+j] = (i*7+j//4) % 256
+        damage(0, 0, W, H)
+        #regions of the same size at a different position must not be mistaken for a scroll:
+        damage(0, 0, W, 128)
+        damage(0, 64, W, 128)
+        #scroll the contents up, in the whole window and in a region:
+        pixels[:stride*(H-16)] = pixels[stride*16:]
+        damage(0, 0, W, H)
+        damage(0, 64, W, 128)
+        pixels[stride*64:stride*(H-8)] = pixels[stride*72:]
+        copyrect = s.stats["copyrect"]
+        damage(0, 64, W, 128)
+        assert s.stats["copyrect"]>copyrect
+        s.close()
+
 
 def main():
     unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import time
+import socket
+import shutil
+import tempfile
+import unittest
+from time import monotonic
+
+from xpra.os_util import POSIX
+from xpra.platform import dotxpra
+from xpra.platform.dotxpra_common import PREFIX
+
+
+class DotXpraTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sockdir = tempfile.mkdtemp(prefix="xpra-dotxpra-test")
+        self.sockets = []
+        dotxpra.state_cache.clear()
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+        shutil.rmtree(self.sockdir)
+
+    def make_socket(self, display, listen=True):
+        sock = socket.socket(socket.AF_UNIX)
+        sockpath = os.path.join(self.sockdir, PREFIX+display)
+        sock.bind(sockpath)
+        if listen:
+            sock.listen(5)
+        self.sockets.append(sock)
+        return sockpath
+
+    def test_socket_details(self):
+        if not POSIX:
+            return
+        live = self.make_socket("100")
+        unknown = self.make_socket("101", False)
+        dx = dotxpra.DotXpra(self.sockdir)
+        details = dx.socket_details()[self.sockdir]
+        assert sorted(details)==[(dx.LIVE, ":100", live), (dx.UNKNOWN, ":101", unknown)], details
+        assert dx.socket_details(matching_state=dx.LIVE)[self.sockdir]==[(dx.LIVE, ":100", live)]
+        assert dx.displays()
+
+    def test_deadline(self):
+        if not POSIX:
+            return
+        live = self.make_socket("102")
+        hung = self.make_socket("103")
+        class SlowDotXpra(dotxpra.DotXpra):
+            def get_server_state(self, sockpath, timeout=5):
+                if sockpath==hung:
+                    time.sleep(timeout*2)
+                return super().get_server_state(sockpath, timeout)
+        dx = SlowDotXpra(self.sockdir)
+        start = monotonic()
+        states = dx.get_server_states((live, hung), 0.5)
+        assert monotonic()-start<1
+        assert states=={live : dx.LIVE, hung : dx.UNKNOWN}, states
+
+    def test_cache(self):
+        if not POSIX:
+            return
+        live = self.make_socket("104")
+        ttl = dotxpra.SOCKET_STATE_CACHE_TTL
+        dotxpra.SOCKET_STATE_CACHE_TTL = 60*1000
+        try:
+            dx = dotxpra.DotXpra(self.sockdir)
+            assert dx.get_server_states((live, )) == {live : dx.LIVE}
+            assert live in dotxpra.state_cache
+            #the server is gone, but we still have the cached value:
+            self.sockets[0].close()
+            assert dx.get_server_states((live, )) == {live : dx.LIVE}
+            #a new socket at the same path is probed again:
+            os.unlink(live)
+            self.make_socket("104", False)
+            assert dx.get_server_states((live, )) == {live : dx.UNKNOWN}
+        finally:
+            dotxpra.SOCKET_STATE_CACHE_TTL = ttl
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@
 # later version. See the file COPYING for details.
 
 import unittest
+import threading
 
 from xpra import queue_scheduler
 QueueScheduler = queue_scheduler.QueueScheduler
@@ -115,6 +116,32 @@ class QueueSchedulerTest(unittest.TestCase):
         qs.run()
         assert not times, "items remain in list: %s" % (times,)
 
+    def test_timer_order(self):
+        qs = QueueScheduler()
+        calls = []
+        for delay in (50, 10, 30, 20, 40):
+            qs.timeout_add(delay, calls.append, delay)
+        tid = qs.timeout_add(25, calls.append, 25)
+        qs.source_remove(tid)
+        qs.timeout_add(200, qs.stop)
+        qs.run()
+        assert calls==[10, 20, 30, 40, 50], "unexpected timer order: %s" % (calls,)
+        info = qs.get_scheduler_info()
+        assert info["dispatched"]==6
+        assert info["timers"]==0
+        assert "lag" in info
+
+    def test_many_timers(self):
+        qs = QueueScheduler()
+        calls = []
+        thread_count = threading.active_count()
+        for i in range(1000):
+            qs.timeout_add(i%20, calls.append, i)
+        assert threading.active_count()<=thread_count+1
+        qs.timeout_add(500, qs.stop)
+        qs.run()
+        assert len(calls)==1000
+
 def main():
     unittest.main()
 
@@ -100,6 +100,52 @@ class TestCystats(unittest.TestCase):
         a, ra = cystats.calculate_time_weighted_average(data)
         assert 0<a<1 and 0<ra<1
 
+    def test_time_weighted_average_incremental(self):
+        twa = cystats.TimeWeightedAverage()
+        assert len(twa)==0
+        now = monotonic()
+        #constant values give the same averages:
+        for i in range(100):
+            twa.add(now+i/10, 5)
+        a, ra = twa.get()
+        self.assertAlmostEqual(a, 5)
+        self.assertAlmostEqual(ra, 5)
+        assert len(twa)==100
+        #a new value matters more for the recent average:
+        twa.add(now+10, 10)
+        a, ra = twa.get()
+        assert 5<a<ra<10
+        #old values become irrelevant:
+        twa.add(now+1000, 1)
+        a, ra = twa.get()
+        self.assertAlmostEqual(a, 1)
+        self.assertAlmostEqual(ra, 1)
+        #values received out of order still count, but less:
+        twa.add(now+999, 2)
+        a, ra = twa.get()
+        assert 1<ra<a<2
+        twa.reset()
+        assert len(twa)==0
+
+    def test_size_weighted_average_incremental(self):
+        swa = cystats.SizeWeightedAverage()
+        now = monotonic()
+        for i in range(1, 1000):
+            swa.add(now, i*5, 5)
+        a, ra = swa.get()
+        self.assertEqual(5, round(a))
+        self.assertEqual(5, round(ra))
+        #same time: the larger record matters more
+        swa = cystats.SizeWeightedAverage()
+        swa.add(now, 100*1000, 1000)
+        swa.add(now, 50*1000, 100)
+        a, ra = swa.get()
+        self.assertEqual(round(a), round(ra))
+        self.assertGreater(a, 550)
+        #invalid records are ignored:
+        swa.add(now, 1000, 0)
+        self.assertEqual(swa.get(), (a, ra))
+
     def test_logp(self):
         for _ in range(1000):
             x = random.random()
@@ -153,6 +153,47 @@ class TestMotion(unittest.TestCase):
         #log("na1:\n%s" % (na1, ))
         #log("na2:\n%s" % (na2, ))
 
+    def test_motion_vectors(self):
+        import os
+        W, H, B = 320, 240, 16
+        def paint(bg, win, wx, wy, ww, wh):
+            pixels = bytearray(bg)
+            for j in range(wh):
+                pixels[((wy+j)*W+wx)*4:((wy+j)*W+wx+ww)*4] = win[j*ww*4:(j+1)*ww*4]
+            return bytes(pixels)
+        bg = os.urandom(W*H*4)
+        win = os.urandom(100*80*4)
+        for src, dst in (
+            ((50, 50), (87, 71)),       #moved diagonally
+            ((50, 50), (40, 50)),       #moved horizontally
+            ((100, 100), (110, 93)),
+            ):
+            old = paint(bg, win, src[0], src[1], 100, 80)
+            new = paint(bg, win, dst[0], dst[1], 100, 80)
+            sd = motion.ScrollData(0, 0, W, H, B)
+            sd.update(old, 0, 0, W, H, W*4, 4)
+            sd.update(new, 0, 0, W, H, W*4, 4)
+            copies, dirty, pct = sd.get_motion_values(new, W*4)
+            vector = (dst[0]-src[0], dst[1]-src[1])
+            assert list(copies.keys())==[vector], "expected %s but got %s" % (vector, copies.keys())
+            assert pct>=80
+            #apply the copies and repaint the rest, we should get the new picture:
+            pixels = bytearray(old)
+            for (dx, dy), rects in copies.items():
+                for x, y, w, h in rects:
+                    for j in range(h):
+                        pixels[((y+dy+j)*W+x+dx)*4:((y+dy+j)*W+x+dx+w)*4] = old[((y+j)*W+x)*4:((y+j)*W+x+w)*4]
+            for x, y, w, h in dirty:
+                for j in range(h):
+                    pixels[((y+j)*W+x)*4:((y+j)*W+x+w)*4] = new[((y+j)*W+x)*4:((y+j)*W+x+w)*4]
+            assert pixels==new
+            assert sum(w*h for _, _, w, h in dirty)<W*H//5
+        #no block data without a block size:
+        sd = motion.ScrollData(0, 0, W, H)
+        sd.update(bg, 0, 0, W, H, W*4, 4)
+        sd.update(bg, 0, 0, W, H, W*4, 4)
+        assert sd.get_motion_values(bg, W*4) is None
+
     def test_csum_data(self):
         a1=[
             5992220345606009987, 15040563112965825180, 420530012284267555, 3380071419019115782, 14243596304267993264, 834861281570233459, 10803583843784306120, 1379296002677236226,
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.util import AdHocStruct
+from xpra.server import server_base
+
+
+class TestPointerCoalescing(unittest.TestCase):
+
+    def test_coalesce_motion(self):
+        queue = []
+        processed = []
+        server = server_base.ServerBase.__new__(server_base.ServerBase)
+        server._pending_motion = {}
+        server._pending_motion_lock = server_base.Lock()
+        server.pointer_motion_coalesced = 0
+        server.idle_add = queue.append
+        proto = AdHocStruct()
+        server._server_sources = {proto : None}
+        def handler(_proto, packet):
+            processed.append(packet)
+        server._authenticated_ui_packet_handlers = {
+            "pointer" : handler,
+            "pointer-button" : handler,
+            }
+        def pointer(seq, wid=1, device_id=0):
+            return ["pointer", device_id, seq, wid, (seq, seq), {}]
+        packets = (
+            pointer(1), pointer(2), pointer(3),
+            ["pointer-button", 0, 4, 1, 1, True, (3, 3), {}],
+            pointer(5), pointer(6, wid=2), pointer(7, wid=2),
+            pointer(8, device_id=1),
+            )
+        for packet in packets:
+            server.process_packet(proto, packet)
+        assert server.pointer_motion_coalesced==3
+        for fn in queue:
+            fn()
+        assert [packet[2] for packet in processed]==[3, 4, 5, 7, 8], processed
+        assert not server._pending_motion
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@
 
 import sys
 import unittest
+from time import sleep
 from io import BytesIO
 
 from gi.repository import GLib  # @UnresolvedImport
@@ -106,6 +107,50 @@ class SourceMixinsTest(unittest.TestCase):
         assert ClientConnection.is_needed(typedict()) is True
         #self._test_mixin_class(ClientConnection)
 
+    @staticmethod
+    def noop(*_args):
+        pass
+
+    def test_encode_threads(self):
+        from threading import current_thread
+        from xpra.server.source import client_connection
+        saved = client_connection.ENCODE_THREADS
+        client_connection.ENCODE_THREADS = 2
+        try:
+            protocol = AdHocStruct()
+            protocol.set_packet_source = self.noop
+            protocol.set_priority_packet_source = self.noop
+            protocol.get_info = dict
+            noop = self.noop
+            c = client_connection.ClientConnection(protocol, noop, "test", noop, "", (), False, 0, False)
+            c.init_state()
+            c.run()
+            calls = []
+            def record(wid, n):
+                calls.append((wid, n, current_thread().name))
+            for n in range(10):
+                for wid in (1, 2, 3):
+                    c.call_in_window_encode_thread(wid, True, record, wid, n)
+            #stops all the encode threads:
+            c.queue_encode(None)
+            c.encode_thread.join(5)
+            for _ in range(500):
+                if len(calls)==30:
+                    break
+                sleep(0.01)
+            assert c.get_info()["encode-threads"]==3
+            for wid in (1, 2, 3):
+                wcalls = [x for x in calls if x[0]==wid]
+                #all in order, and all from the same thread:
+                assert [x[1] for x in wcalls]==list(range(10)), wcalls
+                assert len(set(x[2] for x in wcalls))==1
+            assert len(set(x[2] for x in calls))==2
+            #windows that are gone are no longer assigned to a thread:
+            c.release_window_encode_queue(2)
+            assert sorted(c.window_encode_queues.keys())==[1, 3]
+        finally:
+            client_connection.ENCODE_THREADS = saved
+
     def test_clipboard(self):
         from xpra.server.source.clipboard_connection import ClipboardConnection
         for fix in (False, True):
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import unittest
+
+from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.server.window import content_classifier
+from xpra.server.window.content_classifier import ContentClassifier, classify, get_pixel_stats
+
+
+def text_pixels(width, height):
+    #black glyph-like strokes on a white background:
+    pixels = bytearray(b"\xff"*width*height*4)
+    for y in range(height):
+        if y%8 in (6, 7):
+            continue
+        for x in range(0, width, 3):
+            i = (y*width+x)*4
+            pixels[i:i+4] = b"\0\0\0\xff"
+    return bytes(pixels)
+
+def make_image(pixels, width, height, x=0, y=0):
+    return ImageWrapper(x, y, width, height, pixels, "BGRX", 24, width*4, 4)
+
+
+class TestContentClassifier(unittest.TestCase):
+
+    def test_pixel_stats(self):
+        width, height = 64, 32
+        pixels = bytes(width*height*4)
+        samples, colours, edges, changed, luma = get_pixel_stats(pixels, width, height, width*4, 4)
+        assert samples==width*height and colours==1 and edges==0 and changed==-1
+        assert len(luma)==samples
+        #compare with a different frame, using padded rows and a sampling step:
+        rowstride = width*4+16
+        noise = os.urandom(rowstride*height)
+        samples, colours, edges, changed, luma = get_pixel_stats(noise, width, height, rowstride, 4, 2)
+        assert samples==32*16 and colours>100 and edges>0 and changed==-1
+        samples, colours, edges, changed, _ = get_pixel_stats(bytes(rowstride*height), width, height, rowstride, 4,
+                                                              2, luma)
+        assert changed>samples//2
+        #previous frame does not match:
+        assert get_pixel_stats(pixels, width, height, width*4, 4, 1, luma)[3]==-1
+        with self.assertRaises(AssertionError):
+            get_pixel_stats(pixels, width, height+1, width*4, 4)
+
+    def test_classify(self):
+        assert classify(1000, 2, 200, -1)=="text"
+        assert classify(1000, 500, 100, 10)=="picture"
+        assert classify(1000, 500, 100, 900)=="video"
+        assert classify(1000, 2, 0, 0)==""
+
+    def test_classifier(self):
+        width, height = 128, 64
+        classifier = ContentClassifier()
+        text = make_image(text_pixels(width, height), width, height)
+        changed = False
+        for _ in range(content_classifier.CLASSIFY_INTERVAL*2):
+            changed |= classifier.process_image(text)
+        assert changed and classifier.content_type=="text", f"got {classifier.content_type!r}"
+        #random pixels that change every frame look like video:
+        for _ in range(content_classifier.CLASSIFY_INTERVAL*10):
+            classifier.process_image(make_image(os.urandom(width*height*4), width, height))
+        assert classifier.content_type=="video", f"got {classifier.content_type!r}"
+        assert classifier.get_info()["content-type"]=="video"
+        classifier.reset()
+        assert classifier.content_type==""
+        #too small to be classified:
+        for _ in range(content_classifier.CLASSIFY_INTERVAL*2):
+            assert not classifier.process_image(make_image(text_pixels(16, 16), 16, 16))
+
+
+def main():
+    if get_pixel_stats:
+        unittest.main()
+    else:
+        print("no pixel_stats module found, test skipped")
+
+if __name__ == '__main__':
+    main()
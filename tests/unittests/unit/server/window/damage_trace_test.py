@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import unittest
+import tempfile
+
+from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.server.window.damage_trace import DamageRecorder, read_trace
+
+
+class FakeWindow:
+
+    def get_dimensions(self):
+        return 64, 32
+
+    def has_alpha(self):
+        return False
+
+    def get(self, prop, default_value=None):
+        return {"title" : "test", "content-type" : "text"}.get(prop, default_value)
+
+    def get_image(self, x, y, w, h):
+        pixels = bytes((x+y+i) & 0xff for i in range(w*h*4))
+        return ImageWrapper(x, y, w, h, pixels, "BGRX", 24, w*4, 4)
+
+
+class TestDamageTrace(unittest.TestCase):
+
+    def test_round_trip(self):
+        window = FakeWindow()
+        with tempfile.NamedTemporaryFile(suffix=".trace", delete=False) as f:
+            filename = f.name
+        try:
+            recorder = DamageRecorder(filename)
+            recorder.record_damage(1, window, 0, 0, 16, 8, {"quality" : 50, "ignored" : object()})
+            recorder.record_damage(1, window, 10, 20, 4, 4, None)
+            recorder.close()
+            #writing after close is ignored:
+            recorder.record_damage(1, window, 0, 0, 1, 1, None)
+            records = tuple(read_trace(filename))
+        finally:
+            os.unlink(filename)
+        assert len(records)==3, f"expected 3 records but got {len(records)}"
+        header, pixels = records[0]
+        assert header["type"]=="window"
+        assert header["width"]==64 and header["height"]==32
+        assert header["title"]=="test" and header["content-type"]=="text"
+        assert pixels==window.get_image(0, 0, 64, 32).get_pixels()
+        header, pixels = records[1]
+        assert header["type"]=="damage"
+        assert header["options"]=={"quality" : 50}
+        assert header["rowstride"]==16*4
+        assert pixels==window.get_image(0, 0, 16, 8).get_pixels()
+        header, pixels = records[2]
+        assert (header["x"], header["y"], header["width"], header["height"])==(10, 20, 4, 4)
+        assert pixels==window.get_image(10, 20, 4, 4).get_pixels()
+
+    def test_server_damage(self):
+        from xpra.server.mixins.window_server import WindowServer
+        window = FakeWindow()
+        window.unmanage = lambda : None
+        damaged = []
+        class FakeSource:
+            def damage(self, *args):
+                damaged.append(args)
+        with tempfile.NamedTemporaryFile(suffix=".trace", delete=False) as f:
+            filename = f.name
+        try:
+            server = WindowServer()
+            server._server_sources = {1 : FakeSource(), 2 : FakeSource()}
+            server._window_to_id[window] = 1
+            server.damage_recorder = DamageRecorder(filename)
+            server.refresh_window_area(window, 0, 0, 16, 8)
+            #cleanup closes the trace file:
+            server.cleanup()
+            records = tuple(read_trace(filename))
+        finally:
+            os.unlink(filename)
+        #each client gets the damage, but it is only recorded once:
+        assert len(damaged)==2
+        assert [header["type"] for header, _ in records]==["window", "damage"]
+
+    def test_invalid_file(self):
+        with tempfile.NamedTemporaryFile(suffix=".trace") as f:
+            f.write(b"not a trace file")
+            f.flush()
+            with self.assertRaises(ValueError):
+                tuple(read_trace(f.name))
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+from time import sleep
+from threading import Thread
+
+from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.server.window.shared_encode import get_shared_encode_cache, release_shared_encode_cache
+
+
+class TestSharedEncode(unittest.TestCase):
+
+    def test_shared_encode(self):
+        calls = []
+        def encode(coding, image, options):
+            calls.append((coding, options.get("quality")))
+            return coding, b"data", {"quality" : options.get("quality")}, image.get_width(), image.get_height(), 0, 24
+        def make_image(pixels=b"\0"*4*16*16):
+            return ImageWrapper(0, 0, 16, 16, pixels, "BGRX", 24, 16*4)
+        wid = 1
+        cache = get_shared_encode_cache(wid)
+        assert cache
+        #only one user: no caching
+        for _ in range(2):
+            cache.encode(encode, "webp", make_image(), {"quality" : 50})
+        assert len(calls)==2
+        calls.clear()
+        assert get_shared_encode_cache(wid) is cache
+        try:
+            ret = cache.encode(encode, "webp", make_image(), {"quality" : 50})
+            ret[2]["flush"] = 1
+            #same pixels with a similar quality uses the cached result:
+            ret = cache.encode(encode, "webp", make_image(), {"quality" : 55})
+            assert len(calls)==1
+            assert ret[2]=={"quality" : 50}, "client options should not be shared"
+            #different quality, encoding, options or pixels:
+            cache.encode(encode, "webp", make_image(), {"quality" : 90})
+            cache.encode(encode, "jpeg", make_image(), {"quality" : 50})
+            cache.encode(encode, "webp", make_image(), {"quality" : 50, "grayscale" : True})
+            cache.encode(encode, "webp", make_image(b"\1"*4*16*16), {"quality" : 50})
+            assert len(calls)==5
+            #concurrent encodes of the same image:
+            calls.clear()
+            results = []
+            def slow_encode(coding, image, options):
+                sleep(0.05)
+                return encode(coding, image, options)
+            def run():
+                results.append(cache.encode(slow_encode, "png", make_image(), {}))
+            threads = [Thread(target=run) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert len(calls)==1, f"expected a single encode but got {calls}"
+            assert len(results)==4
+            info = cache.get_info()
+            assert info["users"]==2
+            assert info["hits"]==4
+        finally:
+            release_shared_encode_cache(wid)
+            release_shared_encode_cache(wid)
+        assert get_shared_encode_cache(wid) is not cache
+        release_shared_encode_cache(wid)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
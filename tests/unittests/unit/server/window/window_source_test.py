@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.server.window import window_source
+from xpra.server.window.window_source import WindowSource
+
+
+class TestWindowSource(unittest.TestCase):
+
+    def test_drop_unchanged_tiles(self):
+        T = window_source.TILE_CACHE_TILE_SIZE
+        W, H = T*4+10, T*3
+        pixels = bytearray(W*H*4)
+        ws = WindowSource.__new__(WindowSource)
+        ws.init_vars()
+        ws.picture_encodings = ("png", )
+        ws.window_dimensions = W, H
+        def get_damage_image(x, y, w, h):
+            return ImageWrapper(0, 0, W, H, bytes(pixels), "BGRX", 24, W*4).get_sub_image(x, y, w, h)
+        ws.get_damage_image = get_damage_image
+        ws.free_image_wrapper = ImageWrapper.free
+        def drop(x, y, w, h, coding="png", options=None, flush=None):
+            image = get_damage_image(x, y, w, h)
+            image = ws.drop_unchanged_tiles(image, x, y, coding, options or {}, flush)
+            if image is None:
+                return None
+            return image.get_target_x(), image.get_target_y(), image.get_width(), image.get_height()
+        #first time around, everything is sent:
+        assert drop(0, 0, W, H)==(0, 0, W, H)
+        #nothing has changed:
+        assert drop(0, 0, W, H) is None
+        assert drop(T, T, T*2, T) is None
+        #but the last packet of a sequence is still sent:
+        assert drop(T, T, T*2, T, flush=0)==(T, T, T, T)
+        #partial tiles are always sent:
+        assert drop(T//2, 0, T, T)==(T//2, 0, T, T)
+        #and the tiles they intersect with are no longer cached:
+        assert drop(0, 0, W, H)==(0, 0, T*2, T)
+        #modify one pixel:
+        pos = ((T+5)*W+T*2+3)*4
+        pixels[pos] = 0xff
+        assert drop(0, 0, W, H)==(T*2, T, T, T)
+        assert drop(0, 0, W, H) is None
+        #the cropped image contains the pixels that were hashed,
+        #even if the window has changed again since they were captured:
+        pixels[pos] = 0x80
+        image = get_damage_image(0, 0, W, H)
+        pixels[pos] = 0x40
+        image = ws.drop_unchanged_tiles(image, 0, 0, "png", {})
+        assert image.get_target_x()==T*2 and image.get_target_y()==T
+        assert image.get_pixels()[5*image.get_rowstride()+3*4]==0x80
+        assert drop(0, 0, W, H)==(T*2, T, T, T)
+        #the last tile is narrower:
+        pixels[(H*W-1)*4] = 0xff
+        assert drop(0, 0, W, H)==(T*4, T*2, 10, T)
+        #auto-refresh and other encodings are never filtered:
+        assert drop(0, 0, W, H, options={"auto_refresh" : True})==(0, 0, W, H)
+        assert drop(0, 0, W, H)==(0, 0, W, H)
+        assert drop(0, 0, W, H, "h264")==(0, 0, W, H)
+        assert drop(0, 0, W, H)==(0, 0, W, H)
+        assert drop(0, 0, W, H) is None
+        ws.invalidate_tiles(T, T, 1, 1)
+        assert drop(0, 0, W, H)==(T, T, T, T)
+        ws.invalidate_tiles()
+        assert drop(0, 0, W, H)==(0, 0, W, H)
+
+    def test_auto_encoding_text(self):
+        from xpra.server.window.content_classifier import ContentClassifier
+        ws = WindowSource.__new__(WindowSource)
+        ws.init_vars()
+        ws._rgb_auto_threshold = 1024
+        ws._lossless_threshold_base = 85
+        ws._want_alpha = False
+        ws.client_bit_depth = ws.image_depth = 24
+        ws.content_classifier = ContentClassifier()
+        encodings = ("png", "jpeg", "webp", "rgb24")
+        def get_encoding():
+            return ws.do_get_auto_encoding(500, 500, {"quality" : 50}, None, encodings)
+        #windows that declare their own text content-type keep using lossy encodings:
+        ws.window_content_type = ws.content_type = "text"
+        assert get_encoding()!="png"
+        #but windows classified as text use png:
+        ws.window_content_type = ""
+        ws.content_type = ws.content_classifier.content_type = "text"
+        assert get_encoding()=="png"
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+"""
+Replays a damage trace recorded by a server running with:
+    XPRA_DAMAGE_TRACE=~/damage.trace xpra start ...
+through the server side window source and encoders,
+without any X11 server, client or network connection.
+ie:
+    ./replay_damage.py ~/damage.trace --encoding=auto --speed=1 --latency=20
+Use `--speed=0` to feed the damage events as fast as possible.
+"""
+
+import sys
+from queue import Queue
+from threading import Thread
+from time import monotonic
+
+from xpra.util import typedict, csv
+from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.server.shadow.root_window_model import RootWindowModel
+from xpra.server.window.damage_trace import read_trace
+
+BPP = 4
+
+
+class ReplayCapture:
+    """ holds the current contents of a window, updated by the damage records """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.rowstride = width*BPP
+        self.pixel_format = "BGRX"
+        self.depth = 24
+        self.pixels = bytearray(self.rowstride*height)
+
+    def __repr__(self):
+        return f"ReplayCapture({self.width}x{self.height})"
+
+    def get_info(self) -> dict:
+        return {"type" : "replay"}
+
+    def update(self, header, pixels):
+        self.pixel_format = header.get("pixel-format", self.pixel_format)
+        self.depth = header.get("depth", self.depth)
+        x, y = header["x"], header["y"]
+        rowstride = header["rowstride"]
+        #clip to our buffer:
+        w = min(header["width"], self.width-x)
+        h = min(header["height"], self.height-y)
+        l = w*BPP
+        for row in range(h):
+            src = row*rowstride
+            dst = (y+row)*self.rowstride+x*BPP
+            self.pixels[dst:dst+l] = pixels[src:src+l]
+
+    def get_image(self, x, y, width, height):
+        x, y = max(0, x), max(0, y)
+        width, height = min(width, self.width-x), min(height, self.height-y)
+        if width<=0 or height<=0:
+            return None
+        l = width*BPP
+        offsets = ((y+row)*self.rowstride+x*BPP for row in range(height))
+        data = b"".join(self.pixels[offset:offset+l] for offset in offsets)
+        return ImageWrapper(x, y, width, height, data, self.pixel_format, self.depth, l, BPP)
+
+
+class ReplayWindow(RootWindowModel):
+
+    def __init__(self, header, capture):
+        w, h = header["width"], header["height"]
+        super().__init__(None, capture, header.get("title", ""), (0, 0, w, h))
+        self.alpha = header.get("has-alpha", False)
+        self.content_type = header.get("content-type", "")
+
+    def __repr__(self):
+        return f"ReplayWindow({self.title!r} : {self.geometry})"
+
+    def has_alpha(self):
+        return self.alpha
+
+    def is_shadow(self):
+        return False
+
+
+class ReplayConnection:
+    """
+        Takes the place of the client connection:
+        records the draw packets and acknowledges them,
+        optionally after a simulated network latency.
+    """
+
+    def __init__(self, scheduler, latency=0):
+        self.scheduler = scheduler
+        self.latency = latency
+        self.window_source = None
+        self.bytecount = 0
+        self.packets = []
+        self.encode_queue = Queue()
+        self.encode_thread = Thread(target=self.encode_loop, name="encode", daemon=True)
+        self.encode_thread.start()
+
+    def encode_loop(self):
+        while True:
+            fn_and_args = self.encode_queue.get(True)
+            if fn_and_args is None:
+                return
+            fn_and_args[1](*fn_and_args[2:])
+
+    def call_in_encode_thread(self, *fn_and_args):
+        self.encode_queue.put(fn_and_args)
+
+    def encode_queue_size(self):
+        return self.encode_queue.qsize()
+
+    def record_congestion_event(self, source, late_pct=0, send_speed=0):
+        pass
+
+    def queue_packet(self, packet, wid=0, pixels=0,
+                     start_send_cb=None, end_send_cb=None, fail_cb=None, wait_for_more=False):
+        #this runs in the encode thread:
+        if packet[0]!="draw":
+            return
+        now = monotonic()
+        w, h, coding, data, seq = packet[4:9]
+        ack_pending = self.window_source.statistics.damage_ack_pending.get(seq)
+        damage_time = ack_pending[7] if ack_pending else now
+        if start_send_cb:
+            start_send_cb(self.bytecount)
+        self.bytecount += len(data)
+        if end_send_cb:
+            end_send_cb(self.bytecount)
+        self.packets.append((coding, len(data), w*h, now-damage_time))
+        def ack():
+            self.window_source.damage_packet_acked(seq, w, h, 0, "")
+        if self.latency>0:
+            self.scheduler.timeout_add(self.latency, ack)
+        else:
+            self.scheduler.idle_add(ack)
+
+    def stop(self):
+        self.encode_queue.put(None)
+        self.encode_thread.join()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values)-1, len(values)*pct//100)]
+
+
+def make_window_source(scheduler, conn, window, encoding, encodings):
+    from xpra.server.source.source_stats import GlobalPerformanceStatistics
+    from xpra.server.window.batch_config import DamageBatchConfig
+    from xpra.server.window.window_video_source import WindowVideoSource
+    from xpra.codecs.video_helper import getVideoHelper
+    ww, wh = window.get_dimensions()
+    encoding_options = typedict({
+        "lz4" : True,
+        "rgb_lz4" : True,
+        "video_scaling" : True,
+        "full_csc_modes" : {},
+        })
+    default_encoding_options = typedict()
+    rgb_formats = ("BGRX", "BGRA", "RGBX", "RGBA", "RGB", "BGR")
+    return WindowVideoSource(
+        scheduler.idle_add, scheduler.timeout_add, scheduler.source_remove,
+        ww, wh,
+        conn.record_congestion_event, conn.encode_queue_size,
+        conn.call_in_encode_thread, conn.queue_packet,
+        GlobalPerformanceStatistics(),
+        1, window, DamageBatchConfig(), 0,
+        False, 0,
+        getVideoHelper().clone(),
+        None,
+        encodings, encodings,
+        encoding, encodings, encodings,
+        (), encoding_options, typedict(),
+        rgb_formats,
+        default_encoding_options,
+        None, 0, 0, 0)
+
+
+def replay(filename, encoding="auto", speed=1.0, latency=0):
+    from xpra.net import compression
+    compression.init_all()
+    from xpra.codecs.loader import load_codecs, get_codec
+    from xpra.codecs.video_helper import getVideoHelper
+    from xpra.queue_scheduler import QueueScheduler
+    loaded = load_codecs(encoders=True, decoders=False, csc=True, video=True, sources=False)
+    getVideoHelper().init()
+    encodings = []
+    for codec in loaded:
+        if codec.startswith("enc_"):
+            encodings += [e for e in get_codec(codec).get_encodings() if e not in encodings]
+    encodings += [e for e in getVideoHelper().get_encodings() if e not in encodings]
+    print(f"encodings available: {csv(encodings)}")
+
+    scheduler = QueueScheduler()
+    conn = ReplayConnection(scheduler, latency)
+    records = iter(read_trace(filename))
+    windows = {}
+    state = {"start" : 0, "trace-start" : None, "damage" : 0}
+
+    def window_source(header):
+        wid = header["wid"]
+        capture = ReplayCapture(header["width"], header["height"])
+        window = ReplayWindow(header, capture)
+        ws = make_window_source(scheduler, conn, window, encoding, encodings)
+        conn.window_source = ws
+        windows[wid] = (window, ws)
+        return ws
+
+    def feed():
+        for header, pixels in records:
+            rtype = header.get("type")
+            if rtype=="window":
+                #we only replay the first window:
+                if not windows:
+                    window_source(header)
+                    if pixels:
+                        windows[header["wid"]][0].capture.update(header, pixels)
+                continue
+            if rtype!="damage" or header["wid"] not in windows:
+                continue
+            window, ws = windows[header["wid"]]
+            if pixels:
+                window.capture.update(header, pixels)
+            ws.damage(header["x"], header["y"], header["width"], header["height"], header.get("options", {}))
+            state["damage"] += 1
+            #schedule the next record at the time it was recorded:
+            if state["trace-start"] is None:
+                state["trace-start"] = header["time"]
+            if speed>0:
+                elapsed = monotonic()-state["start"]
+                due = (header["time"]-state["trace-start"])/speed
+                scheduler.timeout_add(max(0, int((due-elapsed)*1000)), feed)
+            else:
+                scheduler.idle_add(feed)
+            return False
+        #end of trace, give the encoders time to flush:
+        scheduler.timeout_add(1000, scheduler.stop)
+        return False
+
+    state["start"] = monotonic()
+    scheduler.idle_add(feed)
+    scheduler.run()
+    elapsed = monotonic()-state["start"]
+    encoding_stats = []
+    for _, ws in windows.values():
+        encoding_stats += list(ws.statistics.encoding_stats)
+        ws.cleanup()
+    conn.stop()
+    report(conn.packets, encoding_stats, elapsed, state["damage"])
+
+
+def report(packets, encoding_stats, elapsed, damage):
+    print(f"replayed {damage} damage events in {elapsed:.1f} seconds, sent {len(packets)} packets")
+    for coding in sorted(set(p[0] for p in packets)):
+        cpackets = tuple(p for p in packets if p[0]==coding)
+        csize = sum(p[1] for p in cpackets)
+        cpixels = sum(p[2] for p in cpackets)
+        latencies = tuple(int(p[3]*1000) for p in cpackets)
+        etimes = tuple(s[5] for s in encoding_stats if s[1]==coding)
+        print(f"{coding:12}: {len(cpackets):6} frames, {len(cpackets)/elapsed:6.1f} fps, "
+              f"{csize//1024:8} KB, {csize*8/max(1, cpixels):.2f} bpp")
+        if etimes:
+            print(f"{'':12}  encoding time: avg={1000*sum(etimes)/len(etimes):.1f}ms, "
+                  f"total={sum(etimes):.1f}s")
+        print(f"{'':12}  latency: 50%={percentile(latencies, 50)}ms, "
+              f"90%={percentile(latencies, 90)}ms, 99%={percentile(latencies, 99)}ms")
+
+
+def main(argv):
+    assert len(argv)>1, "usage: %s TRACEFILE [--encoding=auto] [--speed=1] [--latency=0]" % argv[0]
+    options = dict(arg[2:].split("=", 1) for arg in argv[2:] if arg.startswith("--") and "=" in arg)
+    replay(argv[1],
+           encoding=options.get("encoding", "auto"),
+           speed=float(options.get("speed", 1)),
+           latency=int(options.get("latency", 0)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,11 +1,11 @@
 # This file is part of Xpra.
-# Copyright (C) 2012-2021 Antoine Martin <antoine@xpra.org>
+# Copyright (C) 2012-2023 Antoine Martin <antoine@xpra.org>
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
 #cython: wraparound=False, boundscheck=False
 
-from libc.stdint cimport uint32_t, uintptr_t  #pylint: disable=syntax-error
+from libc.stdint cimport uint64_t, uintptr_t  #pylint: disable=syntax-error
 from xpra.buffers.membuf cimport getbuf, MemBuf
 from libc.string cimport memset
 
@@ -16,6 +16,25 @@ cdef extern from "Python.h":
     int PyBUF_ANY_CONTIGUOUS
 
 
+cdef void xor_buffers(unsigned char *out, const unsigned char *a, const unsigned char *b, size_t length) nogil:
+    cdef size_t i, steps
+    if (<uintptr_t> out) % 8 or (<uintptr_t> a) % 8 or (<uintptr_t> b) % 8:
+        #unaligned access, use byte at a time slow path:
+        for i in range(length):
+            out[i] = a[i] ^ b[i]
+        return
+    #do 8 bytes at a time:
+    steps = length // 8
+    cdef uint64_t *obuf = <uint64_t*> out
+    cdef const uint64_t *abuf = <const uint64_t*> a
+    cdef const uint64_t *bbuf = <const uint64_t*> b
+    for i in range(steps):
+        obuf[i] = abuf[i] ^ bbuf[i]
+    #bytes at a time again at the end:
+    for i in range(steps*8, length):
+        out[i] = a[i] ^ b[i]
+
+
 def xor_str(a, b):
     assert len(a)==len(b), "cyxor cannot xor strings of different lengths (%s:%s vs %s:%s)" % (type(a), len(a), type(b), len(b))
     cdef Py_buffer py_bufa
@@ -38,27 +57,9 @@ def xor_str(a, b):
     cdef unsigned char *acbuf = <unsigned char *> py_bufa.buf
     cdef unsigned char *bcbuf = <unsigned char *> py_bufb.buf
     cdef unsigned char *ocbuf = <unsigned char *> op
-    cdef uint32_t *obuf = <uint32_t*> op
-    cdef uint32_t *abuf = <uint32_t*> py_bufa.buf
-    cdef uint32_t *bbuf = <uint32_t*> py_bufb.buf
-    cdef unsigned int i, j, steps, char_steps
-    if (alen % 4)!=0 or (blen % 4)!=0:
-        #unaligned access, use byte at a time slow path:
-        char_steps = alen
-        for 0 <= i < char_steps:
-            ocbuf[i] = acbuf[i] ^ bcbuf[i]
-    else:
-        #do 4 bytes at a time:
-        steps = alen // 4
-        if steps>0:
-            for 0 <= i < steps:
-                obuf[i] = abuf[i] ^ bbuf[i]
-        #bytes at a time again at the end:
-        char_steps = alen % 4
-        if char_steps>0:
-            for 0 <= i < char_steps:
-                j = alen-char_steps+i
-                ocbuf[j] = acbuf[j] ^ bcbuf[j]
+    #don't hold the GIL while we process large buffers:
+    with nogil:
+        xor_buffers(ocbuf, acbuf, bcbuf, alen)
     PyBuffer_Release(&py_bufa)
     PyBuffer_Release(&py_bufb)
     return memoryview(out_buf)
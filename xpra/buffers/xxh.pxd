@@ -3,6 +3,9 @@
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
-from libc.stdint cimport uint64_t
+from libc.stdint cimport uint8_t, uint64_t
 
 cdef uint64_t xxh3(const void* input, size_t length) nogil
+
+cdef void xxh3_rows(const uint8_t *buf, size_t row_len, size_t rowstride,
+                    unsigned int height, uint64_t *hashes) nogil
@@ -6,8 +6,11 @@
 
 # xxhash wrapper
 
-#cython: wraparound=False
-from libc.stdint cimport uint64_t
+#cython: wraparound=False, boundscheck=False
+from libc.stdint cimport uint8_t, uint64_t, uintptr_t  #pylint: disable=syntax-error
+from libc.stdlib cimport free, malloc
+
+from xpra.buffers.membuf cimport buffer_context
 
 cdef extern from "xxhash.h":
     ctypedef uint64_t XXH64_hash_t
@@ -15,3 +18,96 @@ cdef extern from "xxhash.h":
 
 cdef uint64_t xxh3(const void* input, size_t length) nogil:
     return XXH3_64bits(input, length)
+
+cdef void xxh3_rows(const uint8_t *buf, size_t row_len, size_t rowstride,
+                    unsigned int height, uint64_t *hashes) nogil:
+    cdef unsigned int i
+    for i in range(height):
+        hashes[i] = XXH3_64bits(buf, row_len)
+        buf += rowstride
+
+
+def hash_buffer(data):
+    """
+        Returns the xxh3 checksum of the whole buffer,
+        the GIL is released while hashing.
+    """
+    cdef const uint8_t *buf
+    cdef size_t length
+    cdef uint64_t h
+    if len(data)==0:
+        return XXH3_64bits(NULL, 0)
+    with buffer_context(data) as bc:
+        buf = <const uint8_t*> (<uintptr_t> int(bc))
+        length = len(bc)
+        with nogil:
+            h = XXH3_64bits(buf, length)
+    return h
+
+
+def hash_rows(pixels, unsigned int width, unsigned int height, unsigned int rowstride, unsigned int bpp=4):
+    """
+        Returns the xxh3 checksums of each row of the image,
+        all the rows are hashed in a single call without holding the GIL.
+    """
+    assert width*bpp<=rowstride, "invalid row length: %ix%i=%i but rowstride is %i" % (width, bpp, width*bpp, rowstride)
+    if height==0:
+        return []
+    cdef uint64_t *row_hashes = <uint64_t*> malloc(height*sizeof(uint64_t))
+    if row_hashes==NULL:
+        raise MemoryError("failed to allocate %i row checksums" % height)
+    cdef const uint8_t *buf
+    cdef unsigned int i
+    try:
+        with buffer_context(pixels) as bc:
+            assert len(bc)>=rowstride*(height-1)+width*bpp, "buffer length=%i is too small for %ix%i with rowstride %i" % (
+                len(bc), width, height, rowstride)
+            buf = <const uint8_t*> (<uintptr_t> int(bc))
+            with nogil:
+                xxh3_rows(buf, width*bpp, rowstride, height, row_hashes)
+        return [row_hashes[i] for i in range(height)]
+    finally:
+        free(row_hashes)
+
+
+def hash_tiles(pixels, unsigned int width, unsigned int height, unsigned int rowstride,
+               unsigned int bpp=4, unsigned int tile_size=64):
+    """
+        Returns the xxh3 checksums of all the tiles in the image,
+        ordered left to right and top to bottom.
+        The tiles on the right and bottom edges may be smaller than tile_size.
+    """
+    assert tile_size>0, "invalid tile size"
+    assert width*bpp<=rowstride, "invalid row length: %ix%i=%i but rowstride is %i" % (width, bpp, width*bpp, rowstride)
+    cdef unsigned int tiles_x = (width+tile_size-1)//tile_size
+    cdef unsigned int tiles_y = (height+tile_size-1)//tile_size
+    cdef size_t ntiles = tiles_x*tiles_y
+    if ntiles==0:
+        return []
+    cdef uint64_t *tile_hashes = <uint64_t*> malloc(ntiles*sizeof(uint64_t))
+    cdef uint64_t *row_hashes = <uint64_t*> malloc(tile_size*sizeof(uint64_t))
+    if tile_hashes==NULL or row_hashes==NULL:
+        free(tile_hashes)
+        free(row_hashes)
+        raise MemoryError("failed to allocate %i tile checksums" % ntiles)
+    cdef unsigned int tx, ty, tw, th
+    cdef size_t i
+    cdef const uint8_t *buf
+    cdef const uint8_t *row
+    try:
+        with buffer_context(pixels) as bc:
+            assert len(bc)>=rowstride*(height-1)+width*bpp, "buffer length=%i is too small for %ix%i with rowstride %i" % (
+                len(bc), width, height, rowstride)
+            buf = <const uint8_t*> (<uintptr_t> int(bc))
+            with nogil:
+                for ty in range(tiles_y):
+                    th = min(tile_size, height-ty*tile_size)
+                    for tx in range(tiles_x):
+                        tw = min(tile_size, width-tx*tile_size)
+                        row = buf + ty*tile_size*rowstride + tx*tile_size*bpp
+                        xxh3_rows(row, tw*bpp, rowstride, th, row_hashes)
+                        tile_hashes[ty*tiles_x+tx] = XXH3_64bits(row_hashes, th*sizeof(uint64_t))
+        return [tile_hashes[i] for i in range(ntiles)]
+    finally:
+        free(row_hashes)
+        free(tile_hashes)
@@ -14,7 +14,8 @@ import datetime
 import math
 from collections import deque
 from time import sleep, time, monotonic
-from queue import Queue
+from queue import Queue, Empty
+from threading import Event
 from gi.repository import GLib  # @UnresolvedImport
 
 from xpra.platform.gui import (
@@ -34,6 +35,7 @@ from xpra.util import (
     make_instance, updict, repr_ellipsized, u, noerr, first_time,
     )
 from xpra.client.base.stub_client_mixin import StubClientMixin
+from xpra.net.image_cache import ImageCache, image_key, CLIENT_IMAGE_CACHE_SIZE
 from xpra.log import Logger
 
 log = Logger("window")
@@ -95,6 +97,76 @@ SHOW_DELAY = envint("XPRA_SHOW_DELAY", -1)
 
 DRAW_TYPES = {bytes : "bytes", str : "bytes", tuple : "arrays", list : "arrays"}
 
+#decode picture updates in parallel using a pool of threads:
+DECODE_THREADS = max(0, envint("XPRA_DECODE_THREADS", 0))
+#drop picture updates that are fully covered by a more recent one still waiting in the draw queue:
+DRAW_SKIP = envbool("XPRA_DRAW_SKIP", True)
+DRAW_BATCH = max(1, envint("XPRA_DRAW_BATCH", 32))
+#stateless encodings which can be decoded in any order:
+PICTURE_ENCODINGS = ("webp", "png", "png/P", "png/L", "jpeg", "jpega", "avif", "rgb24", "rgb32")
+#video frame types that no other frame references (x264's non-reference B-frames),
+#so the decoder does not need them:
+DISPOSABLE_FRAME_TYPES = ("B", )
+
+
+def get_draw_rect(packet):
+    x, y, w, h = packet[2:6]
+    return x, y, x+w, y+h
+
+def rect_overlaps(r1, r2) -> bool:
+    return r1[0]<r2[2] and r2[0]<r1[2] and r1[1]<r2[3] and r2[1]<r1[3]
+
+def rect_contains(r1, r2) -> bool:
+    return r1[0]<=r2[0] and r1[1]<=r2[1] and r1[2]>=r2[2] and r1[3]>=r2[3]
+
+def is_opaque_picture(packet) -> bool:
+    if bytestostr(packet[0])!="draw" or bytestostr(packet[6]) not in PICTURE_ENCODINGS:
+        return False
+    options = typedict(packet[10] if len(packet)>10 else {})
+    return not options.boolget("has_alpha") and options.strget("rgb_format", "").find("A")<0
+
+def get_superseded(packets) -> set:
+    """
+        Returns the index of the picture updates which are completely
+        painted over by a more recent opaque picture update for the same window,
+        without any scroll or end-of-stream packet in between that could depend on them,
+        and of the disposable video frames followed by a more recent frame of the same video stream.
+    """
+    superseded = set()
+    #for each window, the areas that will be painted over:
+    covered = {}
+    #for each window, the encoding and area of the next video frame:
+    next_frame = {}
+    for i in range(len(packets)-1, -1, -1):
+        packet = packets[i]
+        wid = packet[1]
+        if bytestostr(packet[0])!="draw":
+            covered[wid] = []
+            next_frame.pop(wid, None)
+            continue
+        coding = bytestostr(packet[6])
+        if coding not in PICTURE_ENCODINGS:
+            #video, scroll, mmap, eos, etc:
+            covered[wid] = []
+            options = typedict(packet[10] if len(packet)>10 else {})
+            if not options.intget("frame", 0):
+                #not a video frame, or the start of a new stream:
+                next_frame.pop(wid, None)
+                continue
+            frame = coding, get_draw_rect(packet)
+            if next_frame.get(wid)==frame and options.strget("type") in DISPOSABLE_FRAME_TYPES:
+                superseded.add(i)
+            next_frame[wid] = frame
+            continue
+        rect = get_draw_rect(packet)
+        wcovered = covered.setdefault(wid, [])
+        if any(rect_contains(r, rect) for r in wcovered):
+            superseded.add(i)
+            continue
+        if is_opaque_picture(packet):
+            wcovered.append(rect)
+    return superseded
+
 
 class WindowClient(StubClientMixin):
     """
@@ -115,6 +187,12 @@ class WindowClient(StubClientMixin):
         self._draw_queue = None
         self._draw_thread = None
         self._draw_counter = 0
+        self._draw_skipped = 0
+        #optional decode threads:
+        self._decode_queue = None
+        self._decode_threads = []
+        #for each window, the picture updates being decoded by the decode threads:
+        self._decode_pending = {}
 
         #statistics and server info:
         self.pixel_counter = deque(maxlen=1000)
@@ -135,6 +213,9 @@ class WindowClient(StubClientMixin):
         self.input_devices = "auto"
 
         self.overlay_image = None
+        #png cursors and window icons, so the server can send references to them:
+        self.cursor_cache = ImageCache(CLIENT_IMAGE_CACHE_SIZE)
+        self.window_icon_cache = ImageCache(CLIENT_IMAGE_CACHE_SIZE)
 
         self.server_cursors = False
         self.client_supports_system_tray = False
@@ -269,6 +350,10 @@ class WindowClient(StubClientMixin):
     def run(self):
         #we decode pixel data in this thread
         self._draw_thread = start_thread(self._draw_thread_loop, "draw")
+        if DECODE_THREADS>0:
+            self._decode_queue = Queue()
+            for i in range(DECODE_THREADS):
+                self._decode_threads.append(start_thread(self._decode_thread_loop, f"decode-{i}", daemon=True))
         if FAKE_SUSPEND_RESUME:
             self.timeout_add(FAKE_SUSPEND_RESUME*1000, self.suspend)
             self.timeout_add(FAKE_SUSPEND_RESUME*1000*2, self.resume)
@@ -286,6 +371,10 @@ class WindowClient(StubClientMixin):
         self.cancel_lost_focus_timer()
         if dq:
             dq.put(None)
+        dcq = self._decode_queue
+        if dcq:
+            for _ in self._decode_threads:
+                dcq.put(None)
         dt = self._draw_thread
         log("WindowClient.cleanup() draw thread=%s, alive=%s", dt, dt and dt.is_alive())
         if dt and dt.is_alive():
@@ -313,6 +402,8 @@ class WindowClient(StubClientMixin):
             "min-size"      : self.min_window_size,
             "max-size"      : self.max_window_size,
             "draw-counter"  : self._draw_counter,
+            "draw-skipped"  : self._draw_skipped,
+            "decode-threads" : len(self._decode_threads),
             "read-only"     : self.readonly,
             "wheel" : {
                 "delta-x"   : int(self.wheel_deltax*1000),
@@ -352,6 +443,7 @@ class WindowClient(StubClientMixin):
         updict(caps, "window", self.get_window_caps())
         updict(caps, "encoding", {
             "eos"                       : True,
+            "image-cache"               : CLIENT_IMAGE_CACHE_SIZE,
             })
         return caps
 
@@ -518,9 +610,9 @@ class WindowClient(StubClientMixin):
     ######################################################################
     # cursor:
     def _process_cursor(self, packet):
-        if not self.cursors_enabled:
-            return
         if len(packet)==2:
+            if not self.cursors_enabled:
+                return
             #marker telling us to use the default cursor:
             new_cursor = packet[1]
         else:
@@ -530,6 +622,20 @@ class WindowClient(StubClientMixin):
             new_cursor = packet[1:]
             encoding = u(new_cursor[0])
             new_cursor[0] = encoding
+            if encoding=="cache":
+                #the server is telling us to re-use a cursor it sent before:
+                ref = u(new_cursor[8])
+                pixels = self.cursor_cache.get(ref)
+                if pixels is None:
+                    cursorlog.warn(f"Warning: cursor {ref!r} not found in the cache")
+                    return
+                new_cursor[8] = pixels
+                encoding = "png"
+            elif encoding=="png":
+                self.cursor_cache.set(image_key(new_cursor[8]), new_cursor[8])
+            #the server mirrors our cache, so it must be updated even if we don't show the cursors:
+            if not self.cursors_enabled:
+                return
             if encoding=="png":
                 pixels = new_cursor[8]
                 if SAVE_CURSORS:
@@ -1114,6 +1220,17 @@ class WindowClient(StubClientMixin):
 
     def _process_window_icon(self, packet):
         wid, w, h, coding, data = packet[1:6]
+        coding = bytestostr(coding)
+        if coding=="cache":
+            #the server is telling us to re-use an icon it sent before:
+            ref = u(data)
+            data = self.window_icon_cache.get(ref)
+            if data is None:
+                iconlog.warn(f"Warning: window icon {ref!r} not found in the cache")
+                return
+            coding = "png"
+        elif coding=="png":
+            self.window_icon_cache.set(image_key(data), data)
         img = self._window_icon_image(wid, w, h, coding, data)
         window = self._id_to_window.get(wid)
         iconlog("_process_window_icon(%s, %s, %s, %s, %s bytes) image=%s, window=%s",
@@ -1480,18 +1597,87 @@ class WindowClient(StubClientMixin):
         self.send_now(*packet)
 
     def _draw_thread_loop(self):
+        dq = self._draw_queue
         while self.exit_code is None:
-            packet = self._draw_queue.get()
-            if packet is None:
+            packets = [dq.get()]
+            #also process the packets that are already queued:
+            while packets[-1] is not None and len(packets)<DRAW_BATCH:
+                try:
+                    packets.append(dq.get_nowait())
+                except Empty:
+                    break
+            exit_marker = packets[-1] is None
+            if exit_marker:
+                packets.pop()
+            superseded = get_superseded(packets) if DRAW_SKIP and len(packets)>1 else ()
+            for i, packet in enumerate(packets):
+                if i in superseded:
+                    self._skip_draw(packet)
+                    continue
+                try:
+                    self._dispatch_draw(packet)
+                    sleep(0)
+                except Exception as e:
+                    log.error("Error '%s' processing %s packet", e, packet[0], exc_info=True)
+            if exit_marker:
                 log("draw queue found exit marker")
                 break
+        self._draw_thread = None
+        log("draw thread ended")
+
+    def _skip_draw(self, packet):
+        wid, x, y, width, height, coding = packet[1:7]
+        packet_sequence = packet[8]
+        drawlog("skipping %s draw packet %i for window %i at %s: superseded",
+                coding, packet_sequence, wid, (x, y, width, height))
+        self._draw_skipped += 1
+        self.idle_add(self.send_damage_sequence, wid, packet_sequence, width, height,
+                      WINDOW_DECODE_SKIPPED, "superseded")
+
+    def _dispatch_draw(self, packet):
+        """
+            Runs the draw packet in the draw thread,
+            or hands it over to the decode threads if it can be decoded in parallel.
+            Updates for the same window are only decoded in parallel
+            if they do not overlap and if they are not the last one of a flush sequence,
+            so that the paints are applied in the same order.
+        """
+        wid = packet[1]
+        pending = [v for v in self._decode_pending.get(wid, ()) if not v[2].is_set()]
+        parallel = self._decode_queue is not None and bytestostr(packet[0])=="draw" and \
+            bytestostr(packet[6]) in PICTURE_ENCODINGS
+        if parallel:
+            rect = get_draw_rect(packet)
+            options = packet[10] if len(packet)>10 else {}
+            flush = typedict(options).intget("flush", 0)
+            wait = tuple(event for prect, pflush, event in pending if rect_overlaps(prect, rect) or (flush==0 and pflush>0))
+        else:
+            wait = tuple(event for _, _, event in pending)
+        for event in wait:
+            event.wait()
+        if not parallel:
+            self._decode_pending.pop(wid, None)
+            self._do_draw(packet)
+            return
+        event = Event()
+        pending = [v for v in pending if not v[2].is_set()]
+        pending.append((rect, flush, event))
+        self._decode_pending[wid] = pending
+        self._decode_queue.put((packet, event))
+
+    def _decode_thread_loop(self):
+        while self.exit_code is None:
+            item = self._decode_queue.get()
+            if item is None:
+                break
+            packet, event = item
             try:
                 self._do_draw(packet)
-                sleep(0)
             except Exception as e:
                 log.error("Error '%s' processing %s packet", e, packet[0], exc_info=True)
-        self._draw_thread = None
-        log("draw thread ended")
+            finally:
+                event.set()
+        log("decode thread ended")
 
     def _do_draw(self, packet):
         """ this runs from the draw thread above """
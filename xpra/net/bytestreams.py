@@ -32,6 +32,9 @@ VSOCK_TIMEOUT = envint("XPRA_VSOCK_TIMEOUT", 5)
 SOCKET_TIMEOUT = envint("XPRA_SOCKET_TIMEOUT", 20)
 #this is more proper but would break the proxy server:
 SOCKET_SHUTDOWN = envbool("XPRA_SOCKET_SHUTDOWN", False)
+SOCKET_SENDMSG = envbool("XPRA_SOCKET_SENDMSG", True)
+#maximum number of buffers for a single vectored write (UIO_MAXIOV on Linux):
+IOV_MAX = envint("XPRA_IOV_MAX", 1024)
 LOG_TIMEOUTS = envint("XPRA_LOG_TIMEOUTS", 1)
 
 ABORT = {
@@ -150,6 +153,14 @@ class Connection:
         #not implemented
         return b""
 
+    def can_writev(self) -> bool:
+        """ connections that support vectored I/O override this method """
+        return False
+
+    def can_readinto(self) -> bool:
+        """ connections that can read into an existing buffer override this method """
+        return False
+
     def _write(self, *args):
         """ wraps do_write with packet accounting """
         w = self.untilConcludes(*args)
@@ -164,6 +175,13 @@ class Connection:
         self.input_readcount += 1
         return r
 
+    def _readinto(self, *args):
+        """ same as _read, but for functions that return the number of bytes read """
+        n = self.untilConcludes(*args)
+        self.input_bytecount += n or 0
+        self.input_readcount += 1
+        return n
+
     def get_info(self) -> dict:
         info = self.info.copy()
         if self.socktype_wrapped!=self.socktype:
@@ -344,9 +362,27 @@ class SocketConnection(Connection):
     def read(self, n : int):
         return self._read(self._socket.recv, n)
 
+    def can_readinto(self) -> bool:
+        #not for SSL sockets, ssh channels or sockets with peeked data (SocketPeekWrapper):
+        return type(self._socket) is socket.socket
+
+    def readinto(self, buf):
+        return self._readinto(self._socket.recv_into, buf)
+
     def write(self, buf, packet_type=None):
         return self._write(self._socket.send, buf)
 
+    def can_writev(self) -> bool:
+        sock = self._socket
+        if isinstance(sock, SocketPeekWrapper):
+            sock = sock.socket
+        #only plain sockets can use sendmsg,
+        #SSL sockets and ssh channels can't:
+        return SOCKET_SENDMSG and type(sock) is socket.socket and hasattr(sock, "sendmsg")
+
+    def writev(self, buffers, packet_type=None):
+        return self._write(self._socket.sendmsg, buffers[:IOV_MAX])
+
     def close(self):
         s = self._socket
         log(f"{self}.close() socket={s}")
@@ -15,6 +15,8 @@ class ConnectionClosedException(Exception):
 
 MAX_PACKET_SIZE = envint("XPRA_MAX_PACKET_SIZE", 16*1024*1024)
 FLUSH_HEADER = envbool("XPRA_FLUSH_HEADER", True)
+#large chunks are sent in fragments of this size, zero disables fragmentation:
+FRAGMENT_SIZE = envint("XPRA_FRAGMENT_SIZE", 64*1024)
 
 SOCKET_TYPES = ("tcp", "ws", "wss", "ssl", "ssh", "rfb", "vsock", "socket", "named-pipe", "quic")
 
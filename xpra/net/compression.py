@@ -5,18 +5,50 @@
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
+import os
+import threading
+from hashlib import sha1
 from collections import namedtuple
 
-from xpra.util import envbool
+from xpra.util import envbool, envint, typedict
 from xpra.common import MIN_COMPRESS_SIZE, MAX_DECOMPRESSED_SIZE
 
 
 #all the compressors we know about, in best compatibility order:
-ALL_COMPRESSORS = ("lz4", "zlib", "brotli", "none")
+ALL_COMPRESSORS = ("lz4", "zlib", "brotli", "zstd", "none")
 #order for performance:
-PERFORMANCE_ORDER = ("none", "lz4", "zlib", "brotli")
+PERFORMANCE_ORDER = ("none", "zstd", "lz4", "zlib", "brotli")
 #require compression (disallow 'none'):
-PERFORMANCE_COMPRESSION = ("lz4", "zlib", "brotli")
+PERFORMANCE_COMPRESSION = ("lz4", "zstd", "zlib", "brotli")
+
+#path to a dictionary trained on packet data (ie: using `zstd --train`),
+#empty to use the builtin dictionary, or "none" to disable dictionaries:
+ZSTD_DICTIONARY = os.environ.get("XPRA_ZSTD_DICTIONARY", "")
+#only use the dictionary for packets smaller than this:
+ZSTD_DICTIONARY_MAX_SIZE = envint("XPRA_ZSTD_DICTIONARY_MAX_SIZE", 16*1024)
+#strings found in most small control packets (pointer-position, cursor, window-metadata, etc),
+#used as a raw content dictionary when we don't have a trained one,
+#changing this list changes the dictionary id,
+#so that peers with a different version will not use it:
+ZSTD_DICTIONARY_STRINGS = (
+    "window-metadata", "title", "class-instance", "window-type", "_NET_WM_WINDOW_TYPE_NORMAL",
+    "_NET_WM_WINDOW_TYPE_DIALOG", "size-constraints", "minimum-size", "maximum-size", "base-size",
+    "increment", "gravity", "transient-for", "fullscreen", "maximized", "iconic", "above", "below",
+    "sticky", "shaded", "skip-taskbar", "skip-pager", "decorations", "opacity", "role", "modal",
+    "content-type", "has-alpha", "override-redirect", "group-leader", "frame", "workspace",
+    "command", "pid", "focused", "bypass-compositor", "relative-position", "parent", "children",
+    "cursor", "png", "default", "left_ptr", "xterm", "watch", "hand2", "fleur", "sb_h_double_arrow",
+    "sb_v_double_arrow", "top_left_corner", "bottom_right_corner", "text",
+    "damage-sequence", "ping", "ping_echo", "focus", "key-action", "buffer-refresh",
+    "configure-window", "map-window", "unmap-window", "close-window", "bell", "logging",
+    "button-action", "pointer-button", "pointer-position", "pointer", "modifiers", "shift", "control",
+    "mod2", "lock", "buttons", "wheel", "relative-pointer", "screen-size", "bpp",
+    )
+
+#the id of the zstd dictionary we have loaded, if any,
+#and the compression function that uses it:
+ZSTD_DICTIONARY_ID = ""
+ZSTD_DICTIONARY_COMPRESS = None
 
 Compression = namedtuple("Compression", ["name", "version", "compress", "decompress"])
 
@@ -70,6 +102,67 @@ def init_zlib():
         return v
     return Compression("zlib", zlib.__version__, zlib_compress, zlib_decompress)  # @UndefinedVariable
 
+def load_zstd_dictionary():
+    #pylint: disable=import-outside-toplevel
+    from zstandard import ZstdCompressionDict, DICT_TYPE_RAWCONTENT, DICT_TYPE_AUTO
+    if ZSTD_DICTIONARY.lower() in ("none", "no", "0", "off"):
+        return "", None
+    if ZSTD_DICTIONARY:
+        with open(ZSTD_DICTIONARY, "rb") as f:
+            data = f.read()
+        dict_type = DICT_TYPE_AUTO
+    else:
+        data = "\0".join(ZSTD_DICTIONARY_STRINGS).encode("latin1")
+        dict_type = DICT_TYPE_RAWCONTENT
+    dict_id = sha1(data).hexdigest()[:16]
+    return dict_id, ZstdCompressionDict(data, dict_type=dict_type)
+
+def init_zstd():
+    #pylint: disable=import-outside-toplevel
+    global ZSTD_DICTIONARY_ID, ZSTD_DICTIONARY_COMPRESS
+    import zstandard
+    from xpra.net.protocol.header import ZSTD_FLAG
+    try:
+        dict_id, zdict = load_zstd_dictionary()
+    except (OSError, ValueError, zstandard.ZstdError) as e:
+        from xpra.log import Logger
+        Logger("network", "protocol").warn(f"Warning: failed to load zstd dictionary {ZSTD_DICTIONARY!r}: {e}")
+        dict_id, zdict = "", None
+    ZSTD_DICTIONARY_ID = dict_id
+    ZSTD_DICTIONARY_COMPRESS = None
+    #zstd compressor and decompressor objects cannot be shared between threads:
+    tls = threading.local()
+    def get_context(key, make):
+        contexts = tls.__dict__.setdefault("contexts", {})
+        ctx = contexts.get(key)
+        if ctx is None:
+            ctx = contexts[key] = make()
+        return ctx
+    def compress(packet, level, dictionary=False):
+        level = min(15, max(1, level))
+        if not isinstance(packet, (bytes, bytearray, memoryview)):
+            packet = bytes(str(packet), 'UTF-8')
+        use_dict = bool(dictionary and zdict and len(packet)<=ZSTD_DICTIONARY_MAX_SIZE)
+        def make():
+            if use_dict:
+                return zstandard.ZstdCompressor(level=level, dict_data=zdict)
+            return zstandard.ZstdCompressor(level=level)
+        return level | ZSTD_FLAG, get_context((level, use_dict), make).compress(packet)
+    def zstd_compress(packet, level):
+        return compress(packet, level)
+    def zstd_dict_compress(packet, level):
+        return compress(packet, level, True)
+    def zstd_decompress(data):
+        #frames compressed without the dictionary decompress just fine with it:
+        def make():
+            if zdict:
+                return zstandard.ZstdDecompressor(dict_data=zdict)
+            return zstandard.ZstdDecompressor()
+        return get_context("decompress", make).decompress(data, max_output_size=MAX_DECOMPRESSED_SIZE)
+    if zdict:
+        ZSTD_DICTIONARY_COMPRESS = zstd_dict_compress
+    return Compression("zstd", zstandard.__version__, zstd_compress, zstd_decompress)
+
 def init_none():
     def nocompress(packet, _level):
         if not isinstance(packet, bytes):
@@ -113,15 +206,22 @@ def get_compression_caps(full_info : int=1) -> dict:
         if full_info>1 and c.version:
             ccaps["version"] = c.version
         ccaps[""] = True
+        if x=="zstd" and ZSTD_DICTIONARY_ID:
+            ccaps["dictionary"] = ZSTD_DICTIONARY_ID
     return caps
 
 def get_enabled_compressors(order=ALL_COMPRESSORS):
     return tuple(x for x in order if x in COMPRESSION)
 
-def get_compressor(name):
+def get_compressor(name, remote_caps=None):
     c = COMPRESSION.get(name)
     if c is None:
         raise ValueError(f"{name!r} compression is not supported")
+    if name=="zstd" and remote_caps is not None and ZSTD_DICTIONARY_COMPRESS:
+        #we can use the dictionary if the remote end has the same one:
+        zcaps = typedict(remote_caps.dictget("zstd") or {})
+        if zcaps.strget("dictionary")==ZSTD_DICTIONARY_ID:
+            return ZSTD_DICTIONARY_COMPRESS
     return c.compress
 
 
@@ -199,23 +299,18 @@ class InvalidCompressionException(Exception):
 
 
 def get_compression_type(level) -> str:
-    from xpra.net.protocol.header import LZ4_FLAG, BROTLI_FLAG
+    from xpra.net.protocol.header import LZ4_FLAG, BROTLI_FLAG, ZSTD_FLAG
     if level & LZ4_FLAG:
         return "lz4"
     if level & BROTLI_FLAG:
         return "brotli"
+    if level & ZSTD_FLAG:
+        return "zstd"
     return "zlib"
 
 
 def decompress(data, level):
-    from xpra.net.protocol.header import LZ4_FLAG, BROTLI_FLAG
-    if level & LZ4_FLAG:
-        algo = "lz4"
-    elif level & BROTLI_FLAG:
-        algo = "brotli"
-    else:
-        algo = "zlib"
-    return decompress_by_name(data, algo)
+    return decompress_by_name(data, get_compression_type(level))
 
 def decompress_by_name(data, algo):
     c = COMPRESSION.get(algo)
@@ -5,6 +5,7 @@
 # later version. See the file COPYING for details.
 
 import os
+import mmap
 import subprocess
 import hashlib
 import uuid
@@ -24,6 +25,10 @@ filelog = Logger("file")
 
 DELETE_PRINTER_FILE = envbool("XPRA_DELETE_PRINTER_FILE", True)
 FILE_CHUNKS_SIZE = max(0, envint("XPRA_FILE_CHUNKS_SIZE", 65536))
+#how many chunks we can send without waiting for an ack:
+FILE_CHUNKS_WINDOW = max(1, envint("XPRA_FILE_CHUNKS_WINDOW", 4))
+FILE_CHUNKS_MMAP = envbool("XPRA_FILE_CHUNKS_MMAP", True)
+DIGEST_READ_SIZE = 1024*1024
 MAX_CONCURRENT_FILES = max(1, envint("XPRA_MAX_CONCURRENT_FILES", 10))
 PRINT_JOB_TIMEOUT = max(60, envint("XPRA_PRINT_JOB_TIMEOUT", 3600))
 SEND_REQUEST_TIMEOUT = max(300, envint("XPRA_SEND_REQUEST_TIMEOUT", 3600))
@@ -109,13 +114,94 @@ class ReceiveChunkState:
     send_id: str
     timer: int
     chunk: str
+
+class FileChunkReader:
+    """
+        Gives access to the file data we want to send, one chunk at a time.
+        The data is either an in-memory buffer,
+        or it is read from the file on demand, using mmap if available,
+        so that we never need to load large files in memory.
+    """
+    __slots__ = ("filename", "size", "data", "fd", "mmap")
+
+    def __init__(self, filename:str, data=None, size:int=0):
+        self.filename = filename
+        self.fd = -1
+        self.mmap = None
+        if data is not None:
+            self.data = memoryview(data)
+            self.size = size or len(data)
+            return
+        self.data = None
+        self.fd = os.open(filename, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            self.size = size or os.fstat(self.fd).st_size
+            if FILE_CHUNKS_MMAP and self.size>0:
+                try:
+                    self.mmap = mmap.mmap(self.fd, self.size, access=mmap.ACCESS_READ)
+                except (OSError, ValueError):
+                    filelog("mmap failed for %r, using regular reads", filename, exc_info=True)
+        except OSError:
+            self.close()
+            raise
+
+    def __repr__(self):
+        if self.data is not None:
+            return f"FileChunkReader({self.size} bytes in memory)"
+        return f"FileChunkReader({self.filename!r}, {self.size} bytes, mmap={bool(self.mmap)})"
+
+    def read(self, position:int, size:int):
+        size = max(0, min(size, self.size-position))
+        if self.data is not None:
+            #zero copy:
+            return self.data[position:position+size]
+        if self.mmap is not None:
+            #copy just this chunk so the mapping can be closed
+            #even if the packet is still queued:
+            return self.mmap[position:position+size]
+        if hasattr(os, "pread"):
+            return os.pread(self.fd, size, position)
+        os.lseek(self.fd, position, os.SEEK_SET)
+        return os.read(self.fd, size)
+
+    def digest(self, hash_fn="sha256"):
+        h = getattr(hashlib, hash_fn)()
+        position = 0
+        while position<self.size:
+            chunk = self.read(position, DIGEST_READ_SIZE)
+            if not chunk:
+                raise OSError(f"failed to read {self.filename!r} at position {position}")
+            h.update(chunk)
+            position += len(chunk)
+        return h
+
+    def close(self):
+        self.data = None
+        m = self.mmap
+        if m:
+            self.mmap = None
+            try:
+                m.close()
+            except (OSError, BufferError):
+                filelog("failed to close mmap %s", m, exc_info=True)
+        fd = self.fd
+        if fd>=0:
+            self.fd = -1
+            osclose(fd)
+
+
 @dataclass
 class SendChunkState:
     start: float
-    data: object
+    reader: FileChunkReader
     chunk_size: int
     timer: int
+    #the last chunk number sent:
     chunk: int
+    #the last chunk number acknowledged by the remote end:
+    acked: int = -1
+    #how much file data has been sent so far:
+    position: int = 0
 
 
 class FileTransferAttributes:
@@ -189,6 +275,7 @@ class FileTransferAttributes:
                 "ask"               : self.file_transfer_ask,
                 "size-limit"        : self.file_size_limit,
                 "chunks"            : self.file_chunks,
+                "chunks-window"     : FILE_CHUNKS_WINDOW,
                 "open"              : self.open_files,
                 "open-ask"          : self.open_files_ask,
                 "open-url"          : self.open_url,
@@ -237,6 +324,8 @@ class FileTransferHandler(FileTransferAttributes):
             t = v[-2]
             self.source_remove(t)
         self.receive_chunks_in_progress = {}
+        for chunk_id in tuple(self.send_chunks_in_progress.keys()):
+            self.cancel_sending(chunk_id)
         for x in tuple(self.file_descriptors):
             try:
                 os.close(x)
@@ -753,6 +842,11 @@ class FileTransferHandler(FileTransferAttributes):
 
     def send_file(self, filename, mimetype, data, filesize=0,
                   printit=False, openit=False, options=None):
+        """
+            Send a file to the remote end.
+            If `data` is None, the file contents are read from `filename`
+            one chunk at a time as the transfer progresses.
+        """
         if printit:
             l = printlog
             if not self.printing:
@@ -782,8 +876,18 @@ class FileTransferHandler(FileTransferAttributes):
                 else:
                     ask |= self.remote_open_files_ask
                     action = "open"
-        assert len(data)>=filesize, "data is smaller then the given file size!"
-        data = data[:filesize]          #gio may null terminate it
+        if data is None:
+            #the file contents will be read from disk when we send it:
+            if filesize<=0:
+                try:
+                    filesize = os.stat(filename).st_size
+                except OSError as e:
+                    l.error(f"Error: cannot {action} {filename!r}")
+                    l.estr(e)
+                    return False
+        else:
+            assert len(data)>=filesize, "data is smaller then the given file size!"
+            data = data[:filesize]          #gio may null terminate it
         l("send_file%s action=%s, ask=%s",
           (filename, mimetype, type(data), f"{filesize} bytes", printit, openit, options), action, ask)
         self.dump_remote_caps()
@@ -933,9 +1037,16 @@ class FileTransferHandler(FileTransferAttributes):
         l("do_send_file%s", (u(filename), mimetype, type(data), f"{filesize} bytes", printit, openit, options))
         if not self.check_file_size(action, filename, filesize):
             return False
-        h = hashlib.sha256()
-        h.update(data)
         absfile = os.path.abspath(filename)
+        try:
+            reader = FileChunkReader(absfile, data, filesize)
+            h = reader.digest("sha256")
+        except OSError as e:
+            l("do_send_file(%s, ..)", u(filename), exc_info=True)
+            l.error(f"Error: cannot {action} {filename!r}")
+            l.estr(e)
+            return False
+        filesize = reader.size
         filelog("sha256 digest('%s')=%s", u(absfile), h.hexdigest())
         options = options or {}
         options["sha256"] = h.hexdigest()
@@ -943,6 +1054,7 @@ class FileTransferHandler(FileTransferAttributes):
         if 0<chunk_size<filesize:
             in_progress = len(self.send_chunks_in_progress)
             if in_progress>=MAX_CONCURRENT_FILES:
+                reader.close()
                 raise Exception(f"too many file transfers in progress: {in_progress}")
             #chunking is supported and the file is big enough
             chunk_id = uuid.uuid4().hex
@@ -950,13 +1062,16 @@ class FileTransferHandler(FileTransferAttributes):
             #timer to check that the other end is requesting more chunks:
             chunk_no = 0
             timer = self.timeout_add(CHUNK_TIMEOUT, self._check_chunk_sending, chunk_id, chunk_no)
-            self.send_chunks_in_progress[chunk_id] = SendChunkState(monotonic(), data, chunk_size, timer, chunk_no)
+            self.send_chunks_in_progress[chunk_id] = SendChunkState(monotonic(), reader, chunk_size, timer, chunk_no)
             cdata = b""
-            filelog("using chunks, sending initial file-chunk-id=%s, for chunk size=%s",
-                    chunk_id, chunk_size)
+            filelog("using chunks, sending initial file-chunk-id=%s, for chunk size=%s, window=%i",
+                    chunk_id, chunk_size, FILE_CHUNKS_WINDOW)
         else:
             #send everything now:
-            cdata = self.compressed_wrapper("file-data", data)
+            try:
+                cdata = self.compressed_wrapper("file-data", reader.read(0, filesize))
+            finally:
+                reader.close()
             assert len(cdata)<=filesize     #compressed wrapper ensures this is true
             filelog("sending full file: %i bytes (chunk size=%i)", filesize, chunk_size)
         basefilename = os.path.basename(filename)
@@ -970,7 +1085,7 @@ class FileTransferHandler(FileTransferAttributes):
             #transfer already removed
             return
         chunk_state.timer = 0         #timer has fired
-        if chunk_state.chunk==chunk_no:
+        if max(0, chunk_state.acked)==chunk_no:
             filelog.error(f"Error: chunked file transfer {chunk_id} timed out")
             filelog.error(f" on chunk {chunk_no}")
             self.cancel_sending(chunk_id)
@@ -984,6 +1099,7 @@ class FileTransferHandler(FileTransferAttributes):
         if timer:
             chunk_state.timer = 0
             self.source_remove(timer)
+        chunk_state.reader.close()
 
     def _process_ack_file_chunk(self, packet):
         #the other end received our send-file or send-file-chunk,
@@ -1000,28 +1116,51 @@ class FileTransferHandler(FileTransferAttributes):
         if not chunk_state:
             filelog.error(f"Error: cannot find the file transfer id {chunk_id!r}")
             return
-        if chunk_state.chunk!=chunk:
-            filelog.error("Error: chunk number mismatch (%i vs %i)", chunk_state.chunk, chunk)
+        #acks must arrive in order, and only for chunks we have sent:
+        if chunk!=chunk_state.acked+1 or chunk>chunk_state.chunk:
+            filelog.error("Error: chunk number mismatch (%i vs %i)", chunk_state.acked+1, chunk)
             self.cancel_sending(chunk_id)
             return
+        chunk_state.acked = chunk
+        if chunk_state.timer:
+            self.source_remove(chunk_state.timer)
+            chunk_state.timer = 0
         chunk_size = chunk_state.chunk_size
-        if not chunk_state.data:
+        filesize = chunk_state.reader.size
+        if chunk_state.position>=filesize:
+            if chunk<chunk_state.chunk:
+                #still waiting for the last acks:
+                chunk_state.timer = self.timeout_add(CHUNK_TIMEOUT, self._check_chunk_sending, chunk_id, chunk)
+                return
             #all sent!
             elapsed = monotonic()-chunk_state.start
             filelog("%i chunks of %i bytes sent in %ims (%sB/s)",
-                    chunk, chunk_size, elapsed*1000, std_unit(chunk*chunk_size/elapsed))
+                    chunk, chunk_size, elapsed*1000, std_unit(filesize/max(0.001, elapsed)))
             self.cancel_sending(chunk_id)
             return
         assert chunk_size>0
-        #carve out another chunk:
-        cdata = self.compressed_wrapper("file-data", chunk_state.data[:chunk_size])
-        chunk_state.data = chunk_state.data[chunk_size:]
-        chunk += 1
-        chunk_state.chunk = chunk
-        if chunk_state.timer:
-            self.source_remove(chunk_state.timer)
         chunk_state.timer = self.timeout_add(CHUNK_TIMEOUT, self._check_chunk_sending, chunk_id, chunk)
-        self.send("send-file-chunk", chunk_id, chunk, cdata, bool(chunk_state.data))
+        self.send_file_chunks(chunk_id, chunk_state)
+
+    def send_file_chunks(self, chunk_id, chunk_state):
+        #keep up to FILE_CHUNKS_WINDOW chunks in flight:
+        reader = chunk_state.reader
+        while chunk_state.position<reader.size and chunk_state.chunk-chunk_state.acked<FILE_CHUNKS_WINDOW:
+            try:
+                data = reader.read(chunk_state.position, chunk_state.chunk_size)
+                if not data:
+                    raise OSError(f"no data at position {chunk_state.position}")
+            except OSError as e:
+                filelog("send_file_chunks(%s, %s)", chunk_id, chunk_state, exc_info=True)
+                filelog.error(f"Error reading file data for transfer {chunk_id}")
+                filelog.estr(e)
+                self.cancel_sending(chunk_id)
+                return
+            #carve out another chunk:
+            cdata = self.compressed_wrapper("file-data", data)
+            chunk_state.position += len(data)
+            chunk_state.chunk += 1
+            self.send("send-file-chunk", chunk_id, chunk_state.chunk, cdata, chunk_state.position<reader.size)
 
     def send(self, *parts):
         raise NotImplementedError()
@@ -5,15 +5,18 @@
 
 import os
 import glob
+import shutil
 import posixpath
 import mimetypes
+from threading import Lock
+from collections import OrderedDict
 from urllib.parse import unquote
 from http.server import BaseHTTPRequestHandler
 
 from xpra.common import DEFAULT_XDG_DATA_DIRS
 from xpra.net.http.directory_listing import list_directory
 from xpra.net.bytestreams import pretty_socket
-from xpra.util import envbool, std, csv, AdHocStruct, repr_ellipsized
+from xpra.util import envint, envbool, std, csv, AdHocStruct, repr_ellipsized
 from xpra.platform.paths import get_desktop_background_paths
 from xpra.log import Logger
 
@@ -21,6 +24,10 @@ log = Logger("http")
 
 HTTP_ACCEPT_ENCODING = os.environ.get("XPRA_HTTP_ACCEPT_ENCODING", "br,gzip").split(",")
 DIRECTORY_LISTING = envbool("XPRA_HTTP_DIRECTORY_LISTING", False)
+#maximum size of the in-memory cache of encoded responses, in MB:
+HTTP_CACHE_SIZE = envint("XPRA_HTTP_CACHE_SIZE", 32)*1024*1024
+#uncompressed files larger than this are sent using sendfile:
+HTTP_SENDFILE_SIZE = envint("XPRA_HTTP_SENDFILE_SIZE", 256*1024)
 
 AUTH_REALM = os.environ.get("XPRA_HTTP_AUTH_REALM", "Xpra")
 AUTH_USERNAME = os.environ.get("XPRA_HTTP_AUTH_USERNAME")
@@ -135,75 +142,195 @@ def translate_path(path, web_root="/usr/share/xpra/www"):
     log("translate_path(%s)=%s", s, path)
     return path
 
-def load_path(headers, path):
+class ContentCache:
+    """
+        LRU cache of the encoded responses,
+        keyed by path, modification time, size and encoding.
+        A file that is modified gets a new key,
+        so its stale entries just age out of the cache.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_info(self) -> dict:
+        return {
+            "entries"   : len(self.entries),
+            "size"      : self.size,
+            "max-size"  : self.max_size,
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            }
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, headers, content):
+        l = len(content)
+        #don't let a single file evict most of the cache:
+        if l>self.max_size//4:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old:
+                self.size -= len(old[1])
+            self.entries[key] = (headers, content)
+            self.size += l
+            while self.size>self.max_size:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+content_cache = ContentCache(HTTP_CACHE_SIZE)
+
+
+def make_etag(st, encoding="") -> str:
+    etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+    if encoding:
+        etag += f"-{encoding}"
+    return f'"{etag}"'
+
+def etag_matches(headers, etag) -> bool:
+    if_none_match = headers.get("if-none-match", "")
+    if not if_none_match:
+        return False
+    if if_none_match.strip()=="*":
+        return True
+    #ignore the weak validator prefix, we only ever generate strong etags:
+    return etag in (x.strip().replace("W/", "", 1) for x in if_none_match.split(","))
+
+def get_content_type(path) -> str:
     ext = os.path.splitext(path)[1]
-    extra_headers = {}
+    content_type = EXTENSION_TO_MIMETYPE.get(ext)
+    if not content_type:
+        if not mimetypes.inited:
+            mimetypes.init()
+        ctype = mimetypes.guess_type(path, False)
+        if ctype and ctype[0]:
+            content_type = ctype[0]
+    log("guess_type(%s)=%s", path, content_type)
+    return content_type
+
+def find_precompressed(path, accept):
+    for enc in HTTP_ACCEPT_ENCODING:
+        #find a matching pre-compressed file:
+        if enc not in accept:
+            continue
+        compressed_path = f"{path}.{enc}"       #ie: "/path/to/index.html.br"
+        if not os.path.exists(compressed_path):
+            continue
+        if not os.path.isfile(compressed_path):
+            log.warn(f"Warning: {compressed_path!r} is not a file!")
+            continue
+        if not os.access(compressed_path, os.R_OK):
+            log.warn(f"Warning: {compressed_path!r} is not readable")
+            continue
+        st = os.stat(compressed_path)
+        if st.st_size==0:
+            log.warn(f"Warning: {compressed_path!r} is empty")
+            continue
+        return enc, compressed_path, st
+    return None
+
+def read_file(path, st) -> bytes:
+    # Always read in binary mode. Opening files in text mode may cause
+    # newline translations, making the actual size of the content
+    # transmitted *less* than the content-length!
     with open(path, "rb") as f:
-        # Always read in binary mode. Opening files in text mode may cause
-        # newline translations, making the actual size of the content
-        # transmitted *less* than the content-length!
-        fs = os.fstat(f.fileno())
-        content_length = fs[6]
-        content_type = EXTENSION_TO_MIMETYPE.get(ext)
-        if not content_type:
-            if not mimetypes.inited:
-                mimetypes.init()
-            ctype = mimetypes.guess_type(path, False)
-            if ctype and ctype[0]:
-                content_type = ctype[0]
-        log("guess_type(%s)=%s", path, content_type)
+        content = f.read()
+    if len(content)!=st.st_size:
+        raise RuntimeError(f"expected {path!r} to contain {st.st_size} bytes"+
+                           f" but read {len(content)} bytes")
+    return content
+
+def gzip_content(path, content) -> bytes:
+    import zlib  # pylint: disable=import-outside-toplevel
+    gzip_compress = zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    compressed_content = gzip_compress.compress(content) + gzip_compress.flush()
+    log("gzip compressed '%s': %i down to %i bytes", path, len(content), len(compressed_content))
+    return compressed_content
+
+def load_path(headers, path, sendfile=False):
+    """
+        Returns the response code, headers and content for this file,
+        the content is encoded according to the 'accept-encoding' header,
+        using a pre-compressed file if there is one.
+        Replies with a 304 if the 'if-none-match' header matches the etag.
+        When `sendfile` is set, large files that are sent uncompressed
+        are returned as an open file object rather than being read in memory.
+    """
+    st = os.stat(path)
+    accept = headers.get('accept-encoding', '').split(",")
+    accept = tuple(x.split(";")[0].strip() for x in accept)
+    log("accept-encoding=%s", csv(accept))
+    precompressed = find_precompressed(path, accept)
+    if precompressed:
+        enc, source_path, source_st = precompressed
+    else:
+        source_path, source_st = path, st
+        gzip = st.st_size>128 and ("gzip" in accept) and ("gzip" in HTTP_ACCEPT_ENCODING) \
+            and os.path.splitext(path)[1] not in (".png", )
+        enc = "gzip" if gzip else ""
+    key = (path, st.st_mtime_ns, st.st_size, enc, source_st.st_mtime_ns, source_st.st_size)
+    entry = content_cache.get(key)
+    content = None
+    if entry:
+        extra_headers, content = entry
+        extra_headers = extra_headers.copy()
+    elif sendfile and not enc and st.st_size>=HTTP_SENDFILE_SIZE:
+        #large uncompressed file, don't keep it in memory:
+        extra_headers = {
+            "ETag"              : make_etag(st),
+            "Content-Length"    : st.st_size,
+            }
+    else:
+        content = read_file(source_path, source_st)
+        if precompressed:
+            log("sending pre-compressed file '%s'", source_path)
+        elif enc=="gzip":
+            compressed_content = gzip_content(path, content)
+            if len(compressed_content)<len(content):
+                content = compressed_content
+            else:
+                enc = ""
+        extra_headers = {
+            "ETag"              : make_etag(source_st, enc),
+            "Content-Length"    : len(content),
+            }
+        if enc:
+            extra_headers["Content-Encoding"] = enc
+        content_type = get_content_type(path)
         if content_type:
             extra_headers["Content-type"] = content_type
-        accept = headers.get('accept-encoding', '').split(",")
-        accept = tuple(x.split(";")[0].strip() for x in accept)
-        content = None
-        log("accept-encoding=%s", csv(accept))
-        for enc in HTTP_ACCEPT_ENCODING:
-            #find a matching pre-compressed file:
-            if enc not in accept:
-                continue
-            compressed_path = f"{path}.{enc}"       #ie: "/path/to/index.html.br"
-            if not os.path.exists(compressed_path):
-                continue
-            if not os.path.isfile(compressed_path):
-                log.warn(f"Warning: {compressed_path!r} is not a file!")
-                continue
-            if not os.access(compressed_path, os.R_OK):
-                log.warn(f"Warning: {compressed_path!r} is not readable")
-                continue
-            st = os.stat(compressed_path)
-            if st.st_size==0:
-                log.warn(f"Warning: {compressed_path!r} is empty")
-                continue
-            log("sending pre-compressed file '%s'", compressed_path)
-            #read pre-gzipped file:
-            with open(compressed_path, "rb") as cf:
-                content = cf.read()
-            assert content, f"no data in {compressed_path!r}"
-            extra_headers["Content-Encoding"] = enc
-            break
-        if not content:
-            content = f.read()
-            if len(content)!=content_length:
-                raise RuntimeError(f"expected {path!r} to contain {content_length} bytes"+
-                                   f" but read {len(content)} bytes")
-            if content_length>128 and \
-            ("gzip" in accept) and \
-            ("gzip" in HTTP_ACCEPT_ENCODING) \
-            and (ext not in (".png", )):
-                #gzip it on the fly:
-                import zlib  # pylint: disable=import-outside-toplevel
-                gzip_compress = zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS | 16)
-                compressed_content = gzip_compress.compress(content) + gzip_compress.flush()
-                if len(compressed_content)<content_length:
-                    log("gzip compressed '%s': %i down to %i bytes", path, content_length, len(compressed_content))
-                    extra_headers["Content-Encoding"] = "gzip"
-                    content = compressed_content
-        extra_headers.update({
-            "Content-Length"    : len(content),
-            "Last-Modified"     : fs.st_mtime,
-            })
-        return 200, extra_headers, content
+        content_cache.set(key, extra_headers.copy(), content)
+    extra_headers["Last-Modified"] = st.st_mtime
+    if "gzip" in HTTP_ACCEPT_ENCODING or precompressed:
+        extra_headers["Vary"] = "Accept-Encoding"
+    if etag_matches(headers, extra_headers["ETag"]):
+        log("etag %s matches, sending 304 for %r", extra_headers["ETag"], path)
+        extra_headers.pop("Content-Length", None)
+        return 304, extra_headers, None
+    if content is None:
+        content_type = get_content_type(path)
+        if content_type:
+            extra_headers["Content-type"] = content_type
+        return 200, extra_headers, open(path, "rb")
+    return 200, extra_headers, content
 
 
 class HTTPRequestHandler(BaseHTTPRequestHandler):
@@ -328,6 +455,9 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
         if not self.handle_authentication():
             return
         content = self.send_head()
+        if hasattr(content, "fileno"):
+            self.send_file(content)
+            return
         if content:
             try:
                 self.wfile.write(content)
@@ -344,8 +474,27 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
                 log.error("Error handling http request")
                 log.error(" for '%s'", self.path, exc_info=True)
 
+    def send_file(self, f):
+        with f:
+            try:
+                self.wfile.flush()
+                try:
+                    #uses os.sendfile when possible:
+                    self.request.sendfile(f)
+                except (AttributeError, ValueError):
+                    #not a plain socket, or a non-blocking one:
+                    log("sendfile not available", exc_info=True)
+                    shutil.copyfileobj(f, self.wfile)
+            except (BrokenPipeError, ConnectionResetError) as e:
+                log("send_file(%s) %s", f, e)
+            except Exception:
+                self.close_connection = True
+                log.error("Error sending file for '%s'", self.path, exc_info=True)
+
     def do_HEAD(self):
-        self.send_head()
+        content = self.send_head()
+        if hasattr(content, "close"):
+            content.close()
 
     def do_AUTHHEAD(self):
         self.send_response(401)
@@ -405,7 +554,7 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
                 return list_directory(self, path).read()
 
         try:
-            code, extra_headers, content = load_path(self.headers, path)
+            code, extra_headers, content = load_path(self.headers, path, sendfile=True)
             lm = extra_headers.get("Last-Modified")
             if lm:
                 extra_headers["Last-Modified"] = self.date_time_string(lm)
@@ -0,0 +1,71 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from hashlib import sha1
+from threading import RLock
+from collections import OrderedDict
+
+from xpra.util import envint
+
+#how many encoded cursors and window icons the server keeps, shared by all clients:
+SERVER_IMAGE_CACHE_SIZE = envint("XPRA_SERVER_IMAGE_CACHE_SIZE", 256)
+#how many cursors and window icons (each) clients keep,
+#so the server can send references instead of the image data:
+CLIENT_IMAGE_CACHE_SIZE = envint("XPRA_CLIENT_IMAGE_CACHE_SIZE", 64)
+
+
+def image_key(data) -> str:
+    """ the content address used for cursor and window icon data """
+    return sha1(data).hexdigest()
+
+
+class ImageCache:
+    """
+        LRU cache with a maximum number of entries.
+        The clients and the server must evict the same references,
+        so the server mirrors the client's cache using the same class,
+        and both sides must update it in the order the packets are sent.
+    """
+    def __init__(self, max_entries : int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"ImageCache({len(self.entries)} / {self.max_entries})"
+
+    def get_info(self) -> dict:
+        return {
+            "entries"       : len(self.entries),
+            "max-entries"   : self.max_entries,
+            "hits"          : self.hits,
+            "misses"        : self.misses,
+            }
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries)>self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+server_image_cache = ImageCache(SERVER_IMAGE_CACHE_SIZE)
@@ -264,6 +264,59 @@ def mmap_read(mmap_area, *descr_data):
     return b"".join(data)
 
 
+def mmap_allocate(mmap_area, mmap_size, size):
+    """
+        Reserves a contiguous slot of `size` bytes in the mmap area,
+        so that the caller can write the data directly into it.
+        Returns the offset of the slot, a memoryview of it and the mmap area's free memory,
+        or None for the offset and memoryview if there is no contiguous space available.
+        The slot must be sent to the client as a single chunk: [(offset, size)],
+        and the memoryview must be released once the data has been written.
+    """
+    #see mmap_write for the layout of the mmap area
+    mmap_data_start = int_from_buffer(mmap_area, 0)
+    mmap_data_end = int_from_buffer(mmap_area, 4)
+    start = max(8, mmap_data_start.value)
+    end = max(8, mmap_data_end.value)
+    offset = None
+    if end<start:
+        #[++++++++E--------------------S+++++]
+        available = start-end
+        if size<available:
+            offset = end
+    else:
+        #[------------S++++++++++++E---------]
+        available = mmap_size-end+start-8
+        if size<mmap_size-end:
+            offset = end
+        elif size<start-8:
+            #wrap around and start again from the beginning:
+            #[*******E----------S+++++++++-------]
+            offset = 8
+    mmap_free_size = available-size
+    if offset is None:
+        log("mmap: no contiguous slot of %i bytes, start=%i, end=%i", size, start, end)
+        return None, None, mmap_free_size
+    mmap_data_end.value = offset+size
+    log("mmap: allocated %i bytes at %i", size, offset)
+    return offset, memoryview(mmap_area)[offset:offset+size], mmap_free_size
+
+def restride_into(buf, pixels, rowstride, newstride, height):
+    """
+        Copies `height` rows of pixels into `buf`, changing the rowstride.
+        The new rowstride must not be bigger than the current one.
+    """
+    src = memoryview(pixels).cast("B")
+    if rowstride==newstride:
+        size = newstride*height
+        buf[:size] = src[:size]
+        return
+    assert newstride<rowstride
+    for y in range(height):
+        pos = y*rowstride
+        buf[y*newstride:(y+1)*newstride] = src[pos:pos+newstride]
+
+
 def mmap_write(mmap_area, mmap_size, data):
     """
         Sends 'data' to the client via the mmap shared memory region,
@@ -405,6 +405,8 @@ def get_network_caps(full_info : int=1) -> dict:
                 "encoders"              : get_enabled_encoders(),
                }
     caps["flush"] = FLUSH_HEADER
+    #we can always re-assemble fragmented chunks:
+    caps["fragments"] = True
     caps.update(get_compression_caps(full_info))
     caps.update(get_packet_encoding_caps(full_info))
     return caps
@@ -131,6 +131,27 @@ class InvalidPacketEncodingException(Exception):
     pass
 
 
+#rencode type codes:
+RENCODE_LIST = 59
+RENCODE_STR_FIXED_START = 128
+RENCODE_LIST_FIXED_START = 192
+
+def peek_packet_type(data, protocol_flags) -> str:
+    """
+        Returns the packet type without decoding the packet,
+        only rencode and rencodeplus packets whose type is a short string are supported,
+        for anything else this returns an empty string.
+    """
+    if not protocol_flags & (FLAGS_RENCODE | FLAGS_RENCODEPLUS) or len(data)<2:
+        return ""
+    if data[0]!=RENCODE_LIST and data[0]<RENCODE_LIST_FIXED_START:
+        return ""
+    l = data[1]-RENCODE_STR_FIXED_START
+    if l<=0 or l>=RENCODE_LIST_FIXED_START-RENCODE_STR_FIXED_START or len(data)<2+l:
+        return ""
+    return bytes(data[2:2+l]).decode("latin1")
+
+
 def pack_one_packet(packet):
     ee = get_enabled_encoders()
     if ee:
@@ -0,0 +1,218 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import asyncio
+from collections import deque
+from itertools import islice
+
+from xpra.net.bytestreams import ABORT, IOV_MAX
+from xpra.net.protocol.socket_handler import SocketProtocol
+from xpra.log import Logger
+
+log = Logger("network", "protocol")
+
+
+class AsyncioSocketProtocol(SocketProtocol):
+    """
+        This protocol does not use any threads,
+        the socket is read from and written to by an asyncio event loop
+        which can be shared by many connections.
+        Packets are parsed and processed directly from the event loop,
+        so the `process_packet_cb` must not block.
+        Only plain sockets are supported: no SSL, websockets or ssh,
+        and the connections cannot be stolen, see `steal_connection`.
+    """
+
+    def __init__(self, loop, scheduler, conn, process_packet_cb, get_packet_cb=None):
+        super().__init__(scheduler, conn, process_packet_cb, get_packet_cb)
+        self.loop = loop
+        self._socket = conn._socket
+        self._fd = self._socket.fileno()
+        self._parser = None
+        self._reading = False
+        self._writing = False
+        self._write_buffers = deque()
+        #the write end callbacks, with the number of bytes that must be sent before calling them:
+        self._write_callbacks = deque()
+        self._queued = 0
+        self._sent = 0
+
+    def __repr__(self):
+        return f"AsyncioProtocol({self._conn})"
+
+    def get_threads(self):
+        return ()
+
+    def wait_for_io_threads_exit(self, timeout=None):
+        return True
+
+    def steal_connection(self, read_callback=None):
+        """
+            Connections handled by an asyncio event loop cannot be handed over,
+            so this protocol cannot be used for proxy or rfb connection upgrades:
+            the connection is left as it is and we return None.
+        """
+        log.warn(f"Warning: cannot steal the connection from {self}")
+        log.warn(" this is not supported in asyncio mode")
+        return None
+
+    def in_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+
+    def start(self):
+        self.loop.call_soon_threadsafe(self._start)
+
+    def _start(self):
+        if self._closed:
+            return
+        self._socket.setblocking(False)
+        self._parser = self.read_parser()
+        next(self._parser)
+        self.loop.add_reader(self._fd, self._read_ready)
+        self._reading = True
+
+    def _read_ready(self):
+        try:
+            buf = self._socket.recv(self.read_buffer_size)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._io_error("read", e)
+            return
+        if not buf:
+            log("read: eof")
+            self.close()
+            return
+        self.input_raw_packetcount += 1
+        conn = self._conn
+        if conn:
+            conn.input_bytecount += len(buf)
+        try:
+            self._parser.send(buf)
+        except StopIteration:
+            self.close()
+        except Exception as e:
+            if not self._closed:
+                self._internal_error("error in network packet reading/parsing", e, exc_info=True)
+
+    def _io_error(self, name, e):
+        if not self._closed:
+            self._stop_io()
+            self._internal_error(f"{name} connection {e} reset", exc_info=e.args[0] not in ABORT)
+
+    def _stop_io(self):
+        if self._reading:
+            self.loop.remove_reader(self._fd)
+            self._reading = False
+        if self._writing:
+            self.loop.remove_writer(self._fd)
+            self._writing = False
+
+
+    def source_has_more(self):      #pylint: disable=method-hidden
+        #unlike the threaded version, we fetch exactly one packet each time we are called,
+        #so we never wait for the packet source:
+        if not self._closed:
+            self.loop.call_soon_threadsafe(self._format_packet)
+
+    def _format_packet(self):
+        gpc = self._get_packet_cb
+        wl = self._write_lock
+        #the write lock is only held by `flush_then_close`, there is no point in sending anything else:
+        if self._closed or not gpc or not wl or wl.locked():
+            return
+        try:
+            self._add_packet_to_queue(*gpc())
+        except Exception as e:
+            if not self._closed:
+                self._internal_error("error in network packet write/format", e, exc_info=True)
+
+    def raw_write(self, items, packet_type=None, start_cb=None, end_cb=None, fail_cb=None, synchronous=True, more=False):
+        """ Warning: this bypasses the compression and packet encoder! """
+        self.loop.call_soon_threadsafe(self._queue_write, items, start_cb, end_cb)
+
+    def _queue_write(self, items, start_cb, end_cb):
+        conn = self._conn
+        if self._closed or not conn:
+            return
+        if start_cb:
+            try:
+                start_cb(conn.output_bytecount)
+            except Exception:
+                log.error(f"Error on write start callback {start_cb}", exc_info=True)
+        for item in items:
+            buf = memoryview(item).cast("B")
+            if buf.nbytes:
+                self._write_buffers.append(buf)
+                self._queued += buf.nbytes
+        self.output_packetcount += 1
+        if end_cb:
+            self._write_callbacks.append((self._queued, end_cb))
+        self._write_ready()
+
+    def _write_ready(self):
+        buffers = self._write_buffers
+        sock = self._socket
+        conn = self._conn
+        while buffers and not self._closed:
+            try:
+                if len(buffers)>1 and hasattr(sock, "sendmsg"):
+                    written = sock.sendmsg(list(islice(buffers, IOV_MAX)))
+                else:
+                    written = sock.send(buffers[0])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                self._io_error("write", e)
+                return
+            self.output_raw_packetcount += 1
+            self._sent += written
+            if conn:
+                conn.output_bytecount += written
+            #skip what has been written:
+            while written:
+                l = buffers[0].nbytes
+                if written<l:
+                    buffers[0] = buffers[0][written:]
+                    break
+                written -= l
+                buffers.popleft()
+        callbacks = self._write_callbacks
+        while callbacks and callbacks[0][0]<=self._sent:
+            end_cb = callbacks.popleft()[1]
+            try:
+                end_cb(conn.output_bytecount if conn else self._sent)
+            except Exception:
+                if not self._closed:
+                    log.error(f"Error on write end callback {end_cb}", exc_info=True)
+        #only watch for the socket becoming writeable again if we have something to send:
+        if self._closed:
+            return
+        if buffers and not self._writing:
+            self.loop.add_writer(self._fd, self._write_ready)
+            self._writing = True
+        elif not buffers and self._writing:
+            self.loop.remove_writer(self._fd)
+            self._writing = False
+
+
+    def close(self, message=None):
+        #the reader and writer must be removed before the socket is closed,
+        #as the file descriptor could be re-used by another connection:
+        if not self.in_loop_thread():
+            self.loop.call_soon_threadsafe(self.close, message)
+            return
+        self._stop_io()
+        super().close(message)
+
+    def clean(self):
+        super().clean()
+        self._parser = None
+        self._write_buffers.clear()
+        self._write_callbacks.clear()
@@ -0,0 +1,134 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from sys import getrefcount
+
+from xpra.util import envint
+from xpra.net.protocol.header import unpack_header, FLAGS_CIPHER, HEADER_SIZE
+from xpra.log import Logger
+
+log = Logger("network", "protocol")
+
+#payloads larger than this are read directly into a buffer of their own:
+LARGE_FRAME_SIZE = envint("XPRA_LARGE_FRAME_SIZE", 64*1024)
+#how many payload buffers we keep for re-use:
+BUFFER_POOL_SIZE = envint("XPRA_BUFFER_POOL_SIZE", 4)
+
+PACKET_HEADER_CHAR = ord("P")
+
+
+class BufferPool:
+    """
+        Keeps a few payload buffers for re-use,
+        a buffer can only be re-used once nothing references it anymore.
+    """
+
+    def __init__(self, size=BUFFER_POOL_SIZE):
+        self.size = size
+        self.buffers = []
+
+    def __repr__(self):
+        return f"BufferPool({len(self.buffers)} / {self.size})"
+
+    def get(self, length : int) -> memoryview:
+        for buf in self.buffers:
+            #references: the pool list, this loop variable and the getrefcount argument
+            if length<=len(buf)<=length*2 and getrefcount(buf)<=3:
+                return memoryview(buf)[:length]
+        buf = bytearray(length)
+        if len(self.buffers)>=self.size:
+            #replace a buffer that is not being used,
+            #references: the pool list and the getrefcount argument
+            for i in range(len(self.buffers)):
+                if getrefcount(self.buffers[i])<=2:
+                    self.buffers[i] = buf
+                    return memoryview(buf)
+            return memoryview(buf)
+        self.buffers.append(buf)
+        return memoryview(buf)
+
+
+class FramedReader:
+    """
+        Reads the data from a connection which supports `readinto`,
+        following the xpra packet headers as it goes,
+        so that large payloads can be read straight into a buffer of their own.
+        The parser receives these payloads in a single memoryview,
+        and does not need to join them from many small read buffers.
+        The framing is abandoned (and we just read the data as-is)
+        as soon as something unexpected is found, ie: encrypted packets.
+    """
+
+    def __init__(self, readinto, read_buffer_size : int, get_max_frame_size):
+        self.readinto = readinto
+        self.buffer = bytearray(read_buffer_size)
+        #we don't allocate buffers for payloads larger than this:
+        self.get_max_frame_size = get_max_frame_size
+        self.pool = BufferPool()
+        self.enabled = True
+        #payload bytes of the current packet which have not been read yet:
+        self.frame_left = 0
+        self.header = b""
+        self.large_frames = 0
+
+    def __repr__(self):
+        return f"FramedReader({self.readinto})"
+
+    def get_info(self) -> dict:
+        return {
+            "enabled"       : self.enabled,
+            "large-frames"  : self.large_frames,
+            "buffer-pool"   : len(self.pool.buffers),
+            }
+
+    def read(self):
+        """
+            Returns the buffers read, in order,
+            or None when the connection has been closed.
+        """
+        view = memoryview(self.buffer)
+        n = self.readinto(view)
+        if not n:
+            return None
+        if not self.enabled:
+            return [bytes(view[:n])]
+        pos = 0
+        while pos<n:
+            if self.frame_left:
+                skip = min(self.frame_left, n-pos)
+                self.frame_left -= skip
+                pos += skip
+                continue
+            #the header may span more than one read:
+            chunk = view[pos:min(n, pos+HEADER_SIZE-len(self.header))]
+            self.header += bytes(chunk)
+            pos += len(chunk)
+            if len(self.header)<HEADER_SIZE:
+                break
+            header = self.header
+            self.header = b""
+            _, protocol_flags, _, _, payload_size = unpack_header(header)
+            if header[0]!=PACKET_HEADER_CHAR or protocol_flags & FLAGS_CIPHER:
+                #encrypted payloads have padding, just let the parser deal with everything from now on:
+                log("framed reader disabled by header %r", header)
+                self.enabled = False
+                break
+            available = n-pos
+            if payload_size<=available or payload_size<LARGE_FRAME_SIZE or payload_size>self.get_max_frame_size():
+                self.frame_left = payload_size
+                continue
+            #read the rest of this payload straight into its own buffer:
+            payload = self.pool.get(payload_size)
+            payload[:available] = view[pos:n]
+            filled = available
+            while filled<payload_size:
+                r = self.readinto(payload[filled:])
+                if not r:
+                    #connection closed, the next read will return None:
+                    return [bytes(view[:pos]), payload[:filled]]
+                filled += r
+            self.large_frames += 1
+            return [bytes(view[:pos]), payload]
+        return [bytes(view[:n])]
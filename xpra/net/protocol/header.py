@@ -18,6 +18,8 @@ FLAGS_RENCODEPLUS = 0x10
 #these flags can actually be combined with the encoders above:
 FLAGS_FLUSH     = 0x8
 FLAGS_CIPHER    = 0x2
+#this chunk is a fragment, more fragments for the same chunk index will follow:
+FLAGS_FRAGMENT  = 0x20
 
 #compression flags are carried in the "level" field,
 #the low bits contain the compression level, the high bits the compression algo:
@@ -25,6 +27,7 @@ ZLIB_FLAG       = 0x0       #assume zlib if no other compression flag is set
 LZ4_FLAG        = 0x10
 #LZO_FLAG        = 0x20
 BROTLI_FLAG     = 0x40
+ZSTD_FLAG       = 0x80
 FLAGS_NOHEADER  = 0x10000   #never encoded, so we can use a value bigger than a byte
 
 
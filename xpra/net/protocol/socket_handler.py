@@ -13,18 +13,20 @@ from time import monotonic
 from socket import error as socket_error
 from threading import Lock, RLock, Event
 from queue import Queue
+from collections import namedtuple
 
 from xpra.os_util import memoryview_to_bytes, strtobytes, bytestostr, hexstr
 from xpra.util import repr_ellipsized, ellipsizer, csv, envint, envbool, typedict
 from xpra.make_thread import make_thread, start_thread
 from xpra.net.protocol.header import (
     unpack_header, pack_header, find_xpra_header,
-    FLAGS_CIPHER, FLAGS_NOHEADER, FLAGS_FLUSH, HEADER_SIZE,
+    FLAGS_CIPHER, FLAGS_NOHEADER, FLAGS_FLUSH, FLAGS_FRAGMENT, HEADER_SIZE,
     )
 from xpra.net.protocol.constants import CONNECTION_LOST, INVALID, GIBBERISH
+from xpra.net.protocol.framed_reader import FramedReader
 from xpra.net.common import (
     ConnectionClosedException, may_log_packet,
-    MAX_PACKET_SIZE, FLUSH_HEADER,
+    MAX_PACKET_SIZE, FLUSH_HEADER, FRAGMENT_SIZE,
     )
 from xpra.net.bytestreams import ABORT
 from xpra.net import compression
@@ -35,7 +37,7 @@ from xpra.net.compression import (
 from xpra.net import packet_encoding
 from xpra.net.socket_util import guess_packet_type
 from xpra.net.packet_encoding import (
-    decode,
+    decode, peek_packet_type,
     InvalidPacketEncodingException,
     )
 from xpra.net.crypto import get_encryptor, get_decryptor, pad, INITIAL_PADDING
@@ -47,17 +49,25 @@ cryptolog = Logger("network", "crypto")
 
 USE_ALIASES = envbool("XPRA_USE_ALIASES", True)
 READ_BUFFER_SIZE = envint("XPRA_READ_BUFFER_SIZE", 65536)
+#read large payloads straight into their own buffer when the connection supports it:
+FRAMED_READ = envbool("XPRA_FRAMED_READ", True)
 #merge header and packet if packet is smaller than:
 PACKET_JOIN_SIZE = envint("XPRA_PACKET_JOIN_SIZE", READ_BUFFER_SIZE)
 LARGE_PACKET_SIZE = envint("XPRA_LARGE_PACKET_SIZE", 4096)
 LOG_RAW_PACKET_SIZE = envbool("XPRA_LOG_RAW_PACKET_SIZE", False)
 #inline compressed data in packet if smaller than:
 INLINE_SIZE = envint("XPRA_INLINE_SIZE", 32768)
+#the receiver refuses packets with more raw chunks than this:
+MAX_RAW_PACKETS = 3
 FAKE_JITTER = envint("XPRA_FAKE_JITTER", 0)
 MIN_COMPRESS_SIZE = envint("XPRA_MIN_COMPRESS_SIZE", 378)
 SEND_INVALID_PACKET = envint("XPRA_SEND_INVALID_PACKET", 0)
 SEND_INVALID_PACKET_DATA = strtobytes(os.environ.get("XPRA_SEND_INVALID_PACKET_DATA", b"ZZinvalid-packetZZ"))
 
+#a packet received from another connection which is sent without re-encoding it,
+#the chunks are in the same format as the ones returned by `SocketProtocol.encode`:
+EncodedPacket = namedtuple("EncodedPacket", ["packet_type", "chunks"])
+
 
 def exit_queue():
     queue = Queue()
@@ -102,15 +112,24 @@ class SocketProtocol:
         self.hangup_delay = 1000
         self._conn = conn
         self._process_packet_cb = process_packet_cb
+        #optional callback for forwarding packets without decoding them,
+        #called from the parse thread with the packet type and its chunks,
+        #it must return True if it has handled the packet:
+        self.raw_packet_cb = None
         self.make_chunk_header = self.make_xpra_header
         self.make_frame_header = self.noframe_header
         self._write_queue = Queue(1)
         self._read_queue = Queue(20)
         self._pre_read = None
+        #created by the read thread, if the connection supports it:
+        self._framed_reader = None
         self._process_read = self.read_queue_put
         self._read_queue_put = self.read_queue_put
         # Invariant: if .source is None, then _source_has_more == False
         self._get_packet_cb = get_packet_cb
+        #optional source of packets which can be sent in between the fragments of large packets:
+        self._get_priority_packet_cb = None
+        self._deferred_packets = []
         #counters:
         self.input_stats = {}
         self.input_packetcount = 0
@@ -118,12 +137,15 @@ class SocketProtocol:
         self.output_stats = {}
         self.output_packetcount = 0
         self.output_raw_packetcount = 0
+        self.output_fragmentcount = 0
+        self.output_interleavedcount = 0
         #initial value which may get increased by client/server after handshake:
         self.max_packet_size = MAX_PACKET_SIZE
         self.abs_max_packet_size = 256*1024*1024
         self.large_packets = ["hello", "window-metadata", "sound-data", "notify_show", "setting-change", "shell-reply"]
         self.send_aliases = {}
         self.send_flush_flag = False
+        self.send_fragments = False
         self.receive_aliases = {}
         self._log_stats = None          #None here means auto-detect
         self._closed = False
@@ -153,7 +175,7 @@ class SocketProtocol:
     STATE_FIELDS = ("max_packet_size", "large_packets", "send_aliases", "receive_aliases",
                     "cipher_in", "cipher_in_name", "cipher_in_block_size", "cipher_in_padding",
                     "cipher_out", "cipher_out_name", "cipher_out_block_size", "cipher_out_padding",
-                    "compression_level", "encoder", "compressor")
+                    "compression_level", "encoder", "compressor", "send_fragments")
 
     def save_state(self):
         state = {}
@@ -190,6 +212,9 @@ class SocketProtocol:
                 exited = False
         return exited
 
+    def set_priority_packet_source(self, get_priority_packet_cb):
+        self._get_priority_packet_cb = get_priority_packet_cb
+
     def set_packet_source(self, get_packet_cb):
         self._get_packet_cb = get_packet_cb
 
@@ -230,6 +255,7 @@ class SocketProtocol:
         for k,v in caps.dictget("aliases", {}).items():
             self.send_aliases[bytestostr(k)] = v
         self.send_flush_flag = FLUSH_HEADER and caps.boolget("flush", False)
+        self.send_fragments = FRAGMENT_SIZE>0 and caps.boolget("fragments", False)
 
     def set_receive_aliases(self, aliases):
         self.receive_aliases = aliases
@@ -242,6 +268,7 @@ class SocketProtocol:
             "max_packet_size"       : self.max_packet_size,
             "aliases"               : USE_ALIASES,
             "flush"                 : self.send_flush_flag,
+            "fragments"             : self.send_fragments,
             "has_more"              : shm and shm.is_set(),
             "receive-pending"       : self.receive_pending,
             }
@@ -261,6 +288,9 @@ class SocketProtocol:
             except Exception:
                 log.error("error collecting connection information on %s", c, exc_info=True)
         #add stats to connection info:
+        reader = self._framed_reader
+        if reader:
+            info.setdefault("input", {})["framed-reader"] = reader.get_info()
         info.setdefault("input", {}).update({
                        "buffer-size"            : self.read_buffer_size,
                        "hangup-delay"           : self.hangup_delay,
@@ -274,6 +304,9 @@ class SocketProtocol:
         info.setdefault("output", {}).update({
                         "packet-join-size"      : PACKET_JOIN_SIZE,
                         "large-packet-size"     : LARGE_PACKET_SIZE,
+                        "fragment-size"         : FRAGMENT_SIZE,
+                        "fragments"             : self.output_fragmentcount,
+                        "interleaved"           : self.output_interleavedcount,
                         "inline-size"           : INLINE_SIZE,
                         "min-compress-size"     : MIN_COMPRESS_SIZE,
                         "packetcount"           : self.output_packetcount,
@@ -357,7 +390,11 @@ class SocketProtocol:
             return
         #log("add_packet_to_queue(%s ... %s, %s, %s)", packet[0], synchronous, has_more, wait_for_more)
         packet_type = packet[0]
-        chunks = self.encode(packet)
+        if isinstance(packet, EncodedPacket):
+            self.output_stats[packet_type] = self.output_stats.get(packet_type, 0)+1
+            chunks = packet.chunks
+        else:
+            chunks = self.encode(packet)
         with self._write_lock:
             if self._closed:
                 return
@@ -374,56 +411,136 @@ class SocketProtocol:
                              start_send_cb=None, end_send_cb=None,
                              fail_cb=None, synchronous=True, more=False):
         """ the write_lock must be held when calling this function """
+        if self.send_fragments and len(chunks)>1 and chunks[0][1]>0 and len(chunks[0][3])>FRAGMENT_SIZE:
+            self._add_fragments_to_queue(packet_type, chunks,
+                                         start_send_cb, end_send_cb, fail_cb, synchronous, more)
+            return
+        self._write_chunks(packet_type, chunks, start_send_cb, end_send_cb, fail_cb, synchronous, more)
+
+    def _write_chunks(self, packet_type, chunks,
+                      start_send_cb=None, end_send_cb=None,
+                      fail_cb=None, synchronous=True, more=False):
         items = []
         for proto_flags,index,level,data in chunks:
-            payload_size = len(data)
-            if not payload_size:
-                raise RuntimeError(f"missing data in chunk {index}")
-            actual_size = payload_size
-            if self.cipher_out:
-                proto_flags |= FLAGS_CIPHER
-                #note: since we are padding: l!=len(data)
-                if self.cipher_out_block_size==0:
-                    padding_size = 0
-                else:
-                    padding_size = self.cipher_out_block_size - (payload_size % self.cipher_out_block_size)
-                if padding_size==0:
-                    padded = data
-                else:
-                    # pad byte value is number of padding bytes added
-                    padded = memoryview_to_bytes(data) + pad(self.cipher_out_padding, padding_size)
-                    actual_size += padding_size
-                if len(padded)!=actual_size:
-                    raise RuntimeError(f"expected padded size to be {actual_size}, but got {len(padded)}")
-                data = self.cipher_out.encrypt(padded)
-                if len(data)!=actual_size:
-                    raise RuntimeError(f"expected encrypted size to be {actual_size}, but got {len(data)}")
-                cryptolog("sending %s bytes %s encrypted with %s bytes of padding",
-                          payload_size, self.cipher_out_name, padding_size)
-            if proto_flags & FLAGS_NOHEADER:
-                assert not self.cipher_out
-                #for plain/text packets (ie: gibberish response)
-                log("sending %s bytes without header", payload_size)
-                items.append(data)
+            self._add_chunk_items(items, packet_type, proto_flags, index, level, data, more)
+        self._raw_write_items(items, packet_type, start_send_cb, end_send_cb, fail_cb, synchronous, more)
+
+    def _add_fragments_to_queue(self, packet_type, chunks,
+                                start_send_cb=None, end_send_cb=None,
+                                fail_cb=None, synchronous=True, more=False):
+        """
+            Sends the first chunk of this packet in fragments of `FRAGMENT_SIZE`,
+            so that the priority packets can be sent in between the fragments
+            rather than waiting for the whole packet to be written out.
+            The receiver only processes the chunks once the last fragment arrives.
+        """
+        proto_flags, index, level, data = chunks[0]
+        data = memoryview(data).cast("B")
+        size = data.nbytes
+        pos = 0
+        while pos+FRAGMENT_SIZE<size and not self._closed:
+            items = []
+            self._add_chunk_items(items, packet_type, proto_flags | FLAGS_FRAGMENT, index, level,
+                                  data[pos:pos+FRAGMENT_SIZE], True)
+            self._raw_write_items(items, packet_type, start_send_cb if pos==0 else None, None,
+                                  fail_cb, synchronous, True)
+            self.output_fragmentcount += 1
+            pos += FRAGMENT_SIZE
+            self._send_priority_packets()
+        #the last fragment goes out with the rest of the packet:
+        items = []
+        self._add_chunk_items(items, packet_type, proto_flags, index, level, data[pos:], more)
+        for proto_flags,index,level,data in chunks[1:]:
+            self._add_chunk_items(items, packet_type, proto_flags, index, level, data, more)
+        self._raw_write_items(items, packet_type, None, end_send_cb, fail_cb, synchronous, more)
+        #priority packets which could not be sent in between the fragments,
+        #these are not fragmented so that the priority packets remain in order:
+        deferred = self._deferred_packets
+        while deferred:
+            self._write_chunks(*deferred.pop(0))
+
+    def _send_priority_packets(self):
+        """
+            Sends the packets from the priority packet source,
+            these are interleaved with the fragments of a large packet
+            so they must be made of a single chunk.
+            Packets made of more than one chunk are deferred until the large packet has been sent.
+        """
+        gppc = self._get_priority_packet_cb
+        if not gppc:
+            return
+        while not self._closed and not self._deferred_packets:
+            packet, start_send_cb, end_send_cb, fail_cb, synchronous = gppc()[:5]
+            if packet is None:
+                return
+            packet_type = packet[0]
+            if isinstance(packet, EncodedPacket):
+                self.output_stats[packet_type] = self.output_stats.get(packet_type, 0)+1
+                chunks = packet.chunks
             else:
-                #if the other end can use this flag, expose it:
-                if self.send_flush_flag and not more and index==0:
-                    proto_flags |= FLAGS_FLUSH
-                #the xpra packet header:
-                #(WebSocketProtocol may also add a websocket header too)
-                header = self.make_chunk_header(packet_type, proto_flags, level, index, payload_size)
-                if actual_size<PACKET_JOIN_SIZE:
-                    if not isinstance(data, bytes):
-                        data = memoryview_to_bytes(data)
-                    items.append(header+data)
-                else:
-                    items.append(header)
-                    items.append(data)
+                chunks = self.encode(packet)
+            if len(chunks)!=1:
+                self._deferred_packets.append((packet_type, chunks, start_send_cb, end_send_cb, fail_cb, synchronous))
+                return
+            items = []
+            proto_flags, index, level, data = chunks[0]
+            self._add_chunk_items(items, packet_type, proto_flags, index, level, data, True)
+            self._raw_write_items(items, packet_type, start_send_cb, end_send_cb, fail_cb, synchronous, True)
+            self.output_interleavedcount += 1
+
+    def _add_chunk_items(self, items, packet_type, proto_flags, index, level, data, more=False):
+        payload_size = len(data)
+        if not payload_size:
+            raise RuntimeError(f"missing data in chunk {index}")
+        actual_size = payload_size
+        if self.cipher_out:
+            proto_flags |= FLAGS_CIPHER
+            #note: since we are padding: l!=len(data)
+            if self.cipher_out_block_size==0:
+                padding_size = 0
+            else:
+                padding_size = self.cipher_out_block_size - (payload_size % self.cipher_out_block_size)
+            if padding_size==0:
+                padded = data
+            else:
+                # pad byte value is number of padding bytes added
+                padded = memoryview_to_bytes(data) + pad(self.cipher_out_padding, padding_size)
+                actual_size += padding_size
+            if len(padded)!=actual_size:
+                raise RuntimeError(f"expected padded size to be {actual_size}, but got {len(padded)}")
+            data = self.cipher_out.encrypt(padded)
+            if len(data)!=actual_size:
+                raise RuntimeError(f"expected encrypted size to be {actual_size}, but got {len(data)}")
+            cryptolog("sending %s bytes %s encrypted with %s bytes of padding",
+                      payload_size, self.cipher_out_name, padding_size)
+        if proto_flags & FLAGS_NOHEADER:
+            assert not self.cipher_out
+            #for plain/text packets (ie: gibberish response)
+            log("sending %s bytes without header", payload_size)
+            items.append(data)
+            return
+        #if the other end can use this flag, expose it:
+        if self.send_flush_flag and not more and index==0:
+            proto_flags |= FLAGS_FLUSH
+        #the xpra packet header:
+        #(WebSocketProtocol may also add a websocket header too)
+        header = self.make_chunk_header(packet_type, proto_flags, level, index, payload_size)
+        #with vectored I/O, there is no need to join the buffers:
+        if not self.can_writev() and actual_size<PACKET_JOIN_SIZE:
+            if not isinstance(data, bytes):
+                data = memoryview_to_bytes(data)
+            items.append(header+data)
+        else:
+            items.append(header)
+            items.append(data)
+
+    def _raw_write_items(self, items, packet_type, start_send_cb=None, end_send_cb=None,
+                         fail_cb=None, synchronous=True, more=False):
         #WebSocket header may be added here:
         frame_header = self.make_frame_header(packet_type, items)       #pylint: disable=assignment-from-none
         if frame_header:
             item0 = items[0]
-            if len(item0)<PACKET_JOIN_SIZE:
+            if not self.can_writev() and len(item0)<PACKET_JOIN_SIZE:
                 if not isinstance(item0, bytes):
                     item0 = memoryview_to_bytes(item0)
                 items[0] = frame_header + item0
@@ -443,6 +560,10 @@ class SocketProtocol:
             assert not self._write_thread, "write thread already started"
             self._write_thread = start_thread(self._write_thread_loop, "write", daemon=True)
 
+    def can_writev(self) -> bool:
+        conn = self._conn
+        return bool(conn) and conn.can_writev()
+
     def raw_write(self, items, packet_type=None, start_cb=None, end_cb=None, fail_cb=None, synchronous=True, more=False):
         """ Warning: this bypasses the compression and packet encoder! """
         if self._write_thread is None:
@@ -491,7 +612,7 @@ class SocketProtocol:
             if c=="none":
                 continue
             if c in compressors or caps.boolget(c):
-                self.enable_compressor(c)
+                self.enable_compressor(c, caps)
                 return
             log(f"client does not support {c}")
         log.warn("Warning: compression disabled, no matching compressor found")
@@ -499,8 +620,9 @@ class SocketProtocol:
         log.warn(f" enabled compressors: {csv(opts)}")
         self.enable_compressor("none")
 
-    def enable_compressor(self, compressor):
-        self._compress = compression.get_compressor(compressor)
+    def enable_compressor(self, compressor, caps=None):
+        #the remote caps may allow the compressor to use extra features (ie: zstd dictionary)
+        self._compress = compression.get_compressor(compressor, caps)
         self.compressor = compressor
         log(f"enable_compressor({compressor}): {self._compress}")
 
@@ -543,7 +665,12 @@ class SocketProtocol:
                 packet[i] = item
                 #(it may now be a "Compressed" item and be processed further)
             if isinstance(item, memoryview):
-                if self.encoder!="rencodeplus":
+                if level==0 and item.nbytes>=PACKET_JOIN_SIZE and len(packets)<MAX_RAW_PACKETS:
+                    #send it as a raw chunk rather than copying it into the main packet:
+                    packets.append((0, i, 0, item))
+                    packet[i] = b''
+                    payload_size += item.nbytes
+                elif self.encoder!="rencodeplus":
                     packet[i] = item.tobytes()
                 continue
             if isinstance(item, LargeStructure):
@@ -708,6 +835,9 @@ class SocketProtocol:
         con = self._conn
         if not con:
             return
+        if len(buf_data)>1 and con.can_writev():
+            self.writev_buffers(con, buf_data, packet_type)
+            return
         for buf in buf_data:
             while buf and not self._closed:
                 written = self.con_write(con, buf, packet_type)
@@ -723,11 +853,57 @@ class SocketProtocol:
     def con_write(self, con, buf, packet_type):
         return con.write(buf, packet_type)
 
+    def writev_buffers(self, con, buf_data, packet_type):
+        #hand all the buffers to the connection at once,
+        #without joining them or copying them first:
+        buffers = [memoryview(buf).cast("B") for buf in buf_data if len(buf)]
+        while buffers and not self._closed:
+            written = self.con_writev(con, buffers, packet_type)
+            if written:
+                self.output_raw_packetcount += 1
+                #skip what has been written:
+                while written:
+                    l = len(buffers[0])
+                    if written<l:
+                        buffers[0] = buffers[0][written:]
+                        break
+                    written -= l
+                    buffers.pop(0)
+        self.output_packetcount += 1
+
+    def con_writev(self, con, buffers, packet_type):
+        return con.writev(buffers, packet_type)
+
 
     def _read_thread_loop(self):
+        self._framed_reader = self.make_framed_reader()
         self._io_thread_loop("read", self._read)
+
+    def make_framed_reader(self):
+        conn = self._conn
+        #the framed reader must see all the data from the start,
+        #and we only know how to follow the xpra packet headers:
+        if not FRAMED_READ or not conn or self._pre_read or self.wait_for_header:
+            return None
+        if self._process_read!=self.read_queue_put or not conn.can_readinto():
+            return None
+        return FramedReader(conn.readinto, self.read_buffer_size, self.get_max_packet_size)
+
+    def get_max_packet_size(self) -> int:
+        return self.max_packet_size
+
     def _read(self):
-        buf = self.con_read()
+        reader = self._framed_reader
+        if reader:
+            buffers = reader.read()
+            if buffers:
+                for buf in buffers:
+                    self._process_read(buf)
+                self.input_raw_packetcount += 1
+                return True
+            buf = None
+        else:
+            buf = self.con_read()
         #log("read thread: got data of size %s: %s", len(buf), repr_ellipsized(buf))
         #add to the read queue (or whatever takes its place - see steal_connection)
         self._process_read(buf)
@@ -827,7 +1003,26 @@ class SocketProtocol:
 
     def do_read_parse_thread_loop(self):
         """
-            Process the individual network packets placed in _read_queue.
+            Process the individual network packets placed in _read_queue
+            using the `read_parser`.
+        """
+        parser = self.read_parser()
+        next(parser)
+        while not self._closed:
+            #log("parse thread: %i items in read queue", self._read_queue.qsize())
+            buf = self._read_queue.get()
+            if not buf:
+                log("parse thread: empty marker, exiting")
+                self.idle_add(self.close)
+                return
+            try:
+                parser.send(buf)
+            except StopIteration:
+                return
+
+    def read_parser(self):
+        """
+            Generator which parses the network data it is sent.
             Concatenate the raw packet data, then try to parse it.
             Extract the individual packets from the potentially large buffer,
             saving the rest of the buffer for later, and optionally decompress this data
@@ -844,15 +1039,13 @@ class SocketProtocol:
         packet_index = 0
         compression_level = 0
         raw_packets = {}
+        #the fragments of chunks which have not been fully received yet:
+        fragments = {}
+        #the chunks as received, for `raw_packet_cb`:
+        raw_chunks = []
         PACKET_HEADER_CHAR = ord("P")
         while not self._closed:
-            #log("parse thread: %i items in read queue", self._read_queue.qsize())
-            buf = self._read_queue.get()
-            if not buf:
-                log("parse thread: empty marker, exiting")
-                self.idle_add(self.close)
-                return
-
+            buf = yield
             read_buffers.append(buf)
             if self.wait_for_header:
                 #we're waiting to see the first xpra packet header
@@ -991,6 +1184,24 @@ class SocketProtocol:
                             self._internal_error(f"{self.cipher_in_name} encryption padding error - wrong key?")
                             return
                         data = data[:-padding_size]
+                if protocol_flags & FLAGS_FRAGMENT:
+                    #more fragments of this chunk will follow,
+                    #other packets may be received in between:
+                    frags = fragments.setdefault(packet_index, [])
+                    frags.append(data)
+                    if sum(len(x) for x in frags)>self.abs_max_packet_size:
+                        self.invalid(f"fragmented chunk {packet_index} is too large", data)
+                        return
+                    header = b""
+                    payload_size = -1
+                    self.receive_pending = True
+                    continue
+                frags = fragments.pop(packet_index, None)
+                if frags:
+                    frags.append(data)
+                    data = b"".join(frags)
+                if self.raw_packet_cb:
+                    raw_chunks.append((protocol_flags & ~(FLAGS_CIPHER | FLAGS_FLUSH), packet_index, compression_level, data))
                 #uncompress if needed:
                 if compression_level>0:
                     try:
@@ -1025,14 +1236,27 @@ class SocketProtocol:
                     #raw packet, store it and continue:
                     raw_packets[packet_index] = data
                     payload_size = -1
-                    if len(raw_packets)>=4:
+                    if len(raw_packets)>MAX_RAW_PACKETS:
                         self.invalid(f"too many raw packets: {len(raw_packets)}", data)
                         return
                     #we know for sure that another packet should follow immediately
                     #the one with packet_index=0 for this raw packet
                     self.receive_pending = True
                     continue
-                #final packet (packet_index==0), decode it:
+                #final packet (packet_index==0), forward it as-is:
+                rpc = self.raw_packet_cb
+                if rpc:
+                    chunks = raw_chunks
+                    raw_chunks = []
+                    packet_type = peek_packet_type(data, protocol_flags)
+                    self.receive_pending = bool(protocol_flags & FLAGS_FLUSH)
+                    if packet_type and len(chunks)==len(raw_packets)+1 and rpc(self, packet_type, chunks):
+                        raw_packets = {}
+                        payload_size = -1
+                        self.input_stats[packet_type] = self.input_stats.get(packet_type, 0)+1
+                        self.input_packetcount += 1
+                        continue
+                #or decode it:
                 try:
                     packet = list(decode(data, protocol_flags))
                 except InvalidPacketEncodingException as e:
@@ -4,6 +4,7 @@
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
+import zlib
 import struct
 
 from xpra.net.rfb.rfb_const import RFBEncoding
@@ -15,6 +16,7 @@ from xpra.log import Logger
 log = Logger("rfb")
 
 PILLOW_OPTIONS = {"alpha" : False}
+ZRLE_TILE_SIZE = 64
 
 def pillow_encode(encoding, img):
     return encode(encoding, img, PILLOW_OPTIONS)[1].data
@@ -24,10 +26,35 @@ def make_header(encoding, x, y, w, h):
     rect = struct.pack(b"!HHHHi", x, y, w, h, encoding)
     return fbupdate+rect
 
-def rgb222_encode(window, x, y, w, h):
-    img = window.get_image(x, y, w, h)
-    window.acknowledge_changes()
-    header = make_header(RFBEncoding.RAW, x, y, w, h)
+def img_header(encoding, img):
+    return make_header(encoding, img.get_target_x(), img.get_target_y(), img.get_width(), img.get_height())
+
+
+class ZlibStream:
+    """
+        The RFB zlib based encodings (ZLIB and ZRLE)
+        use a single zlib stream for the whole connection,
+        so the client's inflater can reference data from previous updates.
+    """
+    __slots__ = ("compressor", "level")
+    def __init__(self, level=1):
+        self.level = level
+        self.compressor = zlib.compressobj(level)
+
+    def __repr__(self):
+        return f"ZlibStream(level={self.level})"
+
+    def compress(self, data):
+        c = self.compressor
+        return c.compress(data)+c.flush(zlib.Z_SYNC_FLUSH)
+
+
+def copyrect_encode(src_x, src_y, x, y, w, h):
+    header = make_header(RFBEncoding.COPYRECT, x, y, w, h)
+    return [header+struct.pack(b"!HH", src_x, src_y)]
+
+def rgb222_encode(img):
+    header = img_header(RFBEncoding.RAW, img)
     if bytestostr(img.get_pixel_format())!="BGRX":
         log.warn("Warning: cannot convert %s to rgb222", img.get_pixel_format())
         return []
@@ -36,10 +63,8 @@ def rgb222_encode(window, x, y, w, h):
     data = bgra_to_rgb222(pixels)
     return [header, data]
 
-def raw_encode(window, x, y, w, h):
-    img = window.get_image(x, y, w, h)
-    window.acknowledge_changes()
-    header = make_header(RFBEncoding.RAW, x, y, w, h)
+def raw_encode(img):
+    header = img_header(RFBEncoding.RAW, img)
     return [header, raw_pixels(img)]
 
 def raw_pixels(img):
@@ -55,28 +80,48 @@ def raw_pixels(img):
         Bpp*w*h, w, h, Bpp, len(pixels))
     return pixels[:Bpp*w*h]
 
-def zlib_encode(window, x, y, w, h):
-    img = window.get_image(x, y, w, h)
-    window.acknowledge_changes()
-    if not img:
-        return []
+def zlib_encode(img, stream):
     pixels = raw_pixels(img)
-    import zlib  #pylint: disable=import-outside-toplevel
-    if isinstance(pixels, memoryview):
-        pixels = pixels.tobytes()
-    data = zlib.compress(pixels, 1)
+    data = stream.compress(pixels)
     log("zlib compressed %i down to %i", len(pixels), len(data))
-    header = make_header(RFBEncoding.ZLIB, x, y, w, h) + struct.pack(b"!I", len(data))
+    header = img_header(RFBEncoding.ZLIB, img) + struct.pack(b"!I", len(data))
     return [header, data]
 
-def tight_encode(window, x, y, w, h, quality=0):
-    img = window.get_image(x, y, w, h)
-    window.acknowledge_changes()
-    if not img:
-        return []
+def zrle_encode(img, stream):
+    """
+        ZRLE with 3 byte CPIXELs, which requires a 32bpp depth 24 little endian client pixel format,
+        each tile is either a solid colour or raw CPIXELs
+    """
+    w = img.get_width()
+    h = img.get_height()
+    pixels = raw_pixels(img)
+    #BGRX -> BGR CPIXELs:
+    cpixels = bytearray(w*h*3)
+    for i in range(3):
+        cpixels[i::3] = pixels[i::4]
+    rowstride = w*3
+    tiles = []
+    for ty in range(0, h, ZRLE_TILE_SIZE):
+        th = min(ZRLE_TILE_SIZE, h-ty)
+        for tx in range(0, w, ZRLE_TILE_SIZE):
+            tw = min(ZRLE_TILE_SIZE, w-tx)
+            pos = ty*rowstride+tx*3
+            rows = [cpixels[pos+i*rowstride:pos+i*rowstride+tw*3] for i in range(th)]
+            solid = rows[0][:3]
+            if rows[0]==solid*tw and all(row==rows[0] for row in rows[1:]):
+                tiles.append(b"\1"+solid)
+            else:
+                tiles.append(b"\0")
+                tiles += rows
+    data = stream.compress(b"".join(tiles))
+    log("zrle compressed %i pixels down to %i", w*h, len(data))
+    header = img_header(RFBEncoding.ZRLE, img) + struct.pack(b"!I", len(data))
+    return [header, data]
+
+def tight_encode(img, quality=0):
     if quality==10:
         #Fill Compression
-        header = make_header(RFBEncoding.TIGHT, x, y, w, h)
+        header = img_header(RFBEncoding.TIGHT, img)
         header += struct.pack(b"!B", 0x80)
         pixel_format = bytestostr(img.get_pixel_format())
         log.warn("fill compression of %s", pixel_format)
@@ -85,11 +130,11 @@ def tight_encode(window, x, y, w, h, quality=0):
         return [header, raw_pixels(img)]
     #try jpeg:
     data = pillow_encode("jpeg", img)
-    header = tight_header(RFBEncoding.TIGHT, x, y, w, h, 0x90, len(data))
+    header = tight_header(RFBEncoding.TIGHT, img, 0x90, len(data))
     return [header, data]
 
-def tight_header(encoding, x, y, w, h, control, length):
-    header = make_header(encoding, x, y, w, h)
+def tight_header(encoding, img, control, length):
+    header = img_header(encoding, img)
     header += struct.pack(b"!B", control)
     #the length header is in a weird format:
     if length<128:
@@ -102,11 +147,7 @@ def tight_header(encoding, x, y, w, h, control, length):
     log("tight header for %i bytes %s", length, hexstr(header))
     return header
 
-def tight_png(window, x, y, w, h):
-    img = window.get_image(x, y, w, h)
-    window.acknowledge_changes()
-    if not img:
-        return []
+def tight_png(img):
     data = pillow_encode("png", img)
-    header = tight_header(RFBEncoding.TIGHT_PNG, x, y, w, h, 0x80+0x20, len(data))
+    header = tight_header(RFBEncoding.TIGHT_PNG, img, 0x80+0x20, len(data))
     return [header, data]
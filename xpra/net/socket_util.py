@@ -261,7 +261,7 @@ def looks_like_xpra_packet(data):
     from xpra.net.protocol.header import (
         unpack_header, HEADER_SIZE,
         FLAGS_RENCODE, FLAGS_YAML,
-        LZ4_FLAG, BROTLI_FLAG,
+        LZ4_FLAG, BROTLI_FLAG, ZSTD_FLAG,
         )
     header = data.ljust(HEADER_SIZE, b"\0")
     _, protocol_flags, compression_level, packet_index, data_size = unpack_header(header)
@@ -277,7 +277,8 @@ def looks_like_xpra_packet(data):
     yaml = bool(protocol_flags & FLAGS_YAML)
     lz4 = bool(protocol_flags & LZ4_FLAG)
     brotli = bool(protocol_flags & BROTLI_FLAG)
-    compressors = sum((lz4, brotli))
+    zstd = bool(protocol_flags & ZSTD_FLAG)
+    compressors = sum((lz4, brotli, zstd))
     #only one compressor can be enabled:
     if compressors>1:
         return False
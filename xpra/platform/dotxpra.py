@@ -8,13 +8,26 @@ import os.path
 import glob
 import socket
 import errno
+from time import monotonic
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from xpra.os_util import get_util_logger, osexpand, umask_context, is_socket
+from xpra.util import envint
 from xpra.platform.dotxpra_common import PREFIX, LIVE, DEAD, UNKNOWN, INACCESSIBLE
 from xpra.platform import platform_import
 
 DISPLAY_PREFIX = ":"
 
+PROBE_THREADS = max(1, envint("XPRA_SOCKET_PROBE_THREADS", 16))
+PROBE_TIMEOUT = envint("XPRA_SOCKET_PROBE_TIMEOUT", 5)
+#in milliseconds, 0 to disable:
+SOCKET_STATE_CACHE_TTL = envint("XPRA_SOCKET_STATE_CACHE_TTL", 0)
+
+#sockpath -> (inode, mtime, expiry, state)
+state_cache = {}
+state_cache_lock = Lock()
+
 
 def norm_makepath(dirpath, name):
     if DISPLAY_PREFIX and name.startswith(DISPLAY_PREFIX):
@@ -31,6 +44,31 @@ def debug(msg, *args, **kwargs):
     log(msg, *args, **kwargs)
 
 
+def socket_cache_key(sockpath):
+    try:
+        st = os.stat(sockpath)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+def get_cached_state(sockpath, key, now):
+    with state_cache_lock:
+        entry = state_cache.get(sockpath)
+    if not entry:
+        return None
+    ino, mtime, expiry, state = entry
+    if (ino, mtime)!=key or now>expiry:
+        return None
+    return state
+
+def cache_state(sockpath, key, now, state):
+    with state_cache_lock:
+        #purge expired entries:
+        for k in tuple(k for k, v in state_cache.items() if v[2]<now):
+            del state_cache[k]
+        state_cache[sockpath] = key+(now+SOCKET_STATE_CACHE_TTL/1000, state)
+
+
 class DotXpra:
     def __init__(self, sockdir=None, sockdirs=None, actual_username="", uid=0, gid=0):
         self.uid = uid or os.getuid()
@@ -129,6 +167,58 @@ class DotXpra:
                 debug("%s.close()", sock, exc_info=True)
 
 
+    def get_server_states(self, sockpaths, timeout=PROBE_TIMEOUT) -> dict:
+        """
+            Probes all the sockets concurrently.
+            Returns within `timeout` seconds,
+            any socket which has not responded by then is 'UNKNOWN'.
+        """
+        states = {}
+        now = monotonic()
+        todo = {}
+        for sockpath in sockpaths:
+            key = None
+            if SOCKET_STATE_CACHE_TTL>0:
+                key = socket_cache_key(sockpath)
+                state = key and get_cached_state(sockpath, key, now)
+                if state:
+                    debug("get_server_states: using cached state %s for %r", state, sockpath)
+                    states[sockpath] = state
+                    continue
+            todo[sockpath] = key
+        if len(todo)==1:
+            sockpath = tuple(todo.keys())[0]
+            states[sockpath] = self.get_server_state(sockpath, timeout)
+        elif todo:
+            executor = ThreadPoolExecutor(max_workers=min(PROBE_THREADS, len(todo)),
+                                          thread_name_prefix="socket-probe")
+            futures = {}
+            try:
+                futures = dict((executor.submit(self.get_server_state, sockpath, timeout), sockpath)
+                               for sockpath in todo)
+                done = wait(futures, timeout)[0]
+                for future, sockpath in futures.items():
+                    if future in done and not future.exception():
+                        states[sockpath] = future.result()
+                    else:
+                        debug("get_server_states: no response from %r", sockpath)
+                        states[sockpath] = DotXpra.UNKNOWN
+            finally:
+                #don't wait for the sockets that are still hanging,
+                #cancel the pending probes ourselves as 'cancel_futures' requires Python 3.9:
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=False)
+        if SOCKET_STATE_CACHE_TTL>0:
+            now = monotonic()
+            for sockpath, key in todo.items():
+                state = states[sockpath]
+                #a server may be starting up, so don't cache 'UNKNOWN':
+                if key and state!=DotXpra.UNKNOWN:
+                    cache_state(sockpath, key, now, state)
+        return states
+
+
     def displays(self, check_uid=None, matching_state=None):
         return list(set(v[1] for v in self.sockets(check_uid, matching_state)))
 
@@ -193,10 +283,12 @@ class DotXpra:
         sd = {}
         debug("socket_details%s sockdir=%s, sockdirs=%s",
               (check_uid, matching_state, matching_display), self._sockdir, self._sockdirs)
-        def add_result(d, item):
-            results = sd.setdefault(d, [])
-            if item not in results:
-                results.append(item)
+        #first find all the sockets, so we can probe them all at once:
+        #(directory, display, sockpath)
+        candidates = []
+        def add_candidate(d, display, sockpath, uid=None):
+            if is_socket(sockpath, uid):
+                candidates.append((d, display, sockpath))
         def local(display):
             if display.startswith("wayland-"):
                 return display
@@ -211,10 +303,7 @@ class DotXpra:
             #ie: /run/user/1000/xpra/10/socket
             sockpath = os.path.join(session_dir, "socket")
             if os.path.exists(sockpath):
-                state = self.is_socket_match(sockpath, None, matching_state)
-                debug("add_session_dir(%s) state(%s)=%s", (session_dir, display), sockpath, state)
-                if state:
-                    add_result(session_dir, (state, local(display), sockpath))
+                add_candidate(session_dir, local(display), sockpath)
         for d in self._unique_sock_dirs():
             #if we know the display name,
             #we know the corresponding session dir:
@@ -240,10 +329,17 @@ class DotXpra:
                 dstr = "*"
             potential_sockets = glob.glob(base + dstr)
             for sockpath in sorted(potential_sockets):
-                state = self.is_socket_match(sockpath, check_uid, matching_state)
-                if state:
-                    display = local(sockpath[len(base):])
-                    add_result(d, (state, display, sockpath))
+                add_candidate(d, local(sockpath[len(base):]), sockpath, check_uid)
+        states = self.get_server_states(set(c[2] for c in candidates))
+        for d, display, sockpath in candidates:
+            state = states.get(sockpath)
+            debug("socket_details: state(%s)=%s", sockpath, state)
+            if matching_state and state!=matching_state:
+                continue
+            results = sd.setdefault(d, [])
+            item = (state, display, sockpath)
+            if item not in results:
+                results.append(item)
         return sd
 
     def is_socket_match(self, sockpath, check_uid=None, matching_state=None):
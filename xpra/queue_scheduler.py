@@ -1,10 +1,12 @@
 # This file is part of Xpra.
-# Copyright (C) 2013-2021 Antoine Martin <antoine@xpra.org>
+# Copyright (C) 2013-2023 Antoine Martin <antoine@xpra.org>
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
+from heapq import heappush, heappop
 from queue import Queue
-from threading import Timer, RLock
+from threading import Thread, Condition
+from time import monotonic
 
 from xpra.util import AtomicInteger
 from xpra.log import Logger
@@ -12,23 +14,42 @@ from xpra.log import Logger
 log = Logger("util")
 
 
-#emulate the glib main loop using a single thread + queue:
+#emulate the glib main loop using a single thread + queue,
+#all the timers share a single thread which waits for the next one due in a heap:
 class QueueScheduler:
-    __slots__ = ("main_queue", "exit", "timer_id", "timers", "timer_lock")
+    __slots__ = ("main_queue", "exit", "timer_id", "timers", "timer_lock",
+                 "timer_heap", "timer_thread", "timer_stats")
 
     def __init__(self):
         self.main_queue = Queue()
         self.exit = False
         self.timer_id = AtomicInteger()
         self.timers = {}
-        self.timer_lock = RLock()
+        self.timer_lock = Condition()
+        self.timer_heap = []
+        self.timer_thread = None
+        #dispatched, total lag, max lag:
+        self.timer_stats = [0, 0, 0]
+
+    def get_scheduler_info(self) -> dict:
+        dispatched, total_lag, max_lag = self.timer_stats
+        info = {
+            "idle"      : sum(1 for v in tuple(self.timers.values()) if v is False),
+            "timers"    : len(self.timer_heap),
+            "dispatched": dispatched,
+            }
+        if dispatched:
+            info["lag"] = {
+                "avg"   : int(1000*total_lag/dispatched),
+                "max"   : int(1000*max_lag),
+                }
+        return info
 
     def source_remove(self, tid : int):
         log("source_remove(%i)", tid)
         with self.timer_lock:
-            timer = self.timers.pop(tid, None)
-            if timer:
-                timer.cancel()
+            #the timer thread will skip the heap entry:
+            self.timers.pop(tid, None)
 
     def idle_add(self, fn : callable, *args, **kwargs) -> int:
         tid = self.timer_id.increase()
@@ -49,18 +70,44 @@ class QueueScheduler:
         return tid
 
     def do_timeout_add(self, tid : int, timeout : int, fn : callable, *args, **kwargs):
-        #emulate glib's timeout_add using Timers
-        args = (tid, timeout, fn, args, kwargs)
-        t = Timer(timeout/1000.0, self.queue_timeout_function, args)
-        self.timers[tid] = t
-        t.start()
-
-    def queue_timeout_function(self, tid : int, timeout : int, fn : callable, fn_args, fn_kwargs):
-        if tid not in self.timers:  # pragma: no cover
-            return      #cancelled
-        #add to run queue:
-        mqargs = [tid, timeout, fn, fn_args, fn_kwargs]
-        self.main_queue.put((self.timeout_repeat_call, mqargs, {}))
+        #emulate glib's timeout_add using a heap of due times
+        due = monotonic()+timeout/1000.0
+        with self.timer_lock:
+            self.timers[tid] = True
+            heap = self.timer_heap
+            heappush(heap, (due, tid, timeout, fn, args, kwargs))
+            if heap[0][1]==tid:
+                #this is now the first timer due:
+                self.timer_lock.notify()
+            tt = self.timer_thread
+            if not tt or not tt.is_alive():
+                #first timer, or we have been forked:
+                self.timer_thread = Thread(target=self.timer_loop, name="timers", daemon=True)
+                self.timer_thread.start()
+
+    def timer_loop(self):
+        heap = self.timer_heap
+        stats = self.timer_stats
+        with self.timer_lock:
+            while not self.exit:
+                if not heap:
+                    self.timer_lock.wait()
+                    continue
+                now = monotonic()
+                due = heap[0][0]
+                if due>now:
+                    self.timer_lock.wait(due-now)
+                    continue
+                _, tid, timeout, fn, fn_args, fn_kwargs = heappop(heap)
+                if tid not in self.timers:
+                    continue    #cancelled
+                lag = now-due
+                stats[0] += 1
+                stats[1] += lag
+                stats[2] = max(stats[2], lag)
+                #add to run queue:
+                mqargs = [tid, timeout, fn, fn_args, fn_kwargs]
+                self.main_queue.put((self.timeout_repeat_call, mqargs, {}))
 
     def timeout_repeat_call(self, tid : int, timeout : int, fn : callable, fn_args, fn_kwargs):
         #executes the function then re-schedules it (if it returns True)
@@ -101,6 +148,9 @@ class QueueScheduler:
 
     def stop(self):
         self.exit = True
+        with self.timer_lock:
+            self.timer_heap.clear()
+            self.timer_lock.notify()
         self.stop_main_queue()
 
     def stop_main_queue(self):
@@ -10,6 +10,7 @@ from time import monotonic
 
 cdef extern from "math.h":
     double log(double x)
+    double exp(double x)
 
 from math import sqrt
 def logp(double x):
@@ -50,6 +51,127 @@ def calculate_time_weighted_average(data):
         rw += w
     return tv / tw, rv / rw
 
+#time constants (in seconds) of the exponential decay
+#used by the incremental averages below,
+#roughly equivalent to the weights used by calculate_time_weighted_average:
+AVG_DECAY = 3.0
+RECENT_DECAY = 0.3
+
+cdef class TimeWeightedAverage:
+    """
+        Incremental version of `calculate_time_weighted_average`:
+        the weighted sums are updated as values are added,
+        and decayed exponentially as time passes,
+        so getting the averages does not require walking all the records.
+        As the decay affects all the sums equally,
+        the averages only need to be decayed when a new value is added.
+    """
+    cdef double avg_decay
+    cdef double recent_decay
+    cdef double last_time
+    cdef double tv
+    cdef double tw
+    cdef double rv
+    cdef double rw
+    cdef bint started
+    cdef readonly unsigned long count
+
+    def __init__(self, double avg_decay=AVG_DECAY, double recent_decay=RECENT_DECAY):
+        assert avg_decay>0 and recent_decay>0
+        self.avg_decay = avg_decay
+        self.recent_decay = recent_decay
+        self.reset()
+
+    def __repr__(self):
+        return "%s(%i)" % (type(self).__name__, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def reset(self):
+        self.last_time = 0
+        self.tv = self.tw = self.rv = self.rw = 0
+        self.started = False
+        self.count = 0
+
+    cdef void decay(self, double event_time):
+        cdef double delta = event_time-self.last_time
+        cdef double a, r
+        if self.started and delta>0:
+            a = exp(-delta/self.avg_decay)
+            r = exp(-delta/self.recent_decay)
+            self.tv *= a
+            self.tw *= a
+            self.rv *= r
+            self.rw *= r
+        if delta>0 or not self.started:
+            self.last_time = event_time
+            self.started = True
+
+    cdef void accumulate(self, double event_time, double value, double weight):
+        cdef double delta = self.last_time-event_time
+        cdef double a = 1.0
+        cdef double r = 1.0
+        if delta>0:
+            #older than the last value we got:
+            a = exp(-delta/self.avg_decay)
+            r = exp(-delta/self.recent_decay)
+        self.tv += value*weight*a
+        self.tw += weight*a
+        self.rv += value*weight*r
+        self.rw += weight*r
+        self.count += 1
+
+    def add(self, double event_time, double value):
+        self.decay(event_time)
+        self.accumulate(event_time, value, 1.0)
+
+    def get(self):
+        """ returns the average and the recent average """
+        cdef double tw = self.tw
+        cdef double rw = self.rw
+        if tw<=0:
+            tw = 1
+        if rw<=0:
+            rw = 1
+        return self.tv / tw, self.rv / rw
+
+
+cdef class SizeWeightedAverage(TimeWeightedAverage):
+    """
+        Incremental version of `calculate_size_weighted_average`,
+        the size of each value also gives it a weight boost,
+        relative to the time weighted average size.
+    """
+    cdef double st
+    cdef double sw
+
+    def reset(self):
+        TimeWeightedAverage.reset(self)
+        self.st = self.sw = 0
+
+    cdef void decay(self, double event_time):
+        cdef double delta = event_time-self.last_time
+        cdef double a
+        if self.started and delta>0:
+            a = exp(-delta/self.avg_decay)
+            self.st *= a
+            self.sw *= a
+        TimeWeightedAverage.decay(self, event_time)
+
+    def add(self, double event_time, double size, double value):
+        self.decay(event_time)
+        self.st += size
+        self.sw += 1
+        if value<=0:
+            return      #invalid record
+        cdef double size_avg = self.st/self.sw
+        if size_avg<=0:
+            size_avg = 1
+        cdef double pw = clogp(size/size_avg)
+        cdef double size_ps = max(1, size*value)
+        self.accumulate(event_time, size_ps/max(1, size), pw*max(1, size))
+
 def time_weighted_average(data, double min_offset=0.1, double rpow=2.0):
     """
         Given a list of items of the form [(event_time, value)],
@@ -11,7 +11,7 @@ import os.path
 import hashlib
 
 from xpra.simple_stats import to_std_unit, std_unit
-from xpra.os_util import bytestostr, osexpand, load_binary_file, WIN32, POSIX
+from xpra.os_util import bytestostr, osexpand, WIN32, POSIX
 from xpra.util import u, engs, repr_ellipsized, NotificationID
 from xpra.net.file_transfer import FileTransferAttributes
 from xpra.server.mixins.stub_server_mixin import StubServerMixin
@@ -305,8 +305,8 @@ class FilePrintServer(StubServerMixin):
                               "The file requested is too large to send:\n%s\nis %s" % (argf, std_unit(file_size)),
                                icon_name="file")
                 return
-        data = load_binary_file(filename)
-        ss.send_file(filename, "", data, len(data), openit=openit, options={"request-file" : (argf, openit)})
+            #the file data will be read from disk as it is being sent:
+            ss.send_file(filename, "", None, file_size, openit=openit, options={"request-file" : (argf, openit)})
 
 
     def init_packet_handlers(self):
@@ -9,7 +9,6 @@ import os.path
 from time import monotonic
 
 from xpra.util import parse_scaling_value, csv, from0to100, net_utf8, typedict, ConnectionMessage
-from xpra.os_util import load_binary_file
 from xpra.simple_stats import std_unit
 from xpra.scripts.config import parse_bool, FALSE_OPTIONS, TRUE_OPTIONS
 from xpra.server.control_command import ArgsControlCommand, ControlError
@@ -347,20 +346,16 @@ class ServerBaseControlCommands(StubServerMixin):
 
         #find the file and load it:
         actual_filename = os.path.abspath(os.path.expanduser(filename))
+        if not os.path.exists(actual_filename):
+            raise ControlError(f"file {filename!r} does not exist")
         try:
             stat = os.stat(actual_filename)
             log("os.stat(%s)=%s", actual_filename, stat)
-        except os.error:
+        except os.error as e:
             log("os.stat(%s)", actual_filename, exc_info=True)
-        else:
-            checksize(stat.st_size)
-        if not os.path.exists(actual_filename):
-            raise ControlError(f"file {filename!r} does not exist")
-        data = load_binary_file(actual_filename)
-        if data is None:
-            raise ControlError(f"failed to load {actual_filename!r}")
+            raise ControlError(f"failed to access {actual_filename!r}: {e}") from None
         #verify size:
-        file_size = len(data)
+        file_size = stat.st_size
         checksize(file_size)
         #send it to each client:
         for ss in sources:
@@ -379,7 +374,8 @@ class ServerBaseControlCommands(StubServerMixin):
                 log.warn(" client %s file size limit is %sB (file is %sB)",
                          ss, std_unit(ss.file_size_limit), std_unit(file_size))
             else:
-                ss.send_file(filename, "", data, file_size, *send_file_args)
+                #the file data is read from disk as the transfer progresses:
+                ss.send_file(actual_filename, "", None, file_size, *send_file_args)
         return f"{command_type} of {filename!r} to {client_uuids} initiated"
 
 
@@ -8,6 +8,7 @@
 from xpra.util import typedict
 from xpra.server.mixins.stub_server_mixin import StubServerMixin
 from xpra.server.source.windows_mixin import WindowsMixin
+from xpra.server.window.damage_trace import get_damage_recorder
 from xpra.log import Logger
 
 log = Logger("window")
@@ -30,6 +31,7 @@ class WindowServer(StubServerMixin):
         self.window_filters = []
         self.window_min_size = 0, 0
         self.window_max_size = 2**15-1, 2**15-1
+        self.damage_recorder = None
 
     def init(self, opts):
         def parse_window_size(v, default_value=(0, 0)):
@@ -50,12 +52,17 @@ class WindowServer(StubServerMixin):
         self.update_size_constraints(minw, minh, maxw, maxh)
 
     def setup(self):
+        self.damage_recorder = get_damage_recorder()
         self.load_existing_windows()
         self.add_init_thread_callback(self.reinit_window_encoders)
 
     def cleanup(self):
         for window in tuple(self._window_to_id.keys()):
             window.unmanage()
+        dr = self.damage_recorder
+        if dr:
+            self.damage_recorder = None
+            dr.close()
         #this can cause errors if we receive packets during shutdown:
         #self._window_to_id = {}
         #self._id_to_window = {}
@@ -266,6 +273,10 @@ class WindowServer(StubServerMixin):
 
     def refresh_window_area(self, window, x, y, width, height, options=None):
         wid = self._window_to_id[window]
+        dr = self.damage_recorder
+        if dr and width>0 and height>0:
+            #record the damage once, not once for each client:
+            dr.record_damage(wid, window, x, y, width, height, options)
         for ss in tuple(self._server_sources.values()):
             damage = getattr(ss, "damage", None)
             if damage:
@@ -9,8 +9,10 @@ from time import sleep, time, monotonic
 from queue import Queue
 
 from xpra.net.net_util import get_network_caps
-from xpra.net.compression import Compressed, compressed_wrapper, MIN_COMPRESS_SIZE
+from xpra.net.compression import Compressed, compressed_wrapper, get_compression_type, MIN_COMPRESS_SIZE
+from xpra.net.packet_encoding import get_packet_encoding_type
 from xpra.net.protocol.constants import CONNECTION_LOST
+from xpra.net.protocol.socket_handler import EncodedPacket
 from xpra.net.common import MAX_PACKET_SIZE
 from xpra.net.digest import get_salt, gendigest
 from xpra.codecs.loader import load_codec, get_codec
@@ -40,6 +42,8 @@ PASSTHROUGH_RGB = envbool("XPRA_PROXY_PASSTHROUGH_RGB", False)
 VIDEO_TIMEOUT = 5                  #destroy video encoder after N seconds of idle state
 LEGACY_SALT_DIGEST = envbool("XPRA_LEGACY_SALT_DIGEST", False)
 PASSTHROUGH_AUTH = envbool("XPRA_PASSTHROUGH_AUTH", True)
+#forward packets without decoding them when we don't need to look at them:
+PASSTHROUGH_PACKETS = envbool("XPRA_PROXY_PASSTHROUGH_PACKETS", True)
 
 PING_INTERVAL = max(1, envint("XPRA_PROXY_PING_INTERVAL", 5))*1000
 PING_WARNING = max(5, envint("XPRA_PROXY_PING_WARNING", 5))
@@ -47,6 +51,9 @@ PING_TIMEOUT = max(5, envint("XPRA_PROXY_PING_TIMEOUT", 90))
 
 CLIENT_REMOVE_CAPS = ("cipher", "challenge", "digest", "aliases", "compression", "lz4", "lz0", "zlib")
 CLIENT_REMOVE_CAPS_CHALLENGE = ("cipher", "digest", "aliases", "compression", "lz4", "lz0", "zlib")
+#the packet types that we always decode, see `process_client_packet` and `process_server_packet`:
+CLIENT_INSPECT_PACKETS = ("hello", "set_deflate", "ping_echo", "disconnect")
+SERVER_INSPECT_PACKETS = ("hello", "ping_echo", "info-response", "lost-window", "challenge", "disconnect")
 
 
 class ProxyInstance:
@@ -82,6 +89,8 @@ class ProxyInstance:
         self.client_ping_timer = None
         self.server_ping_timer = None
         self.client_challenge_packet = None
+        self.client_forwarded = 0
+        self.server_forwarded = 0
         self.exit = False
         self.lost_windows = None
         self.encode_queue = None            #holds draw packets to encode
@@ -117,8 +126,7 @@ class ProxyInstance:
         self.server_protocol.enable_default_encoder()
 
         self.lost_windows = set()
-        self.encode_queue = Queue()
-        self.encode_thread = start_thread(self.encode_loop, "encode")
+        self.start_encode_thread()
 
         self.start_network_threads()
         if self.caps.boolget("ping-echo-sourceid"):
@@ -129,6 +137,10 @@ class ProxyInstance:
     def start_network_threads(self):
         raise NotImplementedError()
 
+    def start_encode_thread(self):
+        self.encode_queue = Queue()
+        self.encode_thread = start_thread(self.encode_loop, "encode")
+
 
     ################################################################################
 
@@ -138,6 +150,9 @@ class ProxyInstance:
                 log("sending disconnect to %s", proto)
                 proto.send_disconnect([ConnectionMessage.SERVER_SHUTDOWN]+list(reasons))
         #wait for connections to close down cleanly before we exit
+        self.wait_for_connections_closed()
+
+    def wait_for_connections_closed(self):
         cp = self.client_protocol
         sp = self.server_protocol
         for i in range(10):
@@ -203,6 +218,10 @@ class ProxyInstance:
                 "version"    : vparts(XPRA_VERSION, FULL_INFO+1),
                 ""           : sinfo,
                 "latency"    : linfo,
+                "passthrough" : {
+                    "client"    : self.client_forwarded,
+                    "server"    : self.server_forwarded,
+                    },
                 },
             "window" : self.get_window_info(),
             }
@@ -369,6 +388,44 @@ class ProxyInstance:
         self.queue_server_packet(packet)
 
 
+    def enable_packet_passthrough(self):
+        if not PASSTHROUGH_PACKETS:
+            return
+        log("enable_packet_passthrough()")
+        self.client_protocol.raw_packet_cb = self.forward_client_packet
+        self.server_protocol.raw_packet_cb = self.forward_server_packet
+
+    def can_forward(self, proto, chunks) -> bool:
+        """
+            The chunks can only be sent as they are
+            if the other end uses the same packet encoder and compressor.
+        """
+        for proto_flags, index, level, _ in chunks:
+            if index==0 and get_packet_encoding_type(proto_flags)!=proto.encoder:
+                return False
+            if level>0 and get_compression_type(level)!=proto.compressor:
+                return False
+        return True
+
+    def forward_client_packet(self, proto, packet_type, chunks) -> bool:
+        if packet_type in CLIENT_INSPECT_PACKETS or not self.can_forward(self.server_protocol, chunks):
+            return False
+        self.client_has_more = proto.receive_pending
+        self.client_forwarded += 1
+        self.queue_server_packet(EncodedPacket(packet_type, chunks))
+        return True
+
+    def forward_server_packet(self, proto, packet_type, chunks) -> bool:
+        if packet_type in SERVER_INSPECT_PACKETS or not self.can_forward(self.client_protocol, chunks):
+            return False
+        if packet_type=="draw" and (self.video_encoder_types or PASSTHROUGH_RGB):
+            #we may need to re-encode it:
+            return False
+        self.server_has_more = proto.receive_pending
+        self.server_forwarded += 1
+        self.queue_client_packet(EncodedPacket(packet_type, chunks))
+        return True
+
     def queue_server_packet(self, packet):
         log("queueing server packet: %s (queue size=%s)", bytestostr(packet[0]), self.server_packets.qsize())
         self.server_packets.put(packet)
@@ -482,6 +539,8 @@ class ProxyInstance:
             #may need to bump packet size:
             proto.max_packet_size = max(MAX_PACKET_SIZE, maxw*maxh*4*4)
             packet = ("hello", caps)
+            #from now on, we only need to decode the packets we modify or handle:
+            self.enable_packet_passthrough()
         elif packet_type=="ping_echo" and self.server_ping_timer and len(packet)>=7 and strtobytes(packet[6])==strtobytes(self.uuid):
             #this is one of our ping packets:
             self.server_last_ping_echo = packet[1]
@@ -584,44 +643,47 @@ class ProxyInstance:
 
     def encode_loop(self):
         """ thread for slower encoding related work """
-        def delvideo(wid):
-            self.video_encoders.pop(wid, None)
-            self.video_encoders_last_used_time.pop(wid, None)
         while not self.exit:
             packet = self.encode_queue.get()
             if packet is None:
                 return
             try:
-                packet_type = bytestostr(packet[0])
-                if packet_type=="lost-window":
-                    wid = packet[1]
-                    self.lost_windows.remove(wid)
-                    ve = self.video_encoders.get(wid)
-                    if ve:
-                        delvideo(wid)
-                        ve.clean()
-                elif packet_type=="draw":
-                    #modify the packet with the video encoder:
-                    if self.process_draw(packet):
-                        #then send it as normal:
-                        self.queue_client_packet(packet)
-                elif packet_type=="check-video-timeout":
-                    #not a real packet, this is added by the timeout check:
-                    wid = packet[1]
-                    ve = self.video_encoders.get(wid)
-                    now = monotonic()
-                    idle_time = now-self.video_encoders_last_used_time.get(wid, 0)
-                    if ve and idle_time>VIDEO_TIMEOUT:
-                        enclog("timing out the video encoder context for window %s", wid)
-                        #timeout is confirmed, we are in the encoding thread,
-                        #so it is now safe to clean it up:
-                        ve.clean()
-                        delvideo(wid)
-                else:
-                    enclog.warn("unexpected encode packet: %s", packet_type)
+                self.process_encode_packet(packet)
             except Exception:
                 enclog.warn("error encoding packet", exc_info=True)
 
+    def process_encode_packet(self, packet):
+        def delvideo(wid):
+            self.video_encoders.pop(wid, None)
+            self.video_encoders_last_used_time.pop(wid, None)
+        packet_type = bytestostr(packet[0])
+        if packet_type=="lost-window":
+            wid = packet[1]
+            self.lost_windows.remove(wid)
+            ve = self.video_encoders.get(wid)
+            if ve:
+                delvideo(wid)
+                ve.clean()
+        elif packet_type=="draw":
+            #modify the packet with the video encoder:
+            if self.process_draw(packet):
+                #then send it as normal:
+                self.queue_client_packet(packet)
+        elif packet_type=="check-video-timeout":
+            #not a real packet, this is added by the timeout check:
+            wid = packet[1]
+            ve = self.video_encoders.get(wid)
+            now = monotonic()
+            idle_time = now-self.video_encoders_last_used_time.get(wid, 0)
+            if ve and idle_time>VIDEO_TIMEOUT:
+                enclog("timing out the video encoder context for window %s", wid)
+                #timeout is confirmed, we are in the encoding thread,
+                #so it is now safe to clean it up:
+                ve.clean()
+                delvideo(wid)
+        else:
+            enclog.warn("unexpected encode packet: %s", packet_type)
+
 
     def process_draw(self, packet):
         wid, x, y, width, height, encoding, pixels, _, rowstride, client_options = packet[1:11]
@@ -0,0 +1,179 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from itertools import count
+from threading import Lock
+from gi.repository import GLib  # @UnresolvedImport
+
+from xpra.net.protocol.asyncio_handler import AsyncioSocketProtocol
+from xpra.net.quic.asyncio_thread import threaded_asyncio_loop
+from xpra.server.proxy.proxy_instance_thread import ProxyInstanceThread
+from xpra.util import envint
+from xpra.log import Logger
+
+log = Logger("proxy")
+
+ASYNCIO_LOOPS = max(1, envint("XPRA_PROXY_ASYNCIO_LOOPS", 1))
+#only plain sockets can be used with the event loop:
+ASYNCIO_SOCKET_TYPES = ("tcp", "socket")
+
+
+loops = {}
+loops_lock = Lock()
+
+def get_asyncio_loop():
+    """
+        Returns the event loop running the fewest sessions,
+        starting a new one if we have not reached `ASYNCIO_LOOPS` yet.
+    """
+    with loops_lock:
+        if len(loops)<ASYNCIO_LOOPS:
+            loops[threaded_asyncio_loop()] = 0
+        tloop = min(loops, key=loops.get)
+        loops[tloop] += 1
+        return tloop
+
+def release_asyncio_loop(tloop):
+    with loops_lock:
+        if tloop in loops:
+            loops[tloop] -= 1
+
+def get_loops_info() -> dict:
+    with loops_lock:
+        return dict((i, n) for i, n in enumerate(loops.values()))
+
+
+timer_ids = count(1)
+
+
+class InlineEncodeQueue:
+    """
+        Used in place of the encode queue when we don't have any video encoders,
+        processing draw packets is then cheap enough to be done from the event loop.
+    """
+    def __init__(self, process_packet):
+        self.process_packet = process_packet
+
+    def put(self, packet):
+        self.process_packet(packet)
+
+    def put_nowait(self, packet):
+        if packet is not None:
+            self.process_packet(packet)
+
+
+class ProxyInstanceAsyncio(ProxyInstanceThread):
+    """
+        A proxy instance which runs in the proxy server process,
+        without using any threads of its own:
+        both connections are handled by a shared asyncio event loop.
+    """
+
+    def __init__(self, session_options,
+                 video_encoders, pings,
+                 client_conn, client_state, server_conn,
+                 disp_desc, cipher, cipher_mode, encryption_key, caps):
+        super().__init__(session_options,
+                         video_encoders, pings,
+                         None, server_conn,
+                         disp_desc, cipher, cipher_mode, encryption_key, caps)
+        self.client_conn = client_conn
+        self.client_state = client_state
+        self.tloop = None
+        self.loop = None
+        self.timers = {}
+        #called from the main thread when this instance has stopped:
+        self.reap_cb = None
+
+    def __repr__(self):
+        return "asyncio proxy instance"
+
+    def get_info(self) -> dict:
+        info = super().get_info()
+        info["asyncio-loops"] = get_loops_info()
+        return info
+
+
+    def idle_add(self, fn, *args, **kwargs):
+        tid = next(timer_ids)
+        self.loop.call_soon_threadsafe(self.schedule_timer, tid, 0, fn, args, kwargs)
+        return tid
+
+    def timeout_add(self, timeout, fn, *args, **kwargs):
+        tid = next(timer_ids)
+        self.loop.call_soon_threadsafe(self.schedule_timer, tid, timeout, fn, args, kwargs)
+        return tid
+
+    def source_remove(self, tid):
+        self.loop.call_soon_threadsafe(self.cancel_timer, tid)
+
+    def schedule_timer(self, tid, timeout, fn, args, kwargs):
+        def run():
+            self.timers.pop(tid, None)
+            try:
+                again = fn(*args, **kwargs)
+            except Exception:
+                log.error(f"Error calling {fn}", exc_info=True)
+                return
+            #same as GLib: repeat the call if the function returns True
+            if again:
+                self.schedule_timer(tid, timeout, fn, args, kwargs)
+        self.timers[tid] = self.loop.call_later(timeout/1000, run)
+
+    def cancel_timer(self, tid):
+        handle = self.timers.pop(tid, None)
+        if handle:
+            handle.cancel()
+
+
+    def run(self):
+        log("ProxyInstanceAsyncio.run()")
+        self.tloop = get_asyncio_loop()
+        self.loop = self.tloop.loop
+        self.client_protocol = AsyncioSocketProtocol(self.loop, self, self.client_conn,
+                                                     self.process_client_packet, self.get_client_packet)
+        self.client_protocol.restore_state(self.client_state)
+        self.server_protocol = AsyncioSocketProtocol(self.loop, self, self.server_conn,
+                                                     self.process_server_packet, self.get_server_packet)
+        self.log_start()
+        #skip ProxyInstanceThread.run:
+        super(ProxyInstanceThread, self).run()      #pylint: disable=bad-super-call
+
+    def start_network_threads(self):
+        log("start_network_threads()")
+        self.server_protocol.start()
+        self.client_protocol.start()
+
+    def start_encode_thread(self):
+        if self.video_encoder_types:
+            #video encoding is too slow for the event loop:
+            super().start_encode_thread()
+            return
+        self.encode_queue = InlineEncodeQueue(self.process_encode_packet)
+
+    def wait_for_connections_closed(self):
+        #we must not block the event loop,
+        #the protocols close themselves once the disconnect packet has been sent:
+        def force_close():
+            for proto in (self.client_protocol, self.server_protocol):
+                if proto and not proto.is_closed():
+                    log.warn("Warning: proxy instance connection has not been closed yet:")
+                    log.warn(" %s", proto)
+                    proto.close()
+        self.timeout_add(1000, force_close)
+
+    def stop(self, skip_proto, *reasons):
+        loop = self.loop
+        if loop and not self.client_protocol.in_loop_thread():
+            loop.call_soon_threadsafe(self.stop, skip_proto, *reasons)
+            return
+        super().stop(skip_proto, *reasons)
+
+    def stopped(self):
+        if self.tloop:
+            release_asyncio_loop(self.tloop)
+            self.tloop = None
+        if self.reap_cb:
+            GLib.idle_add(self.reap_cb)
@@ -300,6 +300,7 @@ class ProxyInstanceProcess(ProxyInstance, QueueScheduler, Process):
             if is_req("info"):
                 info = self.get_proxy_info(proto)
                 info.setdefault("connection", {}).update(self.get_connection_info())
+                info.setdefault("proxy", {})["scheduler"] = self.get_scheduler_info()
                 proto.send_now(("hello", info))
                 self.timeout_add(5*1000, self.send_disconnect, proto, ConnectionMessage.CLIENT_EXIT_TIMEOUT, "info sent")
                 return
@@ -44,6 +44,9 @@ STOP_PROXY_SOCKET_TYPES = os.environ.get("XPRA_STOP_PROXY_SOCKET_TYPES", "socket
 STOP_PROXY_AUTH_SOCKET_TYPES = os.environ.get("XPRA_STOP_PROXY_AUTH_SOCKET_TYPES", "socket").split(",")
 #something (a thread lock?) doesn't allow us to use multiprocessing on MS Windows:
 PROXY_INSTANCE_THREADED = envbool("XPRA_PROXY_INSTANCE_THREADED", WIN32)
+#run the proxy instances from shared asyncio event loops
+#(their connections cannot be stolen and handed over again):
+PROXY_INSTANCE_ASYNCIO = envbool("XPRA_PROXY_INSTANCE_ASYNCIO", False)
 PROXY_CLEANUP_GRACE_PERIOD = envfloat("XPRA_PROXY_CLEANUP_GRACE_PERIOD", "0.5")
 
 MAX_CONCURRENT_CONNECTIONS = envint("XPRA_PROXY_MAX_CONCURRENT_CONNECTIONS", 200)
@@ -518,6 +521,21 @@ class ProxyServer(ServerCore):
             self.instances[pit] = (False, display, None)
             return
 
+        if PROXY_INSTANCE_ASYNCIO:
+            try:
+                #this uses the asyncio thread from the quic module:
+                from xpra.server.proxy.proxy_instance_asyncio import ASYNCIO_SOCKET_TYPES
+            except ImportError as e:
+                log.warn("Warning: asyncio proxy instances are not available")
+                log.warn(" %s", e)
+            else:
+                socktypes = (get_socktype(client_proto), server_conn.socktype)
+                if all(socktype in ASYNCIO_SOCKET_TYPES for socktype in socktypes):
+                    self.start_asyncio_proxy(client_proto, server_conn, display, env_options, session_options,
+                                             disp_desc, cipher, cipher_mode, encryption_key, c)
+                    return
+                log("cannot use asyncio mode with %s connections", csv(socktypes))
+
         #this may block, so run it in a thread:
         def start_proxy_process():
             log("start_proxy_process()")
@@ -572,6 +590,47 @@ class ProxyServer(ServerCore):
                 message_queue.put("socket-handover-complete")
         start_thread(start_proxy_process, f"start_proxy({client_proto})")
 
+    def start_asyncio_proxy(self, client_proto, server_conn, display, env_options, session_options,
+                            disp_desc, cipher, cipher_mode, encryption_key, caps):
+        if env_options:
+            log.warn("environment options are ignored in asyncio mode")
+        #waiting for the network threads to exit may block, so run it in a thread:
+        def start_proxy_asyncio():
+            log("start_proxy_asyncio()")
+            #no other packets should be arriving until the proxy instance responds to the initial hello packet
+            def unexpected_packet(packet):
+                if packet:
+                    log.warn("Warning: received an unexpected packet")
+                    log.warn(" from the proxy connection %s:", client_proto)
+                    log.warn(" %s", repr_ellipsized(packet))
+                    client_proto.close()
+            client_conn = client_proto.steal_connection(unexpected_packet)
+            client_state = client_proto.save_state()
+            if not client_proto.wait_for_io_threads_exit(5+self._socket_timeout):
+                log.error("Error: some network IO threads have failed to terminate")
+                client_conn.close()
+                server_conn.close()
+                return
+            client_conn.set_active(True)
+            from xpra.server.proxy.proxy_instance_asyncio import ProxyInstanceAsyncio
+            pia = ProxyInstanceAsyncio(session_options, self.video_encoders, self.pings,
+                                       client_conn, client_state, server_conn,
+                                       disp_desc, cipher, cipher_mode, encryption_key, caps)
+            pia.reap_cb = self.reap
+            self.instances[pia] = (False, display, None)
+            try:
+                pia.run()
+            except Exception as e:
+                log("start_proxy_asyncio() failed", exc_info=True)
+                log.error("Error starting asyncio proxy instance:")
+                log.estr(e)
+                if pia.loop:
+                    pia.stop(None, f"failed to start: {e}")
+                else:
+                    client_conn.close()
+                    server_conn.close()
+        start_thread(start_proxy_asyncio, f"start_proxy({client_proto})")
+
     def start_new_session(self, username, _password, uid, gid, new_session_dict=None, displays=()):
         log("start_new_session%s", (username, "..", uid, gid, new_session_dict, displays))
         sns = typedict(new_session_dict or {})
@@ -198,13 +198,21 @@ class RFBServer:
         pixel_format = packet[4:14]
         self._server_sources[proto].set_pixel_format(pixel_format)
 
-    def _process_rfb_FramebufferUpdateRequest(self, _proto, packet):
+    def _process_rfb_FramebufferUpdateRequest(self, proto, packet):
         #pressed, _, _, keycode = packet[1:5]
         inc, x, y, w, h = packet[1:6]
         log("RFB: FramebufferUpdateRequest inc=%s, geometry=%s", inc, (x, y, w, h))
+        source = self._server_sources.get(proto)
+        if source:
+            source.update_request(inc, x, y, w, h)
         if not inc:
             model = self._get_rfb_desktop_model()
             self.idle_add(self.refresh_window_area, model, x, y, w, h)
+        elif source and source.deferred:
+            #the client is ready for more, send the damage we had to defer:
+            model = self._get_rfb_desktop_model()
+            if model:
+                self.idle_add(source.flush_deferred, self._window_to_id[model], model)
 
     def _process_rfb_ClientCutText(self, _proto, packet):
         #l = packet[4]
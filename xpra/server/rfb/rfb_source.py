@@ -9,24 +9,33 @@ from threading import Event
 
 from xpra.net.rfb.rfb_const import RFBEncoding
 from xpra.net.rfb.rfb_encode import (
-    raw_encode, tight_encode, tight_png, rgb222_encode, #zlib_encode,
+    raw_encode, tight_encode, tight_png, rgb222_encode, zlib_encode, zrle_encode, copyrect_encode,
+    ZlibStream,
     )
 from xpra.net.protocol.socket_handler import PACKET_JOIN_SIZE
+from xpra.buffers.xxh import hash_tiles  #@UnresolvedImport
+from xpra.server.window.motion import ScrollData  #@UnresolvedImport
 from xpra.os_util import memoryview_to_bytes
-from xpra.os_util import strtobytes
-from xpra.util import AtomicInteger, csv
+from xpra.os_util import strtobytes, bytestostr
+from xpra.util import AtomicInteger, csv, envint, envbool
 from xpra.log import Logger
 
 log = Logger("rfb")
 
 counter = AtomicInteger()
 
+TILE_SIZE = max(16, envint("XPRA_RFB_TILE_SIZE", 64))
+SCROLL_ENCODING = envbool("XPRA_RFB_SCROLL_ENCODING", True)
+#the pixel format we can send ZRLE CPIXELs for (32bpp, depth 24, little endian BGRX):
+ZRLE_PIXEL_FORMAT = (32, 24, 0, 1, 255, 255, 255, 16, 8, 0)
+
 
 class RFBSource:
     __slots__ = (
         "protocol", "close_event", "log_disconnect",
         "ui_client", "counter", "share", "uuid", "lock", "keyboard_config",
-        "encodings", "quality", "pixel_format"
+        "encodings", "quality", "pixel_format",
+        "tile_hashes", "tiles_size", "zlib_streams", "scroll_data", "scroll_area", "deferred", "stats",
     )
     def __init__(self, protocol, share=False):
         self.protocol = protocol
@@ -41,12 +50,31 @@ class RFBSource:
         self.encodings = [RFBEncoding.RAW]
         self.pixel_format = (32, 24, 0, 1, 255, 255, 255, 16, 8, 0)
         self.quality = 0
+        #checksums of the tiles the client has, indexed by tile position:
+        self.tile_hashes = {}
+        self.tiles_size = (0, 0)
+        #each zlib based encoding uses its own stream:
+        self.zlib_streams = {}
+        self.scroll_data = None
+        self.scroll_area = None
+        #damage area we could not send yet:
+        self.deferred = None
+        self.stats = {
+            "tiles-sent"    : 0,
+            "tiles-skipped" : 0,
+            "tiles-copied"  : 0,
+            "copyrect"      : 0,
+            "deferred"      : 0,
+            }
 
     def get_info(self) -> dict:
         return {
             "protocol"  : "rfb",
             "uuid"      : self.uuid,
             "share"     : self.share,
+            "tile-size" : TILE_SIZE,
+            "encodings" : csv(e.name for e in self.encodings),
+            "damage"    : dict(self.stats),
             }
 
     def set_encodings(self, encodings):
@@ -109,38 +137,206 @@ class RFBSource:
     def update_mouse(self, *args):
         log("update_mouse%s", args)
 
+    def update_request(self, incremental, x, y, w, h):
+        if not incremental:
+            #the client wants this area refreshed, so forget what it has:
+            self.invalidate_tiles(x, y, w, h)
+
+    def invalidate_tiles(self, x, y, w, h):
+        for ty in range(y//TILE_SIZE, (y+h+TILE_SIZE-1)//TILE_SIZE):
+            for tx in range(x//TILE_SIZE, (x+w+TILE_SIZE-1)//TILE_SIZE):
+                self.tile_hashes.pop((tx, ty), None)
+        sd = self.scroll_data
+        if sd:
+            sd.invalidate(x, y, w, h)
+
+    def defer_damage(self, x, y, w, h):
+        self.stats["deferred"] += 1
+        d = self.deferred
+        if d:
+            dx, dy, dw, dh = d
+            x2 = max(dx+dw, x+w)
+            y2 = max(dy+dh, y+h)
+            x = min(x, dx)
+            y = min(y, dy)
+            w = x2-x
+            h = y2-y
+        self.deferred = (x, y, w, h)
+
+    def flush_deferred(self, wid, window):
+        d = self.deferred
+        if d:
+            self.deferred = None
+            self.damage(wid, window, *d)
+
+    def get_encoder(self):
+        if self.pixel_format[:2]!=(32, 24):
+            if self.pixel_format[:3]==(8, 6, 0):
+                #crappy initial format chosen by realvnc
+                return rgb222_encode, {}
+            log("damage: unsupported client pixel format: %s", self.pixel_format)
+            return None, {}
+        if RFBEncoding.TIGHT_PNG in self.encodings:
+            return tight_png, {}
+        if RFBEncoding.ZRLE in self.encodings and self.pixel_format==ZRLE_PIXEL_FORMAT:
+            return zrle_encode, {"stream" : self.get_zlib_stream(RFBEncoding.ZRLE)}
+        if RFBEncoding.TIGHT in self.encodings:
+            return tight_encode, {"quality" : self.quality}
+        if RFBEncoding.ZLIB in self.encodings:
+            return zlib_encode, {"stream" : self.get_zlib_stream(RFBEncoding.ZLIB)}
+        return raw_encode, {}
+
+    def get_zlib_stream(self, encoding):
+        stream = self.zlib_streams.get(encoding)
+        if not stream:
+            stream = self.zlib_streams[encoding] = ZlibStream()
+        return stream
+
     def damage(self, _wid, window, x, y, w, h, options=None):
         polling = options and options.get("polling", False)
         p = self.protocol
-        if polling and p is None or p.queue_size()>=2:
+        if p is None or p.queue_size()>=2:
             #very basic RFB update rate control,
             #if there are packets waiting already
-            #we'll just process the next polling update instead:
+            #we'll just process the next polling update instead,
+            #or the next damage event:
+            if not polling:
+                self.defer_damage(x, y, w, h)
             return
         if self.is_closed():
             return
-        encode = raw_encode
-        kwargs = {}
-        if self.pixel_format[:2]!=(32, 24):
-            if self.pixel_format[:3]==(8, 6, 0):
-                #crappy initial format chosen by realvnc
-                encode = rgb222_encode
-            else:
-                log("damage: unsupported client pixel format: %s", self.pixel_format)
-                return
-        elif RFBEncoding.TIGHT_PNG in self.encodings:
-            encode = tight_png
-        elif RFBEncoding.TIGHT in self.encodings:
-            encode = tight_encode
-            kwargs = {"quality" : self.quality}
-        #doesn't work
-        #elif RFBEncoding.ZLIB in self.encodings:
-        #    encode = zlib_encode
-        packets = encode(window, x, y, w, h, **kwargs)
+        encode, kwargs = self.get_encoder()
+        if not encode:
+            return
+        if self.deferred:
+            self.defer_damage(x, y, w, h)
+            x, y, w, h = self.deferred
+            self.deferred = None
+        ww, wh = window.get_dimensions()
+        if self.tiles_size!=(ww, wh):
+            self.tiles_size = (ww, wh)
+            self.tile_hashes = {}
+            self.scroll_data = None
+        #grab the area aligned to the tile grid:
+        x1 = max(0, x//TILE_SIZE*TILE_SIZE)
+        y1 = max(0, y//TILE_SIZE*TILE_SIZE)
+        x2 = min(ww, (x+w+TILE_SIZE-1)//TILE_SIZE*TILE_SIZE)
+        y2 = min(wh, (y+h+TILE_SIZE-1)//TILE_SIZE*TILE_SIZE)
+        if x2<=x1 or y2<=y1:
+            return
+        img = window.get_image(x1, y1, x2-x1, y2-y1)
+        window.acknowledge_changes()
+        if not img:
+            return
+        img.set_target_x(x1)
+        img.set_target_y(y1)
+        if encode in (zrle_encode, zlib_encode) and bytestostr(img.get_pixel_format()) not in ("BGRX", "BGRA"):
+            encode, kwargs = raw_encode, {}
+        packets = []
+        copied_rows = ()
+        if x1==0 and x2==ww:
+            #full width updates can use the scroll detection:
+            packets, copied_rows = self.copy_scrolled(img)
+        elif self.scroll_data:
+            #the scroll data would no longer match what the client has:
+            self.scroll_data.invalidate(x1, y1, x2-x1, y2-y1)
+        for sx, sy, sw, sh in self.get_changed_tiles(img, copied_rows):
+            packets += encode(img.get_sub_image(sx, sy, sw, sh), **kwargs)
         if not packets:
             return
         self.send_many(*packets)
 
+    def copy_scrolled(self, img):
+        """
+            Finds the rows that have moved since the last update,
+            and returns CopyRect packets for them,
+            along with the list of rows that the client will then have.
+        """
+        if not SCROLL_ENCODING or RFBEncoding.COPYRECT not in self.encodings:
+            return [], ()
+        x = img.get_target_x()
+        y = img.get_target_y()
+        w = img.get_width()
+        h = img.get_height()
+        sd = self.scroll_data
+        if not sd or self.scroll_area!=(x, y, w, h):
+            #the previous checksums are for a different area,
+            #so they cannot be used to find the rows that have moved in this one:
+            sd = self.scroll_data = ScrollData()
+            self.scroll_area = (x, y, w, h)
+        sd.update(img.get_pixels(), x, y, w, h, img.get_rowstride(), img.get_bytesperpixel())
+        sd.calculate()
+        v = sd.get_scroll_values()
+        if not v:
+            return [], ()
+        scrolls = dict((d, lines) for d, lines in v[0].items() if d!=0)
+        if not scrolls:
+            return [], ()
+        #only use the best distance,
+        #so the copies cannot overwrite each other's source area:
+        distance, line_defs = max(scrolls.items(), key=lambda item: sum(item[1].values()))
+        log("copy_scrolled(%s) scrolls=%s, using distance %i", img, scrolls, distance)
+        packets = []
+        copied_rows = [False]*h
+        #copy in an order that does not clobber the areas we still have to copy:
+        for start, count in sorted(line_defs.items(), reverse=distance>0):
+            packets += copyrect_encode(x, y+start, x, y+start+distance, w, count)
+            copied_rows[start+distance:start+distance+count] = [True]*count
+        self.stats["copyrect"] += len(packets)
+        return packets, copied_rows
+
+    def get_changed_tiles(self, img, copied_rows=()):
+        """
+            Returns the list of rectangles (relative to the image)
+            covering the tiles that differ from what the client has,
+            and updates the tile checksums.
+        """
+        w = img.get_width()
+        h = img.get_height()
+        hashes = hash_tiles(img.get_pixels(), w, h, img.get_rowstride(), img.get_bytesperpixel(), TILE_SIZE)
+        tiles_x = (w+TILE_SIZE-1)//TILE_SIZE
+        tiles_y = (h+TILE_SIZE-1)//TILE_SIZE
+        tx0 = img.get_target_x()//TILE_SIZE
+        ty0 = img.get_target_y()//TILE_SIZE
+        stats = self.stats
+        rects = []
+        #rectangles that may be extended down, indexed by their tile span:
+        open_rects = {}
+        for ty in range(tiles_y):
+            #tiles fully covered by copied rows don't need to be sent:
+            copied = all(copied_rows[ty*TILE_SIZE:min(h, (ty+1)*TILE_SIZE)]) if copied_rows else False
+            spans = []
+            for tx in range(tiles_x):
+                key = (tx0+tx, ty0+ty)
+                v = hashes[ty*tiles_x+tx]
+                if self.tile_hashes.get(key)==v:
+                    stats["tiles-skipped"] += 1
+                    continue
+                self.tile_hashes[key] = v
+                if copied:
+                    stats["tiles-copied"] += 1
+                    continue
+                stats["tiles-sent"] += 1
+                if spans and spans[-1][1]==tx:
+                    spans[-1][1] = tx+1
+                else:
+                    spans.append([tx, tx+1])
+            row_rects = {}
+            for start, end in spans:
+                r = open_rects.get((start, end))
+                if r:
+                    r[3] += 1
+                else:
+                    r = [start, ty, end-start, 1]
+                    rects.append(r)
+                row_rects[(start, end)] = r
+            open_rects = row_rects
+        return tuple((
+            tx*TILE_SIZE, ty*TILE_SIZE,
+            min(w, (tx+tw)*TILE_SIZE)-tx*TILE_SIZE,
+            min(h, (ty+th)*TILE_SIZE)-ty*TILE_SIZE,
+            ) for tx, ty, tw, th in rects)
+
     def send_many(self, *packets):
         #merge small packets together:
         joined = []
@@ -8,6 +8,7 @@
 
 import os
 from time import monotonic
+from threading import Lock
 
 from xpra.server.server_core import ServerCore
 from xpra.server.background_worker import add_work_item
@@ -86,6 +87,19 @@ log("ServerBaseClass%s", SERVER_BASES)
 
 CLIENT_CAN_SHUTDOWN = envbool("XPRA_CLIENT_CAN_SHUTDOWN", True)
 MDNS_CLIENT_COUNT = envbool("XPRA_MDNS_CLIENT_COUNT", True)
+POINTER_COALESCE = envbool("XPRA_POINTER_COALESCE", True)
+
+MOTION_PACKETS = ("pointer", "pointer-position")
+
+
+def get_motion_key(packet_type, packet):
+    """ the packet type, device and window of a pointer motion packet """
+    if packet_type=="pointer":
+        #v5: device_id, seq, wid, pdata, props
+        return packet_type, packet[1], packet[3]
+    #pre v5: wid, pdata, modifiers, buttons, props, device_id
+    device_id = packet[5] if len(packet)>=6 else -1
+    return packet_type, device_id, packet[1]
 
 
 """
@@ -104,6 +118,10 @@ class ServerBase(ServerBaseClass):
 
         self._authenticated_packet_handlers = {}
         self._authenticated_ui_packet_handlers = {}
+        #the pointer motion packets queued for the ui thread, per connection:
+        self._pending_motion = {}
+        self._pending_motion_lock = Lock()
+        self.pointer_motion_coalesced = 0
 
         self.display_pid = 0
         self._server_sources = {}
@@ -703,6 +721,7 @@ class ServerBase(ServerBaseClass):
             "sharing-toggle"               : self.sharing is None,
             "lock"                         : self.lock is not False,
             "lock-toggle"                  : self.lock is None,
+            "pointer-motion-coalesced"     : self.pointer_motion_coalesced,
             })
 
         # other clients:
@@ -727,6 +746,37 @@ class ServerBase(ServerBaseClass):
         return info
 
 
+    def coalesce_motion(self, proto, packet_type, packet, handler) -> bool:
+        """
+            Pointer motion packets which are still waiting for the ui thread
+            are replaced by newer ones for the same device and window.
+            Any other ui packet is a barrier:
+            the motion queued before it is processed before it.
+            Returns True if the packet has been queued here.
+        """
+        with self._pending_motion_lock:
+            if packet_type not in MOTION_PACKETS:
+                self._pending_motion.pop(proto, None)
+                return False
+            key = get_motion_key(packet_type, packet)
+            pending = self._pending_motion.get(proto)
+            if pending and pending[0]==key:
+                pending[1] = packet
+                self.pointer_motion_coalesced += 1
+                return True
+            pending = [key, packet]
+            self._pending_motion[proto] = pending
+        def call_motion_handler():
+            with self._pending_motion_lock:
+                if self._pending_motion.get(proto) is pending:
+                    del self._pending_motion[proto]
+                latest = pending[1]
+            may_log_packet(False, packet_type, latest)
+            handler(proto, latest)
+        self.idle_add(call_motion_handler)
+        return True
+
+
     def _process_server_settings(self, proto, packet):
         #only used by x11 servers
         pass
@@ -829,6 +879,8 @@ class ServerBase(ServerBaseClass):
         except ValueError:
             pass
         source = self._server_sources.pop(protocol, None)
+        with self._pending_motion_lock:
+            self._pending_motion.pop(protocol, None)
         if source:
             self.cleanup_source(source)
             add_work_item(self.mdns_update)
@@ -975,6 +1027,8 @@ class ServerBase(ServerBaseClass):
                 handler = self._authenticated_ui_packet_handlers.get(packet_type)
                 if handler:
                     netlog("process ui packet %s", packet_type)
+                    if POINTER_COALESCE and self.coalesce_motion(proto, packet_type, packet, handler):
+                        return
                     self.idle_add(call_handler)
                     return
                 handler = self._authenticated_packet_handlers.get(packet_type)
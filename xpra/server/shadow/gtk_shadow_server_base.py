@@ -128,7 +128,7 @@ class GTKShadowServerBase(ShadowServerBase, GTKServerBase):
                 if not self.capture.refresh():
                     #capture doesn't have any screen updates,
                     #so we can skip calling damage
-                    #(this shortcut is only used with nvfbc)
+                    #(this shortcut is only used with nvfbc and xdamage)
                     return True
             except TransientCodecException as e:
                 log("refresh()", exc_info=True)
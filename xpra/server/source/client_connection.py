@@ -8,7 +8,7 @@
 
 import sys
 from time import sleep, monotonic
-from threading import Event
+from threading import Event, Lock
 from collections import deque
 from queue import Queue
 
@@ -16,6 +16,7 @@ from xpra.make_thread import start_thread
 from xpra.common import FULL_INFO
 from xpra.util import notypedict, envbool, envint, typedict, AtomicInteger
 from xpra.net.compression import compressed_wrapper
+from xpra.simple_stats import get_list_stats
 from xpra.server.source.source_stats import GlobalPerformanceStatistics
 from xpra.server.source.stub_source_mixin import StubSourceMixin
 from xpra.log import Logger
@@ -30,6 +31,11 @@ MIN_BANDWIDTH = envint("XPRA_MIN_BANDWIDTH", 5*1024*1024)
 AUTO_BANDWIDTH_PCT = envint("XPRA_AUTO_BANDWIDTH_PCT", 80)
 assert 1<AUTO_BANDWIDTH_PCT<=100, "invalid value for XPRA_AUTO_BANDWIDTH_PCT: %i" % AUTO_BANDWIDTH_PCT
 YIELD = envbool("XPRA_YIELD", False)
+#number of threads used for encoding window pixels,
+#each window is assigned to one of them so its frames remain in order:
+ENCODE_THREADS = max(1, envint("XPRA_ENCODE_THREADS", 1))
+#how many queue latency values we keep for each class of packets:
+QUEUE_LATENCY_RECS = envint("XPRA_QUEUE_LATENCY_RECS", 100)
 
 counter = AtomicInteger()
 
@@ -52,6 +58,8 @@ class ClientConnection(StubSourceMixin):
     adds the damage pixels ready for processing to the encode_work_queue,
     items are picked off by the separate 'encode' thread (see 'encode_loop')
     and added to the damage_packet_queue.
+    With XPRA_ENCODE_THREADS greater than one, window pixels are encoded by a pool
+    of threads instead, each window being assigned to one of them.
     """
 
     def __init__(self, protocol, disconnect_cb, session_name,
@@ -67,7 +75,7 @@ class ClientConnection(StubSourceMixin):
 
         #holds actual packets ready for sending (already encoded)
         #these packets are picked off by the "protocol" via 'next_packet()'
-        #format: packet, wid, pixels, start_send_cb, end_send_cb
+        #format: packet, wid, pixels, start_send_cb, end_send_cb, fail_cb, wait_for_more, queue_time
         #(only packet is required - the rest can be 0/None for clipboard packets)
         self.packet_queue = deque()
         # the encode work queue is used by mixins that need to encode data before sending it,
@@ -77,7 +85,18 @@ class ClientConnection(StubSourceMixin):
         #the functions should add the packets they generate to the 'packet_queue'
         self.encode_work_queue = None
         self.encode_thread = None
+        #when using more than one encode thread,
+        #the window encode threads each have their own work queue:
+        self.window_encode_queues = {}
+        self.encode_worker_queues = []
+        self.encode_worker_lock = Lock()
         self.ordinary_packets = []
+        #how long the packets wait before we start sending them,
+        #for the 'ordinary_packets' and the encoded packets from the 'packet_queue':
+        self.queue_latency = {
+            "ordinary"  : deque(maxlen=QUEUE_LATENCY_RECS),
+            "encoded"   : deque(maxlen=QUEUE_LATENCY_RECS),
+            }
         self.socket_dir = socket_dir
         self.unix_socket_paths = unix_socket_paths
         self.log_disconnect = log_disconnect
@@ -92,6 +111,7 @@ class ClientConnection(StubSourceMixin):
         # ready for processing:
         self.queue_encode = self.start_queue_encode
         self.protocol.set_packet_source(self.next_packet)
+        self.protocol.set_priority_packet_source(self.next_priority_packet)
 
     def __repr__(self) -> str:
         classname = type(self).__name__
@@ -128,6 +148,7 @@ class ClientConnection(StubSourceMixin):
         log("%s.close()", self)
         self.close_event.set()
         self.protocol = None
+        self.window_encode_queues = {}
         self.statistics.reset(0)
 
 
@@ -252,9 +273,10 @@ class ClientConnection(StubSourceMixin):
 
     def encode_queue_size(self) -> int:
         ewq = self.encode_work_queue
+        size = sum(q.qsize() for q in tuple(self.encode_worker_queues))
         if ewq is None:
-            return 0
-        return ewq.qsize()
+            return size
+        return size+ewq.qsize()
 
     def call_in_encode_thread(self, *fn_and_args):
         """
@@ -264,6 +286,42 @@ class ClientConnection(StubSourceMixin):
         self.statistics.compression_work_qsizes.append((monotonic(), self.encode_queue_size()))
         self.queue_encode(fn_and_args)
 
+    def call_in_window_encode_thread(self, wid, *fn_and_args):
+        """
+            Same as 'call_in_encode_thread' but for work items that belong to a window.
+            When we have more than one encode thread, the window's items
+            all go to the same thread, so they are still processed in order.
+        """
+        if ENCODE_THREADS<=1:
+            self.call_in_encode_thread(*fn_and_args)
+            return
+        q = self.window_encode_queues.get(wid) or self.get_window_encode_queue(wid)
+        self.statistics.compression_work_qsizes.append((monotonic(), self.encode_queue_size()))
+        q.put(fn_and_args)
+
+    def get_window_encode_queue(self, wid):
+        with self.encode_worker_lock:
+            q = self.window_encode_queues.get(wid)
+            if q:
+                return q
+            queues = self.encode_worker_queues
+            if len(queues)<ENCODE_THREADS:
+                q = Queue()
+                queues.append(q)
+                start_thread(self.encode_loop, f"encode-{len(queues)}", args=(q, ))
+            else:
+                #use the thread with the fewest windows:
+                assigned = tuple(self.window_encode_queues.values())
+                q = min(queues, key=assigned.count)
+            log("window %i will be encoded by thread %i", wid, queues.index(q)+1)
+            self.window_encode_queues[wid] = q
+            return q
+
+    def release_window_encode_queue(self, wid):
+        """ the window is gone, so it no longer counts towards its thread's load """
+        with self.encode_worker_lock:
+            self.window_encode_queues.pop(wid, None)
+
     def queue_packet(self, packet, wid=0, pixels=0,
                      start_send_cb=None, end_send_cb=None, fail_cb=None, wait_for_more=False):
         """
@@ -276,22 +334,30 @@ class ClientConnection(StubSourceMixin):
             self.statistics.damage_packet_qpixels.append(
                 (now, wid, sum(x[2] for x in tuple(self.packet_queue) if x[1]==wid))
                 )
-        self.packet_queue.append((packet, wid, pixels, start_send_cb, end_send_cb, fail_cb, wait_for_more))
+        self.packet_queue.append((packet, wid, pixels, start_send_cb, end_send_cb, fail_cb, wait_for_more, now))
         p = self.protocol
         if p:
             p.source_has_more()
 
-    def encode_loop(self):
+    def encode_loop(self, work_queue=None):
         """
             This runs in a separate thread and calls all the function callbacks
-            which are added to the 'encode_work_queue'.
+            which are added to the 'encode_work_queue',
+            or to one of the window encode queues.
             Must run until we hit the end of queue marker,
             to ensure all the queued items get called,
             those that are marked as optional will be skipped when is_closed()
         """
+        if work_queue is None:
+            work_queue = self.encode_work_queue
         while True:
-            fn_and_args = self.encode_work_queue.get(True)
+            fn_and_args = work_queue.get(True)
             if fn_and_args is None:
+                if work_queue is self.encode_work_queue:
+                    #stop the window encode threads too:
+                    with self.encode_worker_lock:
+                        for q in self.encode_worker_queues:
+                            q.put(None)
                 return              #empty marker
             #some function calls are optional and can be skipped when closing:
             #(but some are not, like encoder clean functions)
@@ -318,12 +384,32 @@ class ClientConnection(StubSourceMixin):
         synchronous, have_more, will_have_more = True, False, False
         if not self.is_closed():
             if self.ordinary_packets:
-                packet, synchronous, fail_cb, will_have_more = self.ordinary_packets.pop(0)
+                packet, synchronous, fail_cb, will_have_more, queue_time = self.ordinary_packets.pop(0)
+                start_send_cb = self.record_queue_latency("ordinary", queue_time)
             elif self.packet_queue:
-                packet, _, _, start_send_cb, end_send_cb, fail_cb, will_have_more = self.packet_queue.popleft()
+                packet, _, _, start_send_cb, end_send_cb, fail_cb, will_have_more, queue_time = self.packet_queue.popleft()
+                start_send_cb = self.record_queue_latency("encoded", queue_time, start_send_cb)
             have_more = packet is not None and (self.ordinary_packets or self.packet_queue)
         return packet, start_send_cb, end_send_cb, fail_cb, synchronous, have_more, will_have_more
 
+    def next_priority_packet(self):
+        """
+            Called by the protocol when it is sending a large packet in fragments,
+            the 'ordinary_packets' can then be sent in between the fragments.
+        """
+        if self.is_closed() or not self.ordinary_packets:
+            return None, None, None, None, True
+        packet, synchronous, fail_cb, _, queue_time = self.ordinary_packets.pop(0)
+        return packet, self.record_queue_latency("ordinary", queue_time), None, fail_cb, synchronous
+
+    def record_queue_latency(self, packet_class, queue_time, start_send_cb=None):
+        latency = self.queue_latency[packet_class]
+        def start_send(bytecount):
+            latency.append(monotonic()-queue_time)
+            if start_send_cb:
+                start_send_cb(bytecount)
+        return start_send
+
     def send(self, *parts, **kwargs):
         """ This method queues non-damage packets (higher priority) """
         synchronous = kwargs.get("synchronous", True)
@@ -331,7 +417,7 @@ class ClientConnection(StubSourceMixin):
         fail_cb = kwargs.get("fail_cb", None)
         p = self.protocol
         if p:
-            self.ordinary_packets.append((parts, synchronous, fail_cb, will_have_more))
+            self.ordinary_packets.append((parts, synchronous, fail_cb, will_have_more, monotonic()))
             p.source_has_more()
 
     def send_more(self, *parts, **kwargs):
@@ -359,10 +445,13 @@ class ClientConnection(StubSourceMixin):
                 "adapter-type"      : self.adapter_type,
                 "ssh-auth-sock"     : self.ssh_auth_sock,
                 "packet-types"      : self.client_packet_types,
+                "encode-threads"    : 1+len(self.encode_worker_queues),
                 "bandwidth-limit"   : {
                     "detection"     : self.bandwidth_detection,
                     "actual"        : self.soft_bandwidth_limit or 0,
-                    }
+                    },
+                "queue-latency"     : dict((packet_class, get_list_stats(int(1000*v) for v in latency))
+                                           for packet_class, latency in self.queue_latency.items() if latency),
                 }
         p = self.protocol
         if p:
@@ -11,8 +11,9 @@ from time import monotonic
 from collections import deque
 
 from xpra.server.cystats import (                                           #@UnresolvedImport
-    logp, calculate_time_weighted_average, calculate_size_weighted_average, #@UnresolvedImport
+    logp, calculate_size_weighted_average,                                  #@UnresolvedImport
     calculate_for_target, time_weighted_average, queue_inspect,             #@UnresolvedImport
+    TimeWeightedAverage, SizeWeightedAverage,                               #@UnresolvedImport
     )
 from xpra.simple_stats import get_list_stats
 from xpra.log import Logger
@@ -74,6 +75,11 @@ class GlobalPerformanceStatistics:
         self.frame_total_latency = d()                      #how long it takes from the time we get a damage event
                                                             #until we get the ack back from the client
                                                             #(wid, event_time, no_of_pixels, latency)
+        #incremental averages of the records above, updated as records are added:
+        self.client_latency_average = TimeWeightedAverage()
+        self.client_ping_latency_average = TimeWeightedAverage()
+        self.server_ping_latency_average = TimeWeightedAverage()
+        self.frame_total_latency_average = SizeWeightedAverage()
         self.client_load = None
         self.last_congestion_time = 0
         self.congestion_value = 0
@@ -111,31 +117,40 @@ class GlobalPerformanceStatistics:
         if self.min_client_latency is None or self.min_client_latency>net_total_latency:
             self.min_client_latency = net_total_latency
         self.client_latency.append((wid, now, pixels, net_total_latency))
+        self.client_latency_average.add(now, net_total_latency)
         self.frame_total_latency.append((wid, now, pixels, latency))
+        self.frame_total_latency_average.add(now, pixels, latency)
+
+    def record_client_ping_latency(self, event_time, latency):
+        self.client_ping_latency.append((event_time, latency))
+        self.client_ping_latency_average.add(event_time, latency)
+
+    def record_server_ping_latency(self, event_time, latency):
+        self.server_ping_latency.append((event_time, latency))
+        self.server_ping_latency_average.add(event_time, latency)
 
     def get_damage_pixels(self, wid):
         """ returns the list of (event_time, pixelcount) for the given window id """
         return [(event_time, value) for event_time, dwid, value in tuple(self.damage_packet_qpixels) if dwid==wid]
 
     def update_averages(self):
-        def latency_averages(values):
-            avg, recent = calculate_time_weighted_average(values)
+        def latency_averages(average):
+            avg, recent = average.get()
             return max(0.001, avg), max(0.001, recent)
         client_latency = tuple(self.client_latency)
         if client_latency:
-            data = tuple((when, latency) for _, when, _, latency in client_latency)
-            self.min_client_latency = min(x for _,x in data)
-            self.avg_client_latency, self.recent_client_latency = latency_averages(data)
+            self.min_client_latency = min(x for _, _, _, x in client_latency)
+            self.avg_client_latency, self.recent_client_latency = latency_averages(self.client_latency_average)
         #client ping latency: from ping packets
         client_ping_latency = tuple(self.client_ping_latency)
         if client_ping_latency:
             self.min_client_ping_latency = min(x for _,x in client_ping_latency)
-            self.avg_client_ping_latency, self.recent_client_ping_latency = latency_averages(client_ping_latency)
+            self.avg_client_ping_latency, self.recent_client_ping_latency = latency_averages(self.client_ping_latency_average)
         #server ping latency: from ping packets
         server_ping_latency = tuple(self.server_ping_latency)
         if server_ping_latency:
             self.min_server_ping_latency = min(x for _,x in server_ping_latency)
-            self.avg_server_ping_latency, self.recent_server_ping_latency = latency_averages(server_ping_latency)
+            self.avg_server_ping_latency, self.recent_server_ping_latency = latency_averages(self.server_ping_latency_average)
         #set to 0 if we have less than 2 events in the last 60 seconds:
         now = monotonic()
         min_time = now-60
@@ -162,11 +177,8 @@ class GlobalPerformanceStatistics:
             cps.append((etime, sum(matches)))
         #log("cps(%s)=%s (now=%s)", cst, cps, now)
         self.congestion_value = time_weighted_average(cps)
-        ftl = tuple(self.frame_total_latency)
-        if ftl:
-            edata = tuple((event_time, pixels, latency) for _, event_time, pixels, latency in ftl)
-            #(wid, event_time, no_of_pixels, latency)
-            self.avg_frame_total_latency = safeint(calculate_size_weighted_average(edata)[1])
+        if self.frame_total_latency:
+            self.avg_frame_total_latency = safeint(self.frame_total_latency_average.get()[1])
 
     def get_factors(self, pixel_count):
         factors = []
@@ -7,6 +7,7 @@
 
 import os
 from io import BytesIO
+from functools import partial
 from time import monotonic
 
 try:
@@ -18,6 +19,7 @@ from xpra.server.source.stub_source_mixin import StubSourceMixin
 from xpra.server.window.metadata import make_window_metadata
 from xpra.server.window.filters import get_window_filter
 from xpra.net.compression import Compressed
+from xpra.net.image_cache import ImageCache, image_key, server_image_cache
 from xpra.os_util import strtobytes, bytestostr
 from xpra.util import typedict, envint, envbool, DEFAULT_METADATA_SUPPORTED, NotificationID
 from xpra.log import Logger
@@ -90,6 +92,9 @@ class WindowsMixin(StubSourceMixin):
 
         self.cursor_timer = None
         self.last_cursor_sent = None
+        #mirrors of the client's cursor and window icon caches:
+        self.client_cursor_cache = None
+        self.client_icon_cache = None
 
     def cleanup(self):
         for window_source in self.all_window_sources():
@@ -152,6 +157,10 @@ class WindowsMixin(StubSourceMixin):
         self.window_max_size = c.inttupleget("window.max-size", (0, 0))
         self.window_restack = c.boolget("window.restack", False)
         self.window_pre_map = c.boolget("window.pre-map", False)
+        image_cache_size = c.intget("encoding.image-cache", 0)
+        if image_cache_size>0:
+            self.client_cursor_cache = ImageCache(image_cache_size)
+            self.client_icon_cache = ImageCache(image_cache_size)
         log("cursors=%s (encodings=%s), bell=%s",
             self.send_cursors, self.cursor_encodings, self.send_bell)
         #window filters:
@@ -185,6 +194,10 @@ class WindowsMixin(StubSourceMixin):
             })
         if self.window_frame_sizes:
             wsize.update({"frame-sizes" : self.window_frame_sizes})
+        cache = info.setdefault("image-cache", {"server" : server_image_cache.get_info()})
+        if self.client_cursor_cache:
+            cache["cursor"] = self.client_cursor_cache.get_info()
+            cache["window-icon"] = self.client_icon_cache.get_info()
         info.update(self.get_window_info())
         return info
 
@@ -286,18 +299,33 @@ class WindowsMixin(StubSourceMixin):
             cpixels = strtobytes(pixels)
             if "png" in self.cursor_encodings and Image:
                 cursorlog(f"do_send_cursor() got {len(cpixels)} bytes of pixel data for {w}x{h} cursor named {name!r}")
-                img = Image.frombytes("RGBA", (w, h), cpixels, "raw", "BGRA", w*4, 1)
-                buf = BytesIO()
-                img.save(buf, "PNG")
-                pngdata = buf.getvalue()
-                buf.close()
+                cache_key = ("cursor", image_key(cpixels), w, h)
+                cached = server_image_cache.get(cache_key)
+                if cached:
+                    pngdata, ref = cached
+                else:
+                    img = Image.frombytes("RGBA", (w, h), cpixels, "raw", "BGRA", w*4, 1)
+                    buf = BytesIO()
+                    img.save(buf, "PNG")
+                    pngdata = buf.getvalue()
+                    buf.close()
+                    ref = image_key(pngdata)
+                    server_image_cache.set(cache_key, (pngdata, ref))
+                    if SAVE_CURSORS:
+                        filename = f"raw-cursor-{serial:x}.png"
+                        with open(filename, "wb") as f:
+                            f.write(pngdata)
+                        cursorlog("cursor saved to %s", filename)
                 cpixels = Compressed("png cursor", pngdata, can_inline=True)
                 encoding = "png"
-                if SAVE_CURSORS:
-                    filename = f"raw-cursor-{serial:x}.png"
-                    with open(filename, "wb") as f:
-                        f.write(pngdata)
-                    cursorlog("cursor saved to %s", filename)
+                ccache = self.client_cursor_cache
+                if ccache:
+                    if ccache.get(ref):
+                        #the client already has it, just send the reference:
+                        cpixels = ref
+                        encoding = "cache"
+                    else:
+                        ccache.set(ref, True)
             elif len(cpixels)>=256 and ("raw" in self.cursor_encodings or not self.cursor_encodings):
                 cpixels = self.compressed_wrapper("cursor", pixels)
                 cursorlog("do_send_cursor(..) pixels=%s ", cpixels)
@@ -524,6 +552,7 @@ class WindowsMixin(StubSourceMixin):
         ws = self.window_sources.pop(wid, None)
         if ws:
             ws.cleanup()
+        self.release_window_encode_queue(wid)
         self.calculate_window_pixels.pop(wid, None)
 
 
@@ -574,7 +603,7 @@ class WindowsMixin(StubSourceMixin):
                               self.idle_add, self.timeout_add, self.source_remove,
                               ww, wh,
                               self.record_congestion_event, self.encode_queue_size,
-                              self.call_in_encode_thread, self.queue_packet,
+                              partial(self.call_in_window_encode_thread, wid), self.queue_packet,
                               self.statistics,
                               wid, window, batch_config, self.auto_refresh_delay,
                               av_sync, av_sync_delay,
@@ -586,6 +615,7 @@ class WindowsMixin(StubSourceMixin):
                               self.rgb_formats,
                               self.default_encoding_options,
                               mmap, mmap_size, bandwidth_limit, self.jitter)
+            ws.client_icon_cache = self.client_icon_cache
             self.window_sources[wid] = ws
             if len(self.window_sources)>1:
                 #re-distribute bandwidth:
@@ -0,0 +1,141 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from math import sqrt
+
+from xpra.util import envint, envbool
+from xpra.log import Logger
+
+log = Logger("encoding")
+
+CONTENT_CLASSIFIER = envbool("XPRA_CONTENT_CLASSIFIER", True)
+#classify one damage region out of this many:
+CLASSIFY_INTERVAL = max(1, envint("XPRA_CONTENT_CLASSIFY_INTERVAL", 5))
+#regions are downsampled to at most this many samples:
+MAX_SAMPLES = envint("XPRA_CONTENT_CLASSIFY_MAX_SAMPLES", 128*128)
+#regions with fewer samples than this are not classified:
+MIN_SAMPLES = envint("XPRA_CONTENT_CLASSIFY_MIN_SAMPLES", 32*32)
+#how much each new classification contributes to the window's content type:
+DECAY = envint("XPRA_CONTENT_CLASSIFY_DECAY", 75)/100
+#the share of the scores required before we switch to a content type:
+CONFIDENCE = envint("XPRA_CONTENT_CLASSIFY_CONFIDENCE", 60)/100
+
+#thresholds, as ratios of the number of samples:
+TEXT_MAX_COLOURS = 0.05
+TEXT_MIN_EDGES = 0.02
+PICTURE_MIN_COLOURS = 0.15
+VIDEO_MIN_CHANGE = 0.5
+
+PIXEL_FORMATS = {
+    "BGRX"  : 4,
+    "BGRA"  : 4,
+    "RGBX"  : 4,
+    "RGBA"  : 4,
+    "RGB"   : 3,
+    "BGR"   : 3,
+    }
+CONTENT_TYPES = ("text", "picture", "video")
+#how many previous frames we keep for calculating the change ratio:
+MAX_PREVIOUS = 4
+
+get_pixel_stats = None
+if CONTENT_CLASSIFIER:
+    try:
+        from xpra.server.window.pixel_stats import get_pixel_stats     #@UnresolvedImport
+    except ImportError as e:
+        log("no pixel stats module: %s", e)
+
+
+def classify(samples : int, colours : int, edges : int, changed : int) -> str:
+    """
+        Tags a region using the statistics returned by `get_pixel_stats`
+    """
+    colour_ratio = colours/min(samples, 32768)
+    if changed>=0 and changed/samples>=VIDEO_MIN_CHANGE and colour_ratio>=PICTURE_MIN_COLOURS:
+        return "video"
+    if colour_ratio>=PICTURE_MIN_COLOURS:
+        return "picture"
+    if colour_ratio<=TEXT_MAX_COLOURS and edges/samples>=TEXT_MIN_EDGES:
+        return "text"
+    #few colours and few edges (ie: flat areas), or something in between:
+    return ""
+
+
+class ContentClassifier:
+    """
+        Guesses the content type of a window from the pixels of its damage regions:
+        each region sampled is tagged as text, picture or video,
+        and the window's content type is the one with the largest share
+        of the (time decayed, area weighted) scores.
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.previous = {}
+        self.scores = dict((content_type, 0.0) for content_type in CONTENT_TYPES)
+        self.content_type = ""
+
+    def __repr__(self):
+        return f"ContentClassifier({self.content_type!r})"
+
+    def get_info(self) -> dict:
+        return {
+            "content-type"  : self.content_type,
+            "frames"        : self.frames,
+            "scores"        : dict((k, int(v)) for k, v in self.scores.items()),
+            }
+
+    def reset(self):
+        self.previous = {}
+        for content_type in CONTENT_TYPES:
+            self.scores[content_type] = 0.0
+        self.content_type = ""
+
+    def process_image(self, image) -> bool:
+        """
+            Returns True if the window's content type has changed.
+            Only one image out of every CLASSIFY_INTERVAL is actually analyzed.
+        """
+        if not get_pixel_stats:
+            return False
+        self.frames += 1
+        if self.frames % CLASSIFY_INTERVAL:
+            return False
+        bpp = PIXEL_FORMATS.get(image.get_pixel_format())
+        if not bpp or bpp!=image.get_bytesperpixel():
+            return False
+        x, y, w, h = image.get_geometry()[:4]
+        if w*h<MIN_SAMPLES:
+            return False
+        pixels = image.get_pixels()
+        if not pixels:
+            return False
+        step = max(1, round(sqrt(w*h/MAX_SAMPLES)))
+        key = (x, y, w, h, step)
+        previous = self.previous.pop(key, None)
+        samples, colours, edges, changed, luma = get_pixel_stats(pixels, w, h, image.get_rowstride(), bpp,
+                                                                 step, previous)
+        self.previous[key] = luma
+        while len(self.previous)>MAX_PREVIOUS:
+            self.previous.pop(next(iter(self.previous)))
+        tag = classify(samples, colours, edges, changed)
+        log("%s: %i samples, %i colours, %i edges, %i changed: %r",
+            (x, y, w, h), samples, colours, edges, changed, tag)
+        return self.add_score(tag, w*h)
+
+    def add_score(self, tag : str, pixels : int) -> bool:
+        for content_type in CONTENT_TYPES:
+            self.scores[content_type] *= DECAY
+        if tag:
+            self.scores[tag] += pixels
+        total = sum(self.scores.values())
+        if not total:
+            return False
+        best = max(CONTENT_TYPES, key=self.scores.get)
+        if self.scores[best]/total<CONFIDENCE or best==self.content_type:
+            return False
+        log("content type changed from %r to %r, scores=%s", self.content_type, best, self.scores)
+        self.content_type = best
+        return True
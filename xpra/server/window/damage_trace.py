@@ -0,0 +1,171 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import json
+import zlib
+from struct import pack, unpack, calcsize
+from threading import Lock
+from time import monotonic
+
+from xpra.os_util import memoryview_to_bytes
+from xpra.log import Logger
+
+log = Logger("damage")
+
+#record all the damage events and their pixels to this file:
+DAMAGE_TRACE = os.environ.get("XPRA_DAMAGE_TRACE", "")
+
+MAGIC = b"XPRATRC1"
+HEADER_SIZE = calcsize("!I")
+
+
+"""
+The trace file starts with MAGIC, followed by records made of:
+ * the size of the json header
+ * the json header
+ * the zlib compressed pixels, if the header has a "size"
+The records are:
+ * "window": the attributes of a window and a snapshot of its contents, recorded before its first damage
+ * "damage": a damage event with its options and a snapshot of the damaged area
+"""
+
+
+def simple_options(options) -> dict:
+    #only keep what we can serialize:
+    return dict((k, v) for k, v in (options or {}).items() if isinstance(v, (str, int, float, bool)))
+
+
+class DamageRecorder:
+    """
+        Records the damage events of the server's windows, once for all the clients,
+        see `xpra.server.mixins.window_server.WindowServer.refresh_window_area`
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = Lock()
+        self.start = monotonic()
+        self.windows = set()
+        self.file = open(filename, "wb")
+        self.file.write(MAGIC)
+        log.info(f"recording damage events to {filename!r}")
+
+    def __repr__(self):
+        return f"DamageRecorder({self.filename!r})"
+
+    def write_record(self, header : dict, payload=b""):
+        data = json.dumps(header).encode("utf8")
+        with self.lock:
+            f = self.file
+            if not f:
+                return
+            f.write(pack("!I", len(data)))
+            f.write(data)
+            if payload:
+                f.write(payload)
+
+    def record_window(self, wid : int, window):
+        w, h = window.get_dimensions()
+        header = {
+            "type"          : "window",
+            "time"          : monotonic()-self.start,
+            "wid"           : wid,
+            "x"             : 0,
+            "y"             : 0,
+            "width"         : w,
+            "height"        : h,
+            "has-alpha"     : bool(window.has_alpha()),
+            "content-type"  : window.get("content-type", "") or "",
+            "title"         : window.get("title", "") or "",
+            }
+        #damage events are recorded once for all the clients,
+        #so the initial refresh sent to each client is not in the trace:
+        payload = self.capture(window, 0, 0, w, h, header)
+        self.write_record(header, payload)
+
+    def record_damage(self, wid : int, window, x : int, y : int, w : int, h : int, options):
+        """ must be called from the UI thread, as we capture the pixels """
+        if wid not in self.windows:
+            self.windows.add(wid)
+            self.record_window(wid, window)
+        header = {
+            "type"      : "damage",
+            "time"      : monotonic()-self.start,
+            "wid"       : wid,
+            "x"         : x,
+            "y"         : y,
+            "width"     : w,
+            "height"    : h,
+            "options"   : simple_options(options),
+            }
+        payload = self.capture(window, x, y, w, h, header)
+        self.write_record(header, payload)
+
+    @staticmethod
+    def capture(window, x : int, y : int, w : int, h : int, header : dict):
+        """ returns the compressed pixels of this area and adds their attributes to the header """
+        payload = b""
+        image = window.get_image(x, y, w, h)
+        if image:
+            try:
+                pixels = image.get_pixels()
+                if pixels:
+                    payload = zlib.compress(memoryview_to_bytes(pixels), 1)
+                    header.update({
+                        "x"             : image.get_target_x(),
+                        "y"             : image.get_target_y(),
+                        "width"         : image.get_width(),
+                        "height"        : image.get_height(),
+                        "pixel-format"  : image.get_pixel_format(),
+                        "depth"         : image.get_depth(),
+                        "rowstride"     : image.get_rowstride(),
+                        "size"          : len(payload),
+                        })
+            finally:
+                image.free()
+        return payload
+
+    def close(self):
+        with self.lock:
+            f = self.file
+            if f:
+                self.file = None
+                f.close()
+
+
+recorder = None
+def get_damage_recorder():
+    global recorder
+    if DAMAGE_TRACE and not recorder:
+        try:
+            recorder = DamageRecorder(os.path.expanduser(DAMAGE_TRACE))
+        except OSError as e:
+            log.error(f"Error: cannot record damage to {DAMAGE_TRACE!r}")
+            log.estr(e)
+            return None
+    return recorder
+
+
+def read_trace(filename):
+    """
+        Yields the records from a trace file as: (header, pixels),
+        the pixels are None for records that do not have any.
+    """
+    with open(filename, "rb") as f:
+        magic = f.read(len(MAGIC))
+        if magic!=MAGIC:
+            raise ValueError(f"{filename!r} is not a damage trace file")
+        while True:
+            size = f.read(HEADER_SIZE)
+            if len(size)<HEADER_SIZE:
+                return
+            data = f.read(unpack("!I", size)[0])
+            header = json.loads(data.decode("utf8"))
+            pixels = None
+            psize = header.get("size", 0)
+            if psize:
+                pixels = zlib.decompress(f.read(psize))
+            yield header, pixels
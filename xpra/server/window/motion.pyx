@@ -13,19 +13,30 @@ from xpra.log import Logger
 log = Logger("encoding", "scroll")
 
 from xpra.buffers.membuf cimport memalign, buffer_context #pylint: disable=syntax-error
-from xpra.buffers.xxh cimport xxh3
+from xpra.buffers.xxh cimport xxh3_rows
 from xpra.rectangle import rectangle
 
 
 cdef int DEBUG = envbool("XPRA_SCROLL_DEBUG", False)
 
 
-from libc.stdint cimport uint8_t, int16_t, uint16_t, uint32_t, uint64_t, uintptr_t
+from libc.stdint cimport uint8_t, int16_t, uint16_t, int32_t, uint32_t, uint64_t, uintptr_t
 from libc.stdlib cimport free, malloc
 from libc.string cimport memset
 
 
 MIN_LINE_COUNT = 2
+#maximum number of motion vectors returned by get_motion_values():
+DEF MAX_VECTORS = 8
+MAX_MOTION_VECTORS = MAX_VECTORS
+
+#multipliers used for the polynomial block hashes:
+cdef uint64_t P1 = 0x100000001b3
+cdef uint64_t P2 = 0x9e3779b97f4a7c15
+cdef uint64_t M1 = 0xff51afd7ed558ccd
+cdef uint64_t M2 = 0xc4ceb9fe1a85ec53
+#size of the bit filter used for rejecting most checksums quickly:
+DEF FILTER_BITS = 18
 
 def h(v):
     return hex(v)[2:].rstrip("L")
@@ -39,6 +50,58 @@ cdef da(uint64_t *a, uint16_t l):
 cdef dd(uint16_t *d, uint16_t l):
     return csv([h(d[i]) for i in range(l)])
 
+cdef inline uint64_t fmix64(uint64_t k) nogil:
+    #spread the bits of the polynomial hashes before using them as keys:
+    k ^= k >> 33
+    k *= M1
+    k ^= k >> 33
+    k *= M2
+    k ^= k >> 33
+    return k
+
+cdef inline uint64_t upow(uint64_t v, uint16_t n) nogil:
+    cdef uint64_t r = 1
+    cdef uint16_t i
+    for i in range(n):
+        r *= v
+    return r
+
+def merge_blocks(blocks, uint16_t block_size, uint16_t width, uint16_t height):
+    """
+        Merges a set of (column, row) block positions into rectangles,
+        adjacent blocks on the same row are merged first,
+        then identical spans on consecutive rows.
+    """
+    rects = []
+    open_rects = {}
+    rows = {}
+    for bx, by in blocks:
+        rows.setdefault(by, []).append(bx)
+    for by in sorted(rows.keys()):
+        spans = []
+        span = None
+        for bx in sorted(rows[by]):
+            if span and span[1]==bx:
+                span[1] = bx+1
+            else:
+                span = [bx, bx+1]
+                spans.append(span)
+        row_rects = {}
+        for start, end in spans:
+            r = open_rects.get((start, end))
+            if r and r[1]+r[3]==by:
+                r[3] += 1
+            else:
+                r = [start, by, end-start, 1]
+                rects.append(r)
+            row_rects[(start, end)] = r
+        open_rects = row_rects
+    return [(
+        bx*block_size, by*block_size,
+        min(width, (bx+bw)*block_size)-bx*block_size,
+        min(height, (by+bh)*block_size)-by*block_size,
+        ) for bx, by, bw, bh in rects]
+
 
 cdef class ScrollData:
 
@@ -47,17 +110,22 @@ cdef class ScrollData:
     cdef uint16_t *distances
     cdef uint64_t *a1        #checksums of reference picture
     cdef uint64_t *a2        #checksums of latest picture
+    cdef uint64_t *b1        #block checksums of reference picture
+    cdef uint64_t *b2        #block checksums of latest picture
+    cdef uint16_t block_size
     cdef uint8_t matched
     cdef int16_t x
     cdef int16_t y
     cdef uint16_t width
     cdef uint16_t height
 
-    def __cinit__(self, int16_t x=0, int16_t y=0, uint16_t width=0, uint16_t height=0):
+    def __cinit__(self, int16_t x=0, int16_t y=0, uint16_t width=0, uint16_t height=0, uint16_t block_size=0):
         self.x = x
         self.y = y
         self.width = width
         self.height = height
+        #when set, we also checksum blocks of this size, for get_motion_values():
+        self.block_size = block_size
 
     def __repr__(self):
         return "ScrollDistances(%ix%i)" % (self.width, self.height)
@@ -91,7 +159,7 @@ cdef class ScrollData:
         self.y = y
         #but cannot change size (checksums would not match):
         if height!=self.height or width!=self.width:
-            if self.a1!=NULL or self.a2!=NULL or self.distances!=NULL:
+            if self.a1!=NULL or self.a2!=NULL or self.distances!=NULL or self.b1!=NULL or self.b2!=NULL:
                 log("new image size: %ix%i (was %ix%i), clearing reference checksums", width, height, self.width, self.height)
                 self.free()
             self.width = width
@@ -112,7 +180,6 @@ cdef class ScrollData:
         #checksum each line of the pixel array:
         cdef Py_ssize_t min_buf_len = rowstride*height
         cdef uint64_t *a2 = self.a2
-        cdef uint16_t i
         cdef uint8_t *buf
         with buffer_context(pixels) as bc:
             buf = <uint8_t*> (<uintptr_t> int(bc))
@@ -120,9 +187,267 @@ cdef class ScrollData:
                     len(bc), width, height, rowstride, min_buf_len)
             assert row_len<=rowstride, "invalid row length: %ix%i=%i but rowstride is %i" % (width, bpp, width*bpp, rowstride)
             with nogil:
-                for i in range(height):
-                    a2[i] = xxh3(buf, row_len)
-                    buf += rowstride
+                xxh3_rows(buf, row_len, rowstride, height, a2)
+        if self.block_size>0:
+            self.update_blocks(pixels, rowstride, bpp)
+
+    cdef update_blocks(self, pixels, uint32_t rowstride, uint8_t bpp):
+        """
+            Checksum all the full blocks of the 32-bit pixel array into b2,
+            and push the existing values into b1.
+            Blocks of a single colour match everywhere, so they are skipped (zero).
+        """
+        if self.b1:
+            free(self.b1)
+            self.b1 = NULL
+        if self.b2:
+            self.b1 = self.b2
+            self.b2 = NULL
+        cdef uint16_t B = self.block_size
+        cdef uint16_t bw = self.width//B
+        cdef uint16_t bh = self.height//B
+        if bw==0 or bh==0 or bpp!=4:
+            return
+        self.b2 = <uint64_t*> memalign(bw*bh*sizeof(uint64_t))
+        assert self.b2!=NULL, "block checksum memory allocation failed"
+        cdef uint64_t *b2 = self.b2
+        #a block made of a single pixel value 'v' hashes to v*uniform:
+        cdef uint64_t uniform = 0
+        cdef uint16_t i, j, bx, by
+        cdef uint64_t s1 = 0, s2 = 0
+        for i in range(B):
+            s1 = s1*P1+1
+            s2 = s2*P2+1
+        uniform = s1*s2
+        cdef uint8_t *buf
+        cdef uint32_t *row
+        cdef uint64_t seg, v
+        with buffer_context(pixels) as bc:
+            buf = <uint8_t*> (<uintptr_t> int(bc))
+            with nogil:
+                memset(b2, 0, bw*bh*sizeof(uint64_t))
+                for by in range(bh):
+                    for j in range(B):
+                        row = <uint32_t*> (buf + (by*B+j)*rowstride)
+                        for bx in range(bw):
+                            seg = 0
+                            for i in range(B):
+                                seg = seg*P1 + row[bx*B+i]
+                            b2[by*bw+bx] = b2[by*bw+bx]*P2 + seg
+                    for bx in range(bw):
+                        v = b2[by*bw+bx]
+                        row = <uint32_t*> (buf + by*B*rowstride)
+                        if v==row[bx*B]*uniform:
+                            b2[by*bw+bx] = 0
+
+    def get_motion_values(self, pixels, uint32_t rowstride, uint16_t max_distance=1000, uint16_t min_hits=2):
+        """
+            Finds the blocks of the reference picture which have moved in any direction,
+            using the block checksums of the reference picture (b1)
+            and a rolling checksum over every position of the latest picture,
+            which must be the pixels given to the last call to update().
+            Returns:
+            * the areas to copy for each motion vector: {(dx, dy) : [(x, y, w, h), ..]}
+              (the area is the source position in the reference picture)
+            * the list of rectangles that still need to be repainted
+            * the percentage of the latest picture covered by blocks that have moved or are unchanged
+        """
+        cdef uint16_t B = self.block_size
+        if self.b1==NULL or B==0:
+            return None
+        cdef uint16_t width = self.width
+        cdef uint16_t height = self.height
+        cdef uint16_t bw = width//B
+        cdef uint16_t bh = height//B
+        cdef uint32_t nblocks = bw*bh
+        cdef uint64_t *b1 = self.b1
+        #hash table of the reference blocks: checksum -> block index
+        cdef uint32_t tsize = 1
+        while tsize<nblocks*2:
+            tsize *= 2
+        cdef uint64_t *keys = <uint64_t*> malloc(tsize*sizeof(uint64_t))
+        cdef int32_t *values = <int32_t*> malloc(tsize*sizeof(int32_t))
+        #small enough to stay in the CPU cache, unlike the hash table:
+        cdef uint8_t *bitfilter = <uint8_t*> malloc((1<<FILTER_BITS)//8)
+        #horizontal checksums of the last B rows, and vertical rolling checksums:
+        cdef uint16_t cols = width-B+1
+        cdef uint64_t *hrows = <uint64_t*> malloc(B*cols*sizeof(uint64_t))
+        cdef uint64_t *vsums = <uint64_t*> malloc(cols*sizeof(uint64_t))
+        #the matches found: block index and position in the latest picture:
+        cdef uint32_t max_matches = nblocks*4+1024
+        cdef int32_t *matches = <int32_t*> malloc(max_matches*3*sizeof(int32_t))
+        cdef uint32_t nmatches = 0
+        if keys==NULL or values==NULL or bitfilter==NULL or hrows==NULL or vsums==NULL or matches==NULL:
+            free(bitfilter)
+            free(keys)
+            free(values)
+            free(hrows)
+            free(vsums)
+            free(matches)
+            raise MemoryError("failed to allocate motion search buffers")
+        #local copies, so the compiler can keep them in registers:
+        cdef uint64_t p1 = P1, p2 = P2
+        cdef uint64_t P1B = upow(P1, B-1)
+        cdef uint64_t P2B = upow(P2, B-1)
+        cdef uint32_t k, slot
+        cdef uint16_t x, y, i
+        cdef int32_t bx, by, dx, dy
+        cdef uint64_t v
+        cdef uint64_t *hrow
+        cdef uint64_t *hold
+        cdef uint32_t *row
+        cdef uint8_t *buf
+        try:
+            with buffer_context(pixels) as bc:
+                buf = <uint8_t*> (<uintptr_t> int(bc))
+                assert len(bc)>=rowstride*height
+                with nogil:
+                    memset(keys, 0, tsize*sizeof(uint64_t))
+                    memset(bitfilter, 0, (1<<FILTER_BITS)//8)
+                    for k in range(nblocks):
+                        v = b1[k]
+                        if v==0:
+                            continue
+                        #the high bits of the checksums are well mixed already:
+                        slot = v >> (64-FILTER_BITS)
+                        bitfilter[slot>>3] |= 1<<(slot&7)
+                        slot = fmix64(v) & (tsize-1)
+                        while keys[slot]!=0 and keys[slot]!=v:
+                            slot = (slot+1) & (tsize-1)
+                        if keys[slot]==0:
+                            keys[slot] = v
+                            values[slot] = k
+                    memset(vsums, 0, cols*sizeof(uint64_t))
+                    for y in range(height):
+                        #rolling checksums of this row, stored in a ring buffer of B rows,
+                        #the slot we use is the one of the row leaving the block (y-B):
+                        row = <uint32_t*> (buf + y*rowstride)
+                        hrow = hrows + (y%B)*cols
+                        v = 0
+                        for i in range(B):
+                            v = v*p1 + row[i]
+                        for x in range(cols):
+                            if x>0:
+                                v = (v - row[x-1]*P1B)*p1 + row[x+B-1]
+                            if y>=B:
+                                vsums[x] = (vsums[x] - hrow[x]*P2B)*p2 + v
+                            else:
+                                vsums[x] = vsums[x]*p2 + v
+                            hrow[x] = v
+                        if y<B-1:
+                            continue
+                        #vsums now holds the checksums of the blocks starting at row y-B+1:
+                        for x in range(cols):
+                            v = vsums[x]
+                            slot = v >> (64-FILTER_BITS)
+                            if v==0 or not (bitfilter[slot>>3] & (1<<(slot&7))):
+                                continue
+                            slot = fmix64(v) & (tsize-1)
+                            while keys[slot]!=0 and keys[slot]!=v:
+                                slot = (slot+1) & (tsize-1)
+                            if keys[slot]==0:
+                                continue
+                            k = values[slot]
+                            bx = (k%bw)*B
+                            by = (k//bw)*B
+                            dx = x-bx
+                            dy = (y-B+1)-by
+                            if dx>max_distance or -dx>max_distance or dy>max_distance or -dy>max_distance:
+                                continue
+                            if nmatches<max_matches:
+                                matches[nmatches*3] = k
+                                matches[nmatches*3+1] = dx
+                                matches[nmatches*3+2] = dy
+                                nmatches += 1
+            return self.get_motion_rects(matches, nmatches, min_hits)
+        finally:
+            free(bitfilter)
+            free(keys)
+            free(values)
+            free(hrows)
+            free(vsums)
+            free(matches)
+
+    cdef get_motion_rects(self, int32_t *matches, uint32_t nmatches, uint16_t min_hits=2):
+        """
+            Converts the list of block matches into rectangles,
+            using the motion vectors with the most matches.
+        """
+        cdef uint16_t B = self.block_size
+        cdef uint16_t bw = self.width//B
+        cdef uint16_t bh = self.height//B
+        cdef uint32_t k
+        votes = {}
+        for k in range(nmatches):
+            v = (matches[k*3+1], matches[k*3+2])
+            votes[v] = votes.get(v, 0)+1
+        #unchanged blocks are always useful:
+        candidates = [(count, v) for v, count in votes.items() if count>min_hits or v==(0, 0)]
+        vectors = [v for _, v in sorted(candidates, reverse=True)[:MAX_VECTORS]]
+        cdef int32_t vdx[MAX_VECTORS]
+        cdef int32_t vdy[MAX_VECTORS]
+        cdef uint8_t nvectors = len(vectors)
+        cdef uint8_t r
+        for r, (dx, dy) in enumerate(vectors):
+            vdx[r] = dx
+            vdy[r] = dy
+        #assign each reference block to its best vector (lowest index):
+        cdef uint8_t *assigned = <uint8_t*> malloc(bw*bh)
+        #and record which blocks of the latest picture are covered:
+        cdef uint16_t cw = (self.width+B-1)//B
+        cdef uint16_t ch = (self.height+B-1)//B
+        cdef uint8_t *covered = <uint8_t*> malloc(cw*ch)
+        if assigned==NULL or covered==NULL:
+            free(assigned)
+            free(covered)
+            raise MemoryError("failed to allocate motion block maps")
+        cdef uint16_t bx, by, i, j
+        cdef int32_t x, y
+        cdef uint32_t count = 0
+        cdef uint8_t match
+        try:
+            with nogil:
+                memset(assigned, MAX_VECTORS, bw*bh)
+                memset(covered, 0, cw*ch)
+                for k in range(nmatches):
+                    for r in range(nvectors):
+                        if matches[k*3+1]==vdx[r] and matches[k*3+2]==vdy[r]:
+                            if r<assigned[matches[k*3]]:
+                                assigned[matches[k*3]] = r
+                            break
+                for by in range(bh):
+                    for bx in range(bw):
+                        for r in range(nvectors):
+                            #the reference blocks that would have moved into this block
+                            #must all use this vector:
+                            x = bx*B-vdx[r]
+                            y = by*B-vdy[r]
+                            if x<0 or y<0 or x+B>bw*B or y+B>bh*B:
+                                continue
+                            match = 1
+                            for j in range(y//B, (y+B-1)//B+1):
+                                for i in range(x//B, (x+B-1)//B+1):
+                                    if assigned[j*bw+i]!=r:
+                                        match = 0
+                            if match:
+                                covered[by*cw+bx] = 1
+                                count += 1
+                                break
+            dirty = [(bx, by) for by in range(ch) for bx in range(cw) if not covered[by*cw+bx]]
+            copies = {}
+            for r in range(nvectors):
+                if vdx[r]==0 and vdy[r]==0:
+                    continue
+                blocks = [(k%bw, k//bw) for k in range(bw*bh) if assigned[k]==r]
+                if blocks:
+                    copies[(vdx[r], vdy[r])] = merge_blocks(blocks, B, self.width, self.height)
+        finally:
+            free(assigned)
+            free(covered)
+        pct = 100*count*B*B//(self.width*self.height)
+        if DEBUG:
+            log("get_motion_rects: vectors=%s, %i%% covered, copies=%s, dirty=%s", vectors, pct, copies, dirty)
+        return copies, merge_blocks(dirty, B, self.width, self.height), pct
 
 
     def calculate(self, uint16_t max_distance=1000):
@@ -322,6 +647,15 @@ cdef class ScrollData:
         cdef int i
         for i in range(start_y, start_y+inter.height):
             self.a2[i] = 0
+        cdef uint16_t B = self.block_size
+        cdef uint16_t bw, bh, bx, by
+        if self.b2!=NULL:
+            #zero the blocks that intersect:
+            bw = self.width//B
+            bh = self.height//B
+            for by in range(start_y//B, min(bh, (start_y+inter.height+B-1)//B)):
+                for bx in range((inter.x-rect.x)//B, min(bw, (inter.x-rect.x+inter.width+B-1)//B)):
+                    self.b2[by*bw+bx] = 0
         cdef uint16_t nonzero = 0
         for i in range(self.height):
             if self.a2[i]!=0:
@@ -362,3 +696,11 @@ cdef class ScrollData:
         if ptr:
             self.a2 = NULL
             free(ptr)
+        ptr = <void*> self.b1
+        if ptr:
+            self.b1 = NULL
+            free(ptr)
+        ptr = <void*> self.b2
+        if ptr:
+            self.b2 = NULL
+            free(ptr)
@@ -0,0 +1,89 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+#cython: boundscheck=False, wraparound=False
+
+from libc.stdint cimport uint8_t, uint64_t, uintptr_t
+from libc.string cimport memset
+
+from xpra.buffers.membuf cimport buffer_context #pylint: disable=syntax-error
+
+
+#luminance difference between two neighbouring samples for it to count as an edge:
+cdef int EDGE_THRESHOLD = 48
+#luminance difference with the previous frame for a sample to count as changed:
+cdef int CHANGE_THRESHOLD = 8
+#colours are quantized to 5 bits per channel, giving 32768 possible values,
+#which we track using a bitmap of 512 64-bit words:
+DEF COLOUR_WORDS = 512
+
+
+def get_pixel_stats(pixels, unsigned int width, unsigned int height, unsigned int rowstride,
+                    unsigned int bpp, unsigned int step=1, previous=None):
+    """
+        Samples every `step` pixel horizontally and vertically,
+        and returns:
+        * the number of samples
+        * the number of distinct (quantized) colours
+        * the number of samples with a strong luminance edge with their left neighbour
+        * the number of samples that changed since the `previous` frame, or -1 if unknown
+        * the sampled luminance values, to use as `previous` for the next frame
+        The first three bytes of each pixel are used as colour channels,
+        so this works with BGRX, BGRA, RGBX, RGBA, RGB and BGR.
+    """
+    assert bpp in (3, 4), f"unsupported bytes per pixel {bpp}"
+    assert step>0
+    assert rowstride>=width*bpp, f"invalid rowstride {rowstride} for {width} pixels at {bpp} bytes per pixel"
+    cdef unsigned int sw = (width+step-1)//step
+    cdef unsigned int sh = (height+step-1)//step
+    cdef unsigned int samples = sw*sh
+    luma = bytearray(samples)
+    if samples==0:
+        return 0, 0, 0, -1, luma
+    cdef uint8_t[:] lview = luma
+    cdef uint8_t *lbuf = &lview[0]
+    cdef const uint8_t[:] pview
+    cdef const uint8_t *pbuf = NULL
+    cdef unsigned int has_previous = 0
+    if previous is not None and len(previous)==samples:
+        pview = previous
+        pbuf = &pview[0]
+        has_previous = 1
+    cdef uint64_t colour_bits[COLOUR_WORDS]
+    memset(colour_bits, 0, sizeof(colour_bits))
+    cdef unsigned int colours = 0, edges = 0, changed = 0
+    cdef unsigned int x, y, i, c, l, diff
+    cdef const uint8_t *row
+    cdef const uint8_t *p
+    cdef uintptr_t pix_ptr
+    with buffer_context(pixels) as bc:
+        assert len(bc)>=(height-1)*rowstride+width*bpp, f"pixel buffer is too small: {len(bc)} bytes"
+        pix_ptr = <uintptr_t> int(bc)
+        with nogil:
+            i = 0
+            y = 0
+            while y<height:
+                row = (<const uint8_t*> pix_ptr) + y*rowstride
+                x = 0
+                while x<width:
+                    p = row + x*bpp
+                    c = ((p[0] >> 3) << 10) | ((p[1] >> 3) << 5) | (p[2] >> 3)
+                    if not (colour_bits[c >> 6] & ((<uint64_t> 1) << (c & 63))):
+                        colour_bits[c >> 6] |= (<uint64_t> 1) << (c & 63)
+                        colours += 1
+                    l = (p[0] + 2*p[1] + p[2]) >> 2
+                    lbuf[i] = l
+                    if x>0:
+                        diff = l-lbuf[i-1] if l>lbuf[i-1] else lbuf[i-1]-l
+                        if diff>EDGE_THRESHOLD:
+                            edges += 1
+                    if has_previous:
+                        diff = l-pbuf[i] if l>pbuf[i] else pbuf[i]-l
+                        if diff>CHANGE_THRESHOLD:
+                            changed += 1
+                    i += 1
+                    x += step
+                y += step
+    return samples, colours, edges, (changed if has_previous else -1), luma
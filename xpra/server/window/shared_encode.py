@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from time import monotonic
+from threading import Lock, Event
+from collections import deque
+
+from xpra.util import envint, envbool
+from xpra.codecs.image_wrapper import PlanarFormat
+from xpra.log import Logger
+
+log = Logger("encoding")
+
+SHARED_ENCODE = envbool("XPRA_SHARED_ENCODE", True)
+SHARED_ENCODE_CACHE_SIZE = max(1, envint("XPRA_SHARED_ENCODE_CACHE_SIZE", 16))
+SHARED_ENCODE_EXPIRY = envint("XPRA_SHARED_ENCODE_EXPIRY", 1000)
+SHARED_ENCODE_WAIT = envint("XPRA_SHARED_ENCODE_WAIT", 250)
+SHARED_ENCODE_QUALITY = envint("XPRA_SHARED_ENCODE_QUALITY", 10)
+
+#the encoder options which change the output,
+#other than "quality" which is matched with some tolerance:
+OUTPUT_OPTIONS = ("rgb_formats", "lz4", "alpha", "grayscale", "scaled-width", "scaled-height", "content-type")
+
+hash_tiles = None
+if SHARED_ENCODE:
+    try:
+        from xpra.buffers.xxh import hash_tiles  #@UnresolvedImport
+    except ImportError as e:
+        log("no xxh3 checksums, shared encoding disabled: %s", e)
+
+
+def image_checksum(image) -> int:
+    w = image.get_width()
+    h = image.get_height()
+    return hash_tiles(image.get_pixels(), w, h, image.get_rowstride(), image.get_bytesperpixel(), max(w, h))[0]
+
+def hashable(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return value
+
+
+class SharedEncode:
+    __slots__ = ("key", "quality", "time", "event", "result")
+    def __init__(self, key, quality):
+        self.key = key
+        self.quality = quality
+        self.time = monotonic()
+        self.event = Event()
+        self.result = None
+
+    def __repr__(self):
+        return f"SharedEncode({self.key[:5]}, quality={self.quality})"
+
+
+class SharedEncodeCache:
+    """
+        When the same window is shown by more than one client,
+        the window sources of all these clients use the same cache
+        and the first one to encode a given image with compatible settings
+        shares the result with the others.
+        Clients that start encoding the same image whilst it is still
+        being compressed will wait for it rather than compressing it again.
+        Only the stateless picture encoders can be shared this way,
+        so video encoders and mmap always bypass the cache.
+    """
+    def __init__(self, wid:int):
+        self.wid = wid
+        self.users = 0
+        self.lock = Lock()
+        self.entries = deque(maxlen=SHARED_ENCODE_CACHE_SIZE)
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"SharedEncodeCache({self.wid} : {self.users} users)"
+
+    def get_info(self) -> dict:
+        return {
+            "users"     : self.users,
+            "entries"   : len(self.entries),
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            }
+
+    def is_shared(self) -> bool:
+        return self.users>1
+
+    def find(self, key, quality:int):
+        expired = monotonic()-SHARED_ENCODE_EXPIRY/1000
+        for entry in reversed(self.entries):
+            if entry.time<expired:
+                break
+            if entry.key==key and abs(entry.quality-quality)<=SHARED_ENCODE_QUALITY:
+                return entry
+        return None
+
+    def encode(self, encoder, coding:str, image, options:dict):
+        if not self.is_shared() or image.get_planes()!=PlanarFormat.PACKED:
+            return encoder(coding, image, options)
+        key = (encoder, coding, image.get_pixel_format(),
+               image.get_target_x(), image.get_target_y(), image.get_width(), image.get_height(),
+               tuple(hashable(options.get(k)) for k in OUTPUT_OPTIONS),
+               image_checksum(image))
+        quality = options.get("quality", 100)
+        with self.lock:
+            entry = self.find(key, quality)
+            owner = entry is None
+            if owner:
+                entry = SharedEncode(key, quality)
+                self.entries.append(entry)
+        if not owner:
+            if entry.event.wait(SHARED_ENCODE_WAIT/1000) and entry.result:
+                self.hits += 1
+                log("shared encode hit for %s", entry)
+                return copy_result(entry.result)
+            log("shared encode for %s is not available, encoding it again", entry)
+            return encoder(coding, image, options)
+        self.misses += 1
+        ret = None
+        try:
+            ret = encoder(coding, image, options)
+            if ret:
+                entry.result = copy_result(ret)
+            return ret
+        finally:
+            entry.event.set()
+            if not ret:
+                with self.lock:
+                    if entry in self.entries:
+                        self.entries.remove(entry)
+
+
+def copy_result(ret):
+    #the caller may add its own values to the client options:
+    coding, data, client_options, outw, outh, outstride, bpp = ret
+    return coding, data, dict(client_options), outw, outh, outstride, bpp
+
+
+caches = {}
+caches_lock = Lock()
+
+def get_shared_encode_cache(wid:int):
+    """
+        Returns the cache for this window id,
+        the caller must call `release_shared_encode_cache` when it no longer uses it.
+    """
+    if not hash_tiles:
+        return None
+    with caches_lock:
+        cache = caches.get(wid)
+        if cache is None:
+            cache = caches[wid] = SharedEncodeCache(wid)
+        cache.users += 1
+        return cache
+
+def release_shared_encode_cache(wid:int):
+    with caches_lock:
+        cache = caches.get(wid)
+        if not cache:
+            return
+        cache.users -= 1
+        if cache.users<=0:
+            del caches[wid]
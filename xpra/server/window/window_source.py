@@ -12,19 +12,23 @@ import threading
 from math import sqrt, ceil
 from collections import deque
 from time import monotonic
+from types import MethodType
 
 from xpra.os_util import bytestostr, POSIX, OSX, DummyContextManager
-from xpra.util import envint, envbool, csv, typedict, first_time, decode_str, repr_ellipsized
+from xpra.util import envint, envbool, csv, typedict, first_time, decode_str, repr_ellipsized, roundup
 from xpra.common import MAX_WINDOW_SIZE, WINDOW_DECODE_SKIPPED, WINDOW_DECODE_ERROR, WINDOW_NOT_FOUND
 from xpra.server.window.windowicon_source import WindowIconSource
 from xpra.server.window.window_stats import WindowPerformanceStatistics
 from xpra.server.window.batch_delay_calculator import calculate_batch_delay, get_target_speed, get_target_quality
+from xpra.server.window.shared_encode import get_shared_encode_cache, release_shared_encode_cache
+from xpra.server.window.content_classifier import ContentClassifier
 from xpra.server.cystats import time_weighted_average, logp #@UnresolvedImport
 from xpra.rectangle import rectangle, add_rectangle, remove_rectangle, merge_all   #@UnresolvedImport
 from xpra.simple_stats import get_list_stats
 from xpra.codecs.rgb_transform import rgb_reformat
 from xpra.codecs.loader import get_codec
 from xpra.codecs.codec_constants import preforder, LOSSY_PIXEL_FORMATS
+from xpra.codecs.image_wrapper import ImageWrapper, PlanarFormat
 from xpra.net.compression import use
 from xpra.log import Logger
 
@@ -82,10 +86,20 @@ SEND_TIMESTAMPS = envbool("XPRA_SEND_TIMESTAMPS", False)
 DAMAGE_STATISTICS = envbool("XPRA_DAMAGE_STATISTICS", False)
 
 SCROLL_ALL = envbool("XPRA_SCROLL_ALL", True)
+TILE_CACHE = envbool("XPRA_TILE_CACHE", True)
+TILE_CACHE_TILE_SIZE = max(16, envint("XPRA_TILE_CACHE_TILE_SIZE", 64))
 FORCE_PILLOW = envbool("XPRA_FORCE_PILLOW", False)
 HARDCODED_ENCODING = os.environ.get("XPRA_HARDCODED_ENCODING")
 
 INFINITY = float("inf")
+
+hash_tiles = None
+if TILE_CACHE:
+    try:
+        from xpra.buffers.xxh import hash_tiles  #@UnresolvedImport
+    except ImportError as e:
+        log("no tile checksums: %s", e)
+
 def get_env_encodings(etype, valid_options=()):
     v = os.environ.get(f"XPRA_{etype}_ENCODINGS")
     encodings = valid_options
@@ -195,6 +209,7 @@ class WindowSource(WindowIconSource):
         self.queue_packet = queue_packet                #callback to add a network packet to the outgoing queue
         self.wid = wid
         self.window = window                            #only to be used from the UI thread!
+        self.shared_encode = get_shared_encode_cache(wid)   #shared with other clients showing the same window
         self.global_statistics = statistics             #shared/global statistics from ClientConnection
         self.statistics = WindowPerformanceStatistics()
         self.av_sync = av_sync                          #flag: enabled or not?
@@ -252,7 +267,10 @@ class WindowSource(WindowIconSource):
         self.iconic : bool = False
         self.window_signal_handlers = []
         #watch for changes to properties that are used to derive the content-type:
-        self.content_type : str = window.get("content-type", "")
+        self.window_content_type : str = window.get("content-type", "")
+        self.content_type : str = self.window_content_type
+        #used when the window does not specify a content-type:
+        self.content_classifier = ContentClassifier()
         if "content-type" in window.get_dynamic_property_names():
             sid = window.connect("notify::content-type", self.content_type_changed)
             self.window_signal_handlers.append(sid)
@@ -390,12 +408,13 @@ class WindowSource(WindowIconSource):
         pillow = add("enc_pillow")
         if self._mmap_size>0:
             try:
-                from xpra.net.mmap_pipe import mmap_write
+                from xpra.net.mmap_pipe import mmap_write, mmap_allocate
             except ImportError:
                 if first_time("mmap_write missing"):
                     log.warn("Warning: cannot use mmap, no write method support")
             else:
                 self.mmap_write = mmap_write
+                self.mmap_allocate = mmap_allocate
                 self.insert_encoder("mmap", "mmap", self.mmap_encode)
         if not FORCE_PILLOW or not pillow:
             #prefer these native encoders over the Pillow version:
@@ -431,6 +450,7 @@ class WindowSource(WindowIconSource):
         self.strict = STRICT_MODE
         self.decoder_speed = typedict()
         self.mmap_write = None
+        self.mmap_allocate = None
         #
         self.decode_error_refresh_timer : int = 0
         self.may_send_timer : int = 0
@@ -477,6 +497,10 @@ class WindowSource(WindowIconSource):
         self._fixed_max_speed = MAX_SPEED
         #
         self._damage_delayed = None
+        #checksums of the tiles the client already has:
+        self.tile_hashes = {}
+        self.tile_pixel_format = ""
+        self.tiles_unchanged = 0
         self._sequence = 1
         self._damage_cancelled = INFINITY
         self._damage_packet_sequence = 1
@@ -488,6 +512,9 @@ class WindowSource(WindowIconSource):
         self.init_vars()
         self._mmap_size = 0
         self.batch_config.cleanup()
+        if self.shared_encode:
+            self.shared_encode = None
+            release_shared_encode_cache(self.wid)
         #we can only clear the encoders after clearing the whole encoding queue:
         #(because mmap cannot be cancelled once queued for encoding)
         self.call_in_encode_thread(False, self.encode_ended)
@@ -557,6 +584,10 @@ class WindowSource(WindowIconSource):
         #remove large default dict:
         info.update({
                 "idle"                  : self.is_idle,
+                "tile-cache"            : {
+                    "tiles"         : len(self.tile_hashes),
+                    "unchanged"     : self.tiles_unchanged,
+                    },
                 "dimensions"            : self.window_dimensions,
                 "suspended"             : self.suspended or False,
                 "bandwidth-limit"       : self.bandwidth_limit,
@@ -573,6 +604,7 @@ class WindowSource(WindowIconSource):
                 "supports-transparency" : self.supports_transparency,
                 "property"              : self.get_property_info(),
                 "content-type"          : self.content_type or "",
+                "content-classifier"    : self.content_classifier.get_info(),
                 "batch"                 : self.batch_config.get_info(),
                 "soft-timeout"          : {
                                            "expired"        : self.soft_expired,
@@ -589,6 +621,9 @@ class WindowSource(WindowIconSource):
         ma = self.mapped_at
         if ma:
             info["mapped-at"] = ma
+        se = self.shared_encode
+        if se:
+            info["shared-encode"] = se.get_info()
         crs = self.client_render_size
         if crs:
             info["render-size"] = crs
@@ -691,6 +726,7 @@ class WindowSource(WindowIconSource):
 
     def refresh(self, options=None):
         self.ui_thread_check()
+        self.invalidate_tiles()
         w, h = self.window.get_dimensions()
         self.damage(0, 0, w, h, options)
 
@@ -723,7 +759,8 @@ class WindowSource(WindowIconSource):
         return True
 
     def content_type_changed(self, window, *args):
-        self.content_type = window.get("content-type", "")
+        self.window_content_type = window.get("content-type", "")
+        self.content_type = self.window_content_type or self.content_classifier.content_type
         log("content_type_changed(%s, %s) content-type=%s", window, args, self.content_type)
         self.reconfigure(True)
         return True
@@ -1108,8 +1145,13 @@ class WindowSource(WindowIconSource):
         webp = "webp" in co and 16383>=w>=2 and 16383>=h>=2 and not grayscale
         avif = "avif" in co
         lossy = quality<100
+        if lossy and not self.window_content_type and self.content_classifier.content_type=="text" \
+            and "png" in co and not grayscale:
+            #classified as text, which looks awful with lossy encodings,
+            #(windows that declare their own content-type keep the usual quality driven selection)
+            return "png"
         if depth in (24, 32) and (jpeg or jpega or webp or avif):
-            if webp and (not lossy or w*h<=WEBP_EFFICIENCY_CUTOFF):
+            if webp and (not lossy or w*h<=WEBP_EFFICIENCY_CUTOFF or self.content_type=="picture"):
                 return "webp"
             if lossy or not TRUE_LOSSLESS:
                 if jpeg and not alpha:
@@ -1175,6 +1217,8 @@ class WindowSource(WindowIconSource):
         #if a region was delayed, we can just drop it now:
         self.refresh_regions = []
         self._damage_delayed = None
+        #the client may not receive the updates we have recorded:
+        self.invalidate_tiles()
         #make sure we don't account for those as they will get dropped
         #(generally before encoding - only one may still get encoded):
         for sequence in tuple(self.statistics.encoding_pending.keys()):
@@ -2090,6 +2134,115 @@ class WindowSource(WindowIconSource):
         self.pixel_format = pixel_format
         return image
 
+    def invalidate_tiles(self, x=0, y=0, w=0, h=0):
+        """
+            Forget the checksums of the tiles intersecting this area,
+            or of all the tiles if no area is specified.
+        """
+        if not self.tile_hashes:
+            return
+        if w<=0 or h<=0:
+            self.tile_hashes = {}
+            return
+        T = TILE_CACHE_TILE_SIZE
+        for row in range(y//T, (y+h-1)//T+1):
+            for col in range(x//T, (x+w-1)//T+1):
+                self.tile_hashes.pop((col, row), None)
+
+    def drop_unchanged_tiles(self, image, x, y, coding, options, flush=None):
+        """
+            Compares the checksums of the tiles in this image
+            with the ones we have already sent to the client,
+            and returns the image cropped to the tiles that have changed,
+            or None if there is nothing left to send.
+            Only whole tiles are cached, the ones that are only partially
+            covered by the image are always sent.
+            This runs in the UI thread.
+        """
+        w = image.get_width()
+        h = image.get_height()
+        if not hash_tiles or coding not in self.picture_encodings or options.get("auto_refresh") or \
+            image.get_planes()!=PlanarFormat.PACKED:
+            #the client will get these pixels without us tracking them:
+            self.invalidate_tiles(x, y, w, h)
+            return image
+        pixel_format = image.get_pixel_format()
+        if pixel_format!=self.tile_pixel_format:
+            self.tile_hashes = {}
+            self.tile_pixel_format = pixel_format
+        T = TILE_CACHE_TILE_SIZE
+        ww, wh = self.window_dimensions
+        #the first tile fully contained in the image:
+        acol = (x+T-1)//T
+        arow = (y+T-1)//T
+        ax = acol*T
+        ay = arow*T
+        hashes = ()
+        hcols = 0
+        if ax<x+w and ay<y+h:
+            bpp = image.get_bytesperpixel()
+            rowstride = image.get_rowstride()
+            pixels = memoryview(image.get_pixels())[(ay-y)*rowstride+(ax-x)*bpp:]
+            hashes = hash_tiles(pixels, x+w-ax, y+h-ay, rowstride, bpp, T)
+            hcols = (x+w-ax+T-1)//T
+        tile_hashes = self.tile_hashes
+        unchanged = 0
+        changed = []
+        for row in range(y//T, (y+h-1)//T+1):
+            ty = row*T
+            th = min(T, wh-ty)
+            for col in range(x//T, (x+w-1)//T+1):
+                tx = col*T
+                tw = min(T, ww-tx)
+                if tx<x or ty<y or tx+tw>x+w or ty+th>y+h or tw<=0 or th<=0:
+                    #partial tile, send it and forget the old value:
+                    tile_hashes.pop((col, row), None)
+                    changed.append((col, row))
+                    continue
+                value = tw, th, hashes[(row-arow)*hcols+col-acol]
+                if tile_hashes.get((col, row))==value:
+                    unchanged += 1
+                    continue
+                tile_hashes[(col, row)] = value
+                changed.append((col, row))
+        if not unchanged:
+            return image
+        self.tiles_unchanged += unchanged
+        if not changed:
+            if flush!=0:
+                log("drop_unchanged_tiles: all %i tiles are unchanged in %s", unchanged, (x, y, w, h))
+                self.free_image_wrapper(image)
+                return None
+            #this is the last packet of a sequence, the client needs to see it:
+            changed.append((x//T, y//T))
+        #crop to the changed tiles:
+        x1 = max(x, min(col for col, _ in changed)*T)
+        y1 = max(y, min(row for _, row in changed)*T)
+        x2 = min(x+w, (max(col for col, _ in changed)+1)*T)
+        y2 = min(y+h, (max(row for _, row in changed)+1)*T)
+        if x1==x and y1==y and x2==x+w and y2==y+h:
+            return image
+        log("drop_unchanged_tiles: %i unchanged tiles, cropping %s to %s",
+            unchanged, (x, y, w, h), (x1, y1, x2-x1, y2-y1))
+        #crop the pixels we have just hashed, so the client gets exactly what 'tile_hashes' records,
+        #and copy them since some image wrappers share their pixel buffer with their sub-images:
+        bpp = image.get_bytesperpixel()
+        rowstride = image.get_rowstride()
+        pixels = memoryview(image.get_pixels())
+        stride = (x2-x1)*bpp
+        pos = (y1-y)*rowstride+(x1-x)*bpp
+        lines = []
+        for _ in range(y2-y1):
+            lines.append(pixels[pos:pos+stride])
+            pos += rowstride
+        sub = ImageWrapper(image.get_x()+x1-x, image.get_y()+y1-y, x2-x1, y2-y1, b"".join(lines),
+                           image.get_pixel_format(), image.get_depth(), stride, bpp,
+                           thread_safe=True, palette=image.get_palette())
+        sub.set_target_x(image.get_target_x()+x1-x)
+        sub.set_target_y(image.get_target_y()+y1-y)
+        self.free_image_wrapper(image)
+        return sub
+
     def process_damage_region(self, damage_time, x, y, w, h, coding, options, flush=None):
         """
             Called by 'damage' or 'send_delayed_regions' to process a damage region.
@@ -2108,6 +2261,15 @@ class WindowSource(WindowIconSource):
         if image is None:
             return False
         log("get_damage_image%s took %ims", (x, y, w, h), 1000*(monotonic()-rgb_request_time))
+        image = self.drop_unchanged_tiles(image, x, y, coding, options, flush)
+        if image is None:
+            return False
+        if not self.window_content_type and self.content_classifier.process_image(image):
+            self.content_type = self.content_classifier.content_type
+            log("content-type for window %i classified as %r", self.wid, self.content_type)
+            self.idle_add(self.reconfigure, True)
+        w = image.get_width()
+        h = image.get_height()
         sequence = self._sequence
 
         if self.send_window_size:
@@ -2151,6 +2313,7 @@ class WindowSource(WindowIconSource):
                 exc_info=True)
             if not self.is_cancelled(sequence):
                 log.error("Error: failed to create data packet", exc_info=True)
+            self.idle_add(self.invalidate_tiles)
             packet = None
         finally:
             self.free_image_wrapper(image)
@@ -2417,7 +2580,7 @@ class WindowSource(WindowIconSource):
             ack_pending[3] = now
             ack_pending[4] = bytecount
             if process_damage_time>0:
-                statistics.damage_out_latency.append((now, width*height, actual_batch_delay, now-process_damage_time))
+                statistics.record_damage_out_latency(now, width*height, actual_batch_delay, now-process_damage_time)
             elapsed_ms = int((now-ack_pending[0])*1000)
             #only record slow send as congestion events
             #if the bandwidth limit is already below the threshold:
@@ -2432,7 +2595,7 @@ class WindowSource(WindowIconSource):
         if process_damage_time>0:
             now = monotonic()
             damage_in_latency = now-process_damage_time
-            statistics.damage_in_latency.append((now, width*height, actual_batch_delay, damage_in_latency))
+            statistics.record_damage_in_latency(now, width*height, actual_batch_delay, damage_in_latency)
         #log.info("queuing %s packet with fail_cb=%s", coding, fail_cb)
         self.statistics.last_packet_time = monotonic()
         self.queue_packet(packet, self.wid, width*height, start_send, damage_packet_sent,
@@ -2518,7 +2681,7 @@ class WindowSource(WindowIconSource):
         statslog("packet decoding sequence %s for window %s: %sx%s took %.1fms",
                       damage_packet_sequence, self.wid, width, height, decode_time/1000.0)
         if decode_time>0:
-            self.statistics.client_decode_time.append((monotonic(), width*height, decode_time))
+            self.statistics.record_client_decode_time(monotonic(), width*height, decode_time)
         elif decode_time==WINDOW_DECODE_SKIPPED:
             pass
         elif decode_time==WINDOW_NOT_FOUND:
@@ -2662,8 +2825,14 @@ class WindowSource(WindowIconSource):
             if self.is_cancelled(sequence):
                 return nodata("cancelled")
             raise Exception(f"BUG: no encoder found for {coding!r} with options={options}")
-        ret = encoder(coding, image, options)
+        shared_encode = self.shared_encode
+        if shared_encode and not isinstance(encoder, MethodType):
+            #stateless picture encoder, the result may be shared with other clients:
+            ret = shared_encode.encode(encoder, coding, image, options)
+        else:
+            ret = encoder(coding, image, options)
         if ret is None:
+            self.idle_add(self.invalidate_tiles)
             return nodata("encoder %s returned None for %s",
                           get_encoder_type(encoder), (coding, image, options))
 
@@ -2751,16 +2920,32 @@ class WindowSource(WindowIconSource):
         data = image.get_pixels()
         if not data:
             raise RuntimeError(f"failed to get pixels from {image}")
-        mmap_data, mmap_free_size = self.mmap_write(self._mmap, self._mmap_size, data)
-        #elapsed = monotonic()-start+0.000000001 #make sure never zero!
-        #log("%s MBytes/s - %s bytes written to mmap in %.1f ms", int(len(data)/elapsed/1024/1024),
-        #    len(data), 1000*elapsed)
+        width = image.get_width()
+        height = image.get_height()
+        rowstride = image.get_rowstride()
+        #copy the pixels straight into the mmap area,
+        #dropping any padding at the end of each row:
+        newstride = min(rowstride, roundup(width*len(pf), 4))
+        size = newstride*height
+        offset, buf, mmap_free_size = self.mmap_allocate(self._mmap, self._mmap_size, size)
+        if buf is not None:
+            from xpra.net.mmap_pipe import restride_into  # pylint: disable=import-outside-toplevel
+            try:
+                restride_into(buf, data, rowstride, newstride, height)
+            finally:
+                buf.release()
+            mmap_data = [(offset, size)]
+            rowstride = newstride
+        else:
+            #no contiguous space, the data may have to wrap around:
+            mmap_data, mmap_free_size = self.mmap_write(self._mmap, self._mmap_size, data)
+            size = len(data)
         if mmap_data is None:
             return None
-        self.global_statistics.mmap_bytes_sent += len(data)
+        self.global_statistics.mmap_bytes_sent += size
         self.global_statistics.mmap_free_size = mmap_free_size
         #the data we send is the index within the mmap area:
         return (
             "mmap", mmap_data, {"rgb_format" : pf},
-            image.get_width(), image.get_height(), image.get_rowstride(), len(pf)*8,
+            width, height, rowstride, len(pf)*8,
             )
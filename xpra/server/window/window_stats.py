@@ -13,9 +13,7 @@ from collections import deque
 from xpra.simple_stats import get_list_stats, get_weighted_list_stats
 from xpra.util import engs, csv, envint
 from xpra.server.cystats import (logp,      #@UnresolvedImport
-    calculate_time_weighted_average,        #@UnresolvedImport
-    calculate_size_weighted_average,        #@UnresolvedImport
-    calculate_timesize_weighted_average,    #@UnresolvedImport
+    TimeWeightedAverage, SizeWeightedAverage,   #@UnresolvedImport
     calculate_for_average,                  #@UnresolvedImport
     )
 
@@ -52,6 +50,11 @@ class WindowPerformanceStatistics:
                                                             #last NRECS: (sent_time, no of pixels, actual batch delay, damage_latency)
         self.damage_out_latency = deque(maxlen=NRECS)       #records how long it took for a damage request to be processed
                                                             #last NRECS: (processed_time, no of pixels, actual batch delay, damage_latency)
+        #incremental averages of the records above, updated as records are added:
+        self.damage_in_average = TimeWeightedAverage()
+        self.damage_out_average = TimeWeightedAverage()
+        self.decode_speed_average = SizeWeightedAverage()
+        self.decode_latency_average = SizeWeightedAverage()
         self.damage_ack_pending = {}                        #records when damage packets are sent
                                                             #so we can calculate the "client_latency" when the client sends
                                                             #the corresponding ack ("damage-sequence" packet - see "client_ack_damage")
@@ -83,23 +86,30 @@ class WindowPerformanceStatistics:
         self.damage_ack_pending = {}
 
 
+    def record_damage_in_latency(self, event_time, pixels : int, batch_delay, latency):
+        self.damage_in_latency.append((event_time, pixels, batch_delay, latency))
+        self.damage_in_average.add(event_time, latency)
+
+    def record_damage_out_latency(self, event_time, pixels : int, batch_delay, latency):
+        self.damage_out_latency.append((event_time, pixels, batch_delay, latency))
+        self.damage_out_average.add(event_time, latency)
+
+    def record_client_decode_time(self, event_time, pixels : int, decode_time : int):
+        self.client_decode_time.append((event_time, pixels, decode_time))
+        #the elapsed time recorded is in microseconds:
+        self.decode_speed_average.add(event_time, pixels, int(pixels*1000*1000/decode_time))
+        self.decode_latency_average.add(event_time, pixels, 1.0/decode_time)
+
     def update_averages(self):
         #damage "in" latency: (the time it takes for damage requests to be processed only)
-        dil = tuple(self.damage_in_latency)
-        if dil:
-            data = tuple((when, latency) for when, _, _, latency in dil)
-            self.avg_damage_in_latency, self.recent_damage_in_latency =  calculate_time_weighted_average(data)
+        if self.damage_in_average.count:
+            self.avg_damage_in_latency, self.recent_damage_in_latency = self.damage_in_average.get()
         #damage "out" latency: (the time it takes for damage requests to be processed and sent out)
-        dol = tuple(self.damage_out_latency)
-        if dol:
-            data = tuple((when, latency) for when, _, _, latency in dol)
-            self.avg_damage_out_latency, self.recent_damage_out_latency = calculate_time_weighted_average(data)
+        if self.damage_out_average.count:
+            self.avg_damage_out_latency, self.recent_damage_out_latency = self.damage_out_average.get()
         #client decode speed:
-        cdt = tuple(self.client_decode_time)
-        if cdt:
-            #the elapsed time recorded is in microseconds:
-            decode_speed = tuple((event_time, size, int(size*1000*1000/elapsed)) for event_time, size, elapsed in cdt)
-            r = calculate_size_weighted_average(decode_speed)
+        if self.client_decode_time:
+            r = self.decode_speed_average.get()
             self.avg_decode_speed = int(r[0])
             self.recent_decode_speed = int(r[1])
         #network send speed:
@@ -222,9 +232,8 @@ class WindowPerformanceStatistics:
             Then we add the average decoding latency.
             """
         decoding_latency = 0.010
-        cdt = tuple(self.client_decode_time)
-        if cdt:
-            decoding_latency = calculate_timesize_weighted_average(cdt)[0]/1000.0
+        if self.client_decode_time:
+            decoding_latency = self.decode_latency_average.get()[0]/1000.0
         min_latency = max(abs_min, min_client_latency or abs_min)*1.2
         avg_latency = max(min_latency, avg_client_latency or abs_min)
         max_latency = min(avg_latency, 4.0*min_latency+0.100)
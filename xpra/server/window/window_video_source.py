@@ -95,6 +95,9 @@ B_FRAMES = envbool("XPRA_B_FRAMES", True)
 VIDEO_SKIP_EDGE = envbool("XPRA_VIDEO_SKIP_EDGE", False)
 SCROLL_MIN_PERCENT = max(1, min(100, envint("XPRA_SCROLL_MIN_PERCENT", 30)))
 MIN_SCROLL_IMAGE_SIZE = envint("XPRA_MIN_SCROLL_IMAGE_SIZE", 128)
+SCROLL_MOTION = envbool("XPRA_SCROLL_MOTION", True)
+SCROLL_MOTION_BLOCK_SIZE = max(8, envint("XPRA_SCROLL_MOTION_BLOCK_SIZE", 16))
+SCROLL_MOTION_MAX_PIXELS = envint("XPRA_SCROLL_MOTION_MAX_PIXELS", 1920*1080)
 
 SAVE_VIDEO_PATH = os.environ.get("XPRA_SAVE_VIDEO_PATH", "")
 SAVE_VIDEO_STREAMS = envbool("XPRA_SAVE_VIDEO_STREAMS", False)
@@ -903,6 +906,9 @@ class WindowVideoSource(WindowSource):
         if image is None:
             return False
         log("get_damage_image%s took %ims", (x, y, w, h), 1000*(monotonic()-rgb_request_time))
+        image = self.drop_unchanged_tiles(image, x, y, coding, options, flush)
+        if image is None:
+            return False
         sequence = self._sequence
 
         w = image.get_width()
@@ -1967,7 +1973,7 @@ class WindowVideoSource(WindowSource):
             start = monotonic()
             if not scroll_data:
                 from xpra.server.window.motion import ScrollData #@UnresolvedImport
-                scroll_data = ScrollData()
+                scroll_data = ScrollData(block_size=SCROLL_MOTION_BLOCK_SIZE if SCROLL_MOTION else 0)
                 self.scroll_data = scroll_data
                 scrolllog("new scroll data: %s", scroll_data)
             if not image.is_thread_safe():
@@ -1997,6 +2003,17 @@ class WindowVideoSource(WindowSource):
                 match_pct = int(100*count/h)
                 scrolllog("best scroll guess took %ims, matches %i%% of %i lines: %s",
                           (end-start)*1000, match_pct, h, scroll)
+                if match_pct<min_percent and SCROLL_MOTION and bpp==4 and w*h<=SCROLL_MOTION_MAX_PIXELS:
+                    #try to find blocks that have moved in any direction:
+                    motion = scroll_data.get_motion_values(pixels, stride, max_distance)
+                    scrolllog("motion detection took %ims, matches %s%% of %ix%i",
+                              (monotonic()-end)*1000, motion[2] if motion else 0, w, h)
+                    if motion and motion[0] and motion[2]>=min_percent:
+                        zones = len(motion[1])+sum(len(rects) for rects in motion[0].values())
+                        if zones<max_zones*2:
+                            self.encode_motion(image, options, motion)
+                            return True
+                        scrolllog("too many motion zones: %i", zones)
             else:
                 max_zones = 50
                 match_pct = min_percent
@@ -2042,7 +2059,6 @@ class WindowVideoSource(WindowSource):
                     raw_scroll = {}
                     non_scroll = {0 : h}
         scrolllog(" will send scroll data=%s, non-scroll=%s", raw_scroll, non_scroll)
-        flush = len(non_scroll)
         #convert to a screen rectangle list for the client:
         scrolls = []
         for scroll, line_defs in raw_scroll.items():
@@ -2056,6 +2072,37 @@ class WindowVideoSource(WindowSource):
                                        f"by {scroll} lines from {y}+{line} (window height is {wh})")
                 scrolls.append((x, y+line, w, count, 0, scroll))
         del raw_scroll
+        rects = tuple((0, sy, w, sh) for sy, sh in non_scroll.items())
+        self.send_scrolls(image, options, scrolls, rects, match_pct, start)
+
+    def encode_motion(self, image, options, motion):
+        """
+            Sends the blocks that have moved as 'scroll' areas,
+            and encodes the rectangles that could not be matched.
+        """
+        start = monotonic()
+        options.pop("av-sync", None)
+        copies, dirty, match_pct = motion
+        x = image.get_target_x()
+        y = image.get_target_y()
+        scrolllog("encode_motion(%s, %s, ..) copies=%s, dirty=%s, match=%i%%",
+                  image, options, copies, dirty, match_pct)
+        scrolls = []
+        for (dx, dy), rects in copies.items():
+            for sx, sy, sw, sh in rects:
+                scrolls.append((x+sx, y+sy, sw, sh, dx, dy))
+        self.send_scrolls(image, options, scrolls, dirty, match_pct, start)
+
+    def send_scrolls(self, image, options, scrolls, rects, match_pct, start):
+        """
+            Sends the scroll areas first,
+            then the rectangles of the image that still need to be repainted.
+        """
+        x = image.get_target_x()
+        y = image.get_target_y()
+        w = image.get_width()
+        h = image.get_height()
+        flush = len(rects)
         #send the scrolls if we have any
         #(zero change scrolls have been removed - so maybe there are none)
         if scrolls:
@@ -2073,7 +2120,7 @@ class WindowVideoSource(WindowSource):
                  self._damage_packet_sequence, client_options, options)
         del scrolls
         #send the rest as rectangles:
-        if non_scroll:
+        if rects:
             #boost quality a bit, because lossless saves refreshing,
             #more so if we have a high match percentage (less to send):
             if self._fixed_quality<=0:
@@ -2082,12 +2129,12 @@ class WindowVideoSource(WindowSource):
                 options["quality"] = quality
             nsstart = monotonic()
             client_options = options.copy()
-            for sy, sh in non_scroll.items():
+            for sx, sy, sw, sh in rects:
                 substart = monotonic()
-                sub = image.get_sub_image(0, sy, w, sh)
-                encoding = self.get_best_nonvideo_encoding(w, sh, options)
+                sub = image.get_sub_image(sx, sy, sw, sh)
+                encoding = self.get_best_nonvideo_encoding(sw, sh, options)
                 if not encoding:
-                    raise RuntimeError(f"no nonvideo encoding found for {w}x{sh} screen update")
+                    raise RuntimeError(f"no nonvideo encoding found for {sw}x{sh} screen update")
                 encode_fn = self._encoders[encoding]
                 ret = encode_fn(encoding, sub, options)
                 self.free_image_wrapper(sub)
@@ -2107,20 +2154,20 @@ class WindowVideoSource(WindowSource):
                 #    from PIL import Image
                 #    im = Image.frombuffer("RGBA", (w, sh), memoryview_to_bytes(sub.get_pixels()),
                 #                          "raw", "BGRA", sub.get_rowstride(), 1)
-                #    filename = "./scroll-%i-%i.png" % (self._sequence, len(non_scroll)-flush)
+                #    filename = "./scroll-%i-%i.png" % (self._sequence, len(rects)-flush)
                 #    im.save(filename, "png")
                 #    log.info("saved scroll y=%i h=%i to %s", sy, sh, filename)
                 packet = self.make_draw_packet(sub.get_target_x(), sub.get_target_y(), outw, outh,
                                                coding, data, outstride, client_options, options)
                 self.queue_damage_packet(packet, 0, 0, options)
-                psize = w*sh*4
+                psize = sw*sh*4
                 csize = len(data)
                 compresslog(COMPRESS_FMT,
-                     (monotonic()-substart)*1000.0, w, sh, x+0, y+sy, self.wid, coding,
+                     (monotonic()-substart)*1000.0, sw, sh, x+sx, y+sy, self.wid, coding,
                      100.0*csize/psize, ceil(psize/1024), ceil(csize/1024),
                      self._damage_packet_sequence, client_options, options)
             scrolllog("non-scroll encoding using %s (quality=%i, speed=%i) took %ims for %i rectangles",
-                      encoding, self._current_quality, self._current_speed, (monotonic()-nsstart)*1000, len(non_scroll))
+                      encoding, self._current_quality, self._current_speed, (monotonic()-nsstart)*1000, len(rects))
         else:
             scrolllog("no non_scroll areas")
         if flush!=0:
@@ -18,6 +18,7 @@ except ImportError:
 
 from xpra.os_util import load_binary_file, memoryview_to_bytes
 from xpra.net import compression
+from xpra.net.image_cache import image_key, server_image_cache
 from xpra.util import envbool, envint, csv
 from xpra.log import Logger
 
@@ -50,6 +51,8 @@ class WindowIconSource:
 
         self.window_icon_data = None
         self.send_window_icon_timer = 0
+        #mirror of the client's window icon cache, set by the client connection:
+        self.client_icon_cache = None
         self.theme_default_icons = icons_encoding_options.strtupleget("default.icons")
         self.window_icon_greedy = icons_encoding_options.boolget("greedy", False)
         self.window_icon_size = icons_encoding_options.intpair("size", (64, 64))
@@ -192,6 +195,42 @@ class WindowIconSource:
             w, h, pixel_format, len(pixel_data), self.wid)
         if pixel_format not in ("BGRA", "RGBA", "png"):
             raise RuntimeError(f"invalid window icon format {pixel_format}")
+        #the same icon is often used by many windows and clients:
+        cache_key = ("window-icon", image_key(pixel_data), w, h, pixel_format,
+                     self.window_icon_size, self.window_icon_max_size)
+        cached = server_image_cache.get(cache_key)
+        if cached and not SAVE_WINDOW_ICONS:
+            w, h, pixel_data, ref = cached
+        else:
+            icon = self.convert_window_icon(w, h, pixel_format, pixel_data)
+            if not icon:
+                return
+            w, h, pixel_data = icon
+            ref = image_key(pixel_data)
+            server_image_cache.set(cache_key, (w, h, pixel_data, ref))
+        wrapper = compression.Compressed("png", pixel_data)
+        ccache = self.client_icon_cache
+        if not ccache:
+            self.queue_window_icon(w, h, wrapper.datatype, wrapper)
+            return
+        #the client cache must see the packets in the same order as we update it:
+        with ccache.lock:
+            if ccache.get(ref):
+                self.queue_window_icon(w, h, "cache", ref)
+            else:
+                ccache.set(ref, True)
+                self.queue_window_icon(w, h, wrapper.datatype, wrapper)
+
+    def queue_window_icon(self, w : int, h : int, coding : str, data):
+        packet = ("window-icon", self.wid, w, h, coding, data)
+        log("queuing window icon update: %s", packet)
+        self.queue_packet(packet, wait_for_more=True)
+
+    def convert_window_icon(self, w : int, h : int, pixel_format : str, pixel_data):
+        """
+            Returns the icon dimensions and its png data,
+            scaled down to the size the client wants if needed.
+        """
         if pixel_format=="BGRA":
             #BGRA data is always unpremultiplied
             #(that's what we get from NetWMIcons)
@@ -212,7 +251,7 @@ class WindowIconSource:
         if must_scale or must_convert or SAVE_WINDOW_ICONS:
             if Image is None:
                 log("cannot scale or convert window icon without python-pillow")
-                return
+                return None
             #we're going to need a PIL Image:
             if pixel_format=="png":
                 image = Image.open(BytesIO(pixel_data))
@@ -242,10 +281,7 @@ class WindowIconSource:
             pixel_data = output.getvalue()
             output.close()
             w, h = image.size
-        wrapper = compression.Compressed("png", pixel_data)
-        packet = ("window-icon", self.wid, w, h, wrapper.datatype, wrapper)
-        log("queuing window icon update: %s", packet)
-        self.queue_packet(packet, wait_for_more=True)
+        return w, h, memoryview_to_bytes(pixel_data)
 
 
     def choose_icon(self, icons, max_w=1024, max_h=1024):
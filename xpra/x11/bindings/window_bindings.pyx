@@ -999,6 +999,22 @@ cdef class X11WindowBindingsInstance(X11CoreBindingsInstance):
         XFree(prop)
         return data
 
+    def XGetWindowProperties(self, requests):
+        """
+            Fetches many window properties in one call,
+            `requests` is a list of (xwindow, property, req_type, etype, buffer_size).
+            Returns a list with the data for each request,
+            or the PropertyError raised when fetching it.
+        """
+        self.context_check("XGetWindowProperties")
+        results = []
+        for xwindow, prop, req_type, etype, buffer_size in requests:
+            try:
+                results.append(self.XGetWindowProperty(xwindow, prop, req_type, etype, buffer_size))
+            except PropertyError as e:
+                results.append(e)
+        return results
+
 
     def GetWindowPropertyType(self, Window xwindow, property, incr=False):
         #as above, but for any property type
@@ -133,16 +133,19 @@ def _etypestr(etype):
         return f"array of {scalar_type}"
     return str(etype)
 
-def raw_prop_get(target, key, etype, ignore_errors=False, raise_xerrors=False):
-    def etypestr():
-        return _etypestr(etype)
+def _prop_request_type(etype):
+    #returns the X11 type to request and the buffer size to use:
     if isinstance(etype, (list, tuple)):
         scalar_type = etype[0]
     else:
         scalar_type = etype
-    atom = PROP_TYPES[scalar_type][1]
+    return PROP_TYPES[scalar_type][1], PROP_SIZES.get(scalar_type, 64*1024)
+
+def raw_prop_get(target, key, etype, ignore_errors=False, raise_xerrors=False):
+    def etypestr():
+        return _etypestr(etype)
+    atom, buffer_size = _prop_request_type(etype)
     try:
-        buffer_size = PROP_SIZES.get(scalar_type, 64*1024)
         with XSyncContext():
             data = X11WindowBindings().XGetWindowProperty(target.get_xid(), key, atom, etype, buffer_size)
         if data is None:
@@ -163,6 +166,34 @@ def raw_prop_get(target, key, etype, ignore_errors=False, raise_xerrors=False):
         return None
     return data
 
+def prop_get_many(requests, ignore_errors=False):
+    """
+        Fetches many properties using a single X11 error context,
+        `requests` is a list of (target, key, etype).
+        Returns the decoded values in the same order,
+        or None if the X11 context failed. (ie: a window is gone)
+    """
+    fetch = []
+    for target, key, etype in requests:
+        atom, buffer_size = _prop_request_type(etype)
+        fetch.append((target.get_xid(), key, atom, etype, buffer_size))
+    try:
+        with XSyncContext():
+            results = X11WindowBindings().XGetWindowProperties(fetch)
+    except XError:
+        log("prop_get_many%s", (requests, ignore_errors), exc_info=True)
+        return None
+    values = []
+    for (target, key, etype), data in zip(requests, results):
+        if isinstance(data, PropertyError):
+            log("prop_get_many: %s (%s) on %s: %s", key, _etypestr(etype), target, data)
+            data = None
+        if data is None:
+            values.append(None)
+        else:
+            values.append(do_prop_decode(key, etype, data, ignore_errors))
+    return values
+
 def do_prop_decode(key, etype, data, ignore_errors=False):
     try:
         with XSyncContext():
@@ -206,6 +206,21 @@ class BaseWindowModel(CoreX11WindowModel):
                               "_XPRA_SPEED",
                               "_XPRA_ENCODING",
                               ]
+    _initial_x11_property_types = CoreX11WindowModel._initial_x11_property_types + [
+                              ("_NET_WM_STATE", ["atom"]),
+                              ("WM_TRANSIENT_FOR", "window"),
+                              ("_NET_WM_WINDOW_TYPE", ["atom"]),
+                              ("_NET_WM_DESKTOP", "u32"),
+                              ("_NET_WM_FULLSCREEN_MONITORS", ["u32"]),
+                              ("_NET_WM_BYPASS_COMPOSITOR", "u32"),
+                              ("_NET_WM_STRUT_PARTIAL", "strut-partial"),
+                              ("_NET_WM_STRUT", "strut"),
+                              ("_NET_WM_WINDOW_OPACITY", "u32"),
+                              ("_XPRA_CONTENT_TYPE", "latin1"),
+                              ("_XPRA_QUALITY", "u32"),
+                              ("_XPRA_SPEED", "u32"),
+                              ("_XPRA_ENCODING", "latin1"),
+                              ]
     _DEFAULT_NET_WM_ALLOWED_ACTIONS = [f"_NET_WM_ACTION_{x}" for x in (
         "CLOSE", "MOVE", "RESIZE", "FULLSCREEN",
         "MINIMIZE", "SHADE", "STICK",
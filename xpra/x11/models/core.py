@@ -18,7 +18,7 @@ from xpra.x11.bindings.window_bindings import X11WindowBindings, constants, SHAP
 from xpra.x11.bindings.res_bindings import ResBindings #@UnresolvedImport
 from xpra.x11.models.model_stub import WindowModelStub
 from xpra.x11.gtk_x11.composite import CompositeHelper
-from xpra.x11.gtk_x11.prop import prop_get, prop_set, prop_type_get, PYTHON_TYPES
+from xpra.x11.gtk_x11.prop import prop_get, prop_get_many, prop_set, prop_type_get, PYTHON_TYPES
 from xpra.x11.gtk_x11.send_wm import send_wm_delete_window
 from xpra.x11.gtk_x11.gdk_bindings import add_event_receiver, remove_event_receiver
 from xpra.log import Logger
@@ -234,6 +234,14 @@ class CoreX11WindowModel(WindowModelStub):
                                "_NET_WM_OPAQUE_REGION",
                                "WM_COMMAND",
                                ]
+    #the properties read by the handlers of the initial properties,
+    #so we can fetch them all at once when we start managing the window:
+    _initial_x11_property_types = [("_NET_WM_PID", "u32"), ("WM_CLIENT_MACHINE", "latin1"),
+                                   ("_NET_WM_NAME", "utf8"), ("WM_NAME", "latin1"),
+                                   ("WM_WINDOW_ROLE", "latin1"),
+                                   ("_NET_WM_OPAQUE_REGION", ["u32"]),
+                                   ("WM_COMMAND", "latin1"),
+                                   ]
     _DEFAULT_NET_WM_ALLOWED_ACTIONS = []
     _MODELTYPE = "Core"
     _scrub_x11_properties       = [
@@ -250,6 +258,7 @@ class CoreX11WindowModel(WindowModelStub):
         self._composite = None
         self._damage_forward_handle = None
         self._setup_done = False
+        self._prefetched_properties = {}
         self._kill_count = 0
         self._internal_set_property("client-window", client_window)
 
@@ -283,7 +292,11 @@ class CoreX11WindowModel(WindowModelStub):
                 if geom is None:
                     raise Unmanageable(f"window {self.xid:x} disappeared already")
                 self._internal_set_property("geometry", geom[:4])
-                self._read_initial_X11_properties()
+                self._prefetch_initial_X11_properties()
+                try:
+                    self._read_initial_X11_properties()
+                finally:
+                    self._prefetched_properties = {}
         except XError as e:
             log("failed to manage %#x", self.xid, exc_info=True)
             raise Unmanageable(e) from e
@@ -390,6 +403,17 @@ class CoreX11WindowModel(WindowModelStub):
         can_focus = "WM_TAKE_FOCUS" in self.get_property("protocols")
         self._updateprop("can-focus", can_focus)
 
+    def _prefetch_initial_X11_properties(self):
+        """
+            Fetches all the properties that the initial property handlers will need
+            using a single X11 error context, rather than one for each `prop_get` call.
+        """
+        props = self._initial_x11_property_types
+        values = prop_get_many(tuple((self.client_window, key, ptype) for key, ptype in props), True)
+        metalog("prefetched initial X11 properties: %s", values)
+        if values:
+            self._prefetched_properties = dict((key, (ptype, value)) for (key, ptype), value in zip(props, values))
+
     def _read_initial_X11_properties(self):
         """ This is called within an XSync context,
             so that X11 calls can raise XErrors,
@@ -534,6 +558,9 @@ class CoreX11WindowModel(WindowModelStub):
         """
         if ignore_errors is None and (not self._setup_done or not self._managed):
             ignore_errors = True
+        prefetched = self._prefetched_properties.get(key)
+        if prefetched and prefetched[0]==ptype:
+            return prefetched[1]
         return prop_get(self.client_window, key, ptype, ignore_errors=bool(ignore_errors), raise_xerrors=raise_xerrors)
 
 
@@ -159,6 +159,10 @@ class WindowModel(BaseWindowModel):
                               "WM_HINTS", "WM_NORMAL_HINTS", "_MOTIF_WM_HINTS",
                               "WM_ICON_NAME", "_NET_WM_ICON_NAME", "_NET_WM_ICON",
                               "_NET_WM_STRUT", "_NET_WM_STRUT_PARTIAL"]
+    _initial_x11_property_types = BaseWindowModel._initial_x11_property_types + [
+                              ("_NET_WM_ICON_NAME", "utf8"), ("WM_ICON_NAME", "latin1"),
+                              ("_NET_WM_ICON", "icons"),
+                              ]
     _internal_property_names = BaseWindowModel._internal_property_names+["children"]
     _MODELTYPE = "Window"
 
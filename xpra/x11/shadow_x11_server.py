@@ -7,6 +7,8 @@
 
 import re
 from time import monotonic
+from gi.repository import GObject  # @UnresolvedImport
+
 from xpra.x11.x11_server_core import X11ServerCore
 from xpra.os_util import is_Wayland, get_loaded_kernel_modules
 from xpra.util import envbool, envint, merge_dicts, AdHocStruct, NotificationID
@@ -16,7 +18,13 @@ from xpra.server.shadow.gtk_root_window_model import GTKImageCapture
 from xpra.server.shadow.shadow_server_base import ShadowServerBase
 from xpra.server.server_uuid import del_mode, del_uuid
 from xpra.x11.gtk_x11.prop import prop_get
+from xpra.x11.gtk_x11.gdk_bindings import (
+    add_event_receiver,             #@UnresolvedImport
+    remove_event_receiver,          #@UnresolvedImport
+    )
 from xpra.x11.bindings.window_bindings import X11WindowBindings     #@UnresolvedImport
+from xpra.rectangle import rectangle, add_rectangle  #@UnresolvedImport
+from xpra.gtk_common.gobject_util import one_arg_signal
 from xpra.gtk_common.gtk_util import get_default_root_window, get_root_size
 from xpra.gtk_common.error import xsync, xlog
 from xpra.log import Logger
@@ -24,6 +32,7 @@ from xpra.log import Logger
 log = Logger("x11", "shadow")
 
 XSHM = envbool("XPRA_SHADOW_XSHM", True)
+XDAMAGE = envbool("XPRA_SHADOW_XDAMAGE", True)
 POLL_CURSOR = envint("XPRA_SHADOW_POLL_CURSOR", 20)
 NVFBC = envbool("XPRA_SHADOW_NVFBC", True)
 GSTREAMER = envbool("XPRA_SHADOW_GSTREAMER", False)
@@ -172,24 +181,116 @@ def window_matches(wspec, model_class):
         return models.values()
 
 
+class RootDamageHandler(GObject.GObject):
+    """
+        Keeps track of the areas of the root window
+        that have been damaged since the last capture.
+    """
+    __gsignals__ = {
+        "xpra-damage-event" : one_arg_signal,
+        }
+
+    def __init__(self, root):
+        super().__init__()
+        self.root = root
+        self.damage_handle = 0
+        self.rectangles = []
+        self.events = 0
+
+    def __repr__(self):
+        return f"RootDamageHandler({self.damage_handle:x})"
+
+    def setup(self):
+        X11Window = X11WindowBindings()
+        with xsync:
+            X11Window.ensure_XDamage_support()
+            self.damage_handle = X11Window.XDamageCreate(self.root.get_xid())
+        add_event_receiver(self.root, self)
+        self.damage_all()
+
+    def cleanup(self):
+        remove_event_receiver(self.root, self)
+        dh = self.damage_handle
+        if dh:
+            self.damage_handle = 0
+            with xlog:
+                X11WindowBindings().XDamageDestroy(dh)
+
+    def damage_all(self):
+        w, h = self.root.get_geometry()[2:4]
+        self.rectangles = [rectangle(0, 0, w, h)]
+
+    def do_xpra_damage_event(self, event):
+        self.events += 1
+        add_rectangle(self.rectangles, rectangle(event.x, event.y, event.width, event.height))
+
+    def take_damage(self):
+        rectangles = self.rectangles
+        if rectangles:
+            self.rectangles = []
+            #clear the damage region so that we get new events:
+            with xlog:
+                X11WindowBindings().XDamageSubtract(self.damage_handle)
+        return rectangles
+
+GObject.type_register(RootDamageHandler)
+
+
 class XImageCapture:
-    __slots__ = ("xshm", "xwindow", "XImage")
-    def __init__(self, xwindow):
-        log("XImageCapture(%#x)", xwindow)
+    __slots__ = ("xshm", "xwindow", "XImage", "damage", "skipped")
+    def __init__(self, xwindow, root=None):
+        log("XImageCapture(%#x, %s)", xwindow, root)
         self.xshm = None
         self.xwindow = xwindow
+        self.damage = None
+        self.skipped = 0
         from xpra.x11.bindings.ximage import XImageBindings     #@UnresolvedImport pylint: disable=import-outside-toplevel
         self.XImage = XImageBindings()
         assert XSHM and self.XImage.has_XShm(), "no XShm support"
         if is_Wayland():
             log.warn("Warning: shadow servers do not support Wayland")
             log.warn(" please switch to X11 for shadow support")
+        if XDAMAGE and root:
+            damage = RootDamageHandler(root)
+            try:
+                damage.setup()
+            except Exception as e:
+                log("XDamage setup failed", exc_info=True)
+                log.warn("Warning: unable to use XDamage for tracking screen updates")
+                log.warn(" %s", e)
+                damage.cleanup()
+            else:
+                self.damage = damage
 
     def __repr__(self):
         return f"XImageCapture({self.xwindow:x})"
 
+    def get_info(self) -> dict:
+        info = {
+            "type"      : "XShm",
+            "xdamage"   : bool(self.damage),
+            }
+        if self.damage:
+            info["damage-events"] = self.damage.events
+            info["skipped"] = self.skipped
+        return info
+
     def clean(self):
         self.close_xshm()
+        damage = self.damage
+        if damage:
+            self.damage = None
+            damage.cleanup()
+
+    def get_damage(self):
+        """
+            Returns the list of rectangles damaged since the last call,
+            or None if we are not tracking damage.
+        """
+        damage = self.damage
+        if not damage:
+            return None
+        return damage.take_damage()
 
     def close_xshm(self):
         xshm = self.xshm
@@ -208,6 +309,10 @@ class XImageCapture:
 
     def refresh(self):
         if self.xshm:
+            if self.damage and not self.damage.rectangles:
+                #nothing has changed, so the current image is still valid
+                self.skipped += 1
+                return False
             #discard to ensure we will call XShmGetImage next time around
             self.xshm.discard()
             return True
@@ -219,6 +324,9 @@ class XImageCapture:
         except Exception as e:
             self.xshm = None
             self._err(e, "xshm setup")
+        if self.damage:
+            #we have a new image, send all of it:
+            self.damage.damage_all()
         return True
 
     def get_image(self, x, y, width, height):
@@ -285,7 +393,7 @@ def setup_capture(window):
             log(f"not using X11 capture using bindings: {e}")
         else:
             if XImage.has_XShm():
-                capture = XImageCapture(window.get_xid())
+                capture = XImageCapture(window.get_xid(), window)
                 return capture
     return GTKImageCapture(window)
 
@@ -364,6 +472,22 @@ class ShadowX11Server(GTKShadowServerBase, X11ServerCore):
     def get_root_window_model_class(self):
         return X11ShadowModel
 
+    def refresh_windows(self):
+        damage = None
+        if self.capture and hasattr(self.capture, "get_damage"):
+            damage = self.capture.get_damage()
+        if damage is None:
+            super().refresh_windows()
+            return
+        log("refresh_windows() damage=%s", damage)
+        #only refresh the areas of each window that have been damaged:
+        for window in self._id_to_window.values():
+            x, y, w, h = window.get_geometry()
+            for r in damage:
+                area = r.intersection(x, y, w, h)
+                if area:
+                    self.refresh_window_area(window, area.x-x, area.y-y, area.width, area.height)
+
 
     def makeDynamicWindowModels(self):
         assert self.window_matches